@@ -0,0 +1,231 @@
+import heapq
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from shared_state import MemoryStore
+
+
+class AlertDispatcher:
+    """
+    Deduplicates, coalesces and asynchronously sends alerts.
+
+    Alerts are keyed by (patient, alert type), so an intruder alert never
+    suppresses a fall alert. The first alert for a key goes out immediately;
+    further alerts for the same key within `window` seconds are collected
+    (identical text counted once) and sent as a single digest when the window
+    ends. Hand-offs run on a small thread pool, so callers never wait on the
+    messaging API.
+
+    The per-key cooldown and pending alerts live in a shared_state store, so
+    under launcher.py one alert is sent per key and window, whichever worker
+    received it; the digest is sent by the first worker whose timer fires.
+
+    send_fn(message, alert_type) is called once per alert or digest; delivery,
+    retries and backoff belong to it (Notifier.notify), so a recipient that
+    already received an alert is never sent it again. "dispatched" counts
+    hand-offs it accepted, "failed" those it refused; delivery outcomes are
+    in the notifier's stats.
+    """
+
+    def __init__(self, send_fn, window=30.0, digest_max_lines=10, send_workers=4, store=None):
+        self.send_fn = send_fn
+        self.window = window
+        self.digest_max_lines = digest_max_lines
+        self.store = store if store is not None else MemoryStore()
+
+        self._keys = set()     # (patient, type) seen by this worker
+        self._flush_due = {}   # (patient, type) -> due time of the flush this worker scheduled
+        self._timers = []      # heap of (due, seq, kind, payload)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._pool = ThreadPoolExecutor(max_workers=send_workers, thread_name_prefix="alert-send")
+        self._started = time.time()
+
+        self.stats = {
+            "submitted": 0, "dispatched": 0, "failed": 0,
+            "deduplicated": 0, "coalesced": 0, "digests": 0,
+        }
+        self.suppressed_by_type = {}
+
+        self._thread = threading.Thread(target=self._run, name="alert-dispatcher", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _store_key(key):
+        return "alert:" + json.dumps(list(key))
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def submit(self, patient, alert_type, message):
+        """Queue an alert; never blocks on the network"""
+        key = (patient, alert_type)
+        store_key = self._store_key(key)
+        now = time.time()
+        decision = {}
+
+        def apply(values):
+            state = values[store_key] or {"last_sent": 0.0, "pending": [], "counts": {}}
+            if not state["pending"] and now - state["last_sent"] >= self.window:
+                # Quiet key: send right away and open a coalescing window
+                state["last_sent"] = now
+                decision["outcome"] = "sent"
+            elif message in state["counts"]:
+                state["counts"][message] += 1
+                decision["outcome"] = "deduplicated"
+            else:
+                state["pending"].append(message)
+                state["counts"][message] = 1
+                decision["outcome"] = "coalesced"
+            decision["flush_at"] = state["last_sent"] + self.window
+            return {store_key: state}
+
+        # Cooldown bookkeeping is not dashboard state: no version bump
+        self.store.transact([store_key], apply, bump_version=False)
+        outcome = decision["outcome"]
+
+        with self._cond:
+            self.stats["submitted"] += 1
+            self._keys.add(key)
+            if outcome == "sent":
+                self._schedule(now, "send", (message, alert_type))
+                return "sent"
+
+            self.stats[outcome] += 1
+            if self._flush_due.get(key) != decision["flush_at"]:
+                self._flush_due[key] = decision["flush_at"]
+                self._schedule(decision["flush_at"], "flush", key)
+            self.suppressed_by_type[alert_type] = self.suppressed_by_type.get(alert_type, 0) + 1
+            return "coalesced"
+
+    def get_stats(self):
+        elapsed = max(time.time() - self._started, 1e-9)
+        with self._cond:
+            keys = list(self._keys)
+            stats = dict(self.stats, suppressed_by_type=dict(self.suppressed_by_type))
+        pending = sum(len((self.store.get(self._store_key(k)) or {}).get("pending", [])) for k in keys)
+        return dict(
+            stats,
+            pending=pending,
+            dispatched_per_minute=round(stats["dispatched"] / elapsed * 60, 2),
+        )
+
+    def flush_all(self):
+        """Send every pending digest now (e.g. on shutdown)"""
+        with self._cond:
+            for key in self._keys:
+                self._schedule(0, "flush", key)
+
+    # ------------------------------------------------------------------
+    # Scheduler
+    # ------------------------------------------------------------------
+    def _schedule(self, due, kind, payload):
+        # Caller holds self._cond
+        heapq.heappush(self._timers, (due, next(self._seq), kind, payload))
+        self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._timers or self._timers[0][0] > time.time():
+                    timeout = self._timers[0][0] - time.time() if self._timers else None
+                    self._cond.wait(timeout)
+                due, _, kind, payload = heapq.heappop(self._timers)
+                if kind == "flush" and self._flush_due.get(payload) == due:
+                    del self._flush_due[payload]
+
+            # The store is read outside self._cond, so submit() never waits on it
+            if kind == "flush":
+                payload = self._build_digest(payload)
+                if payload is None:
+                    continue
+
+            self._pool.submit(self._dispatch, *payload)
+
+    def _build_digest(self, key):
+        store_key = self._store_key(key)
+        taken = {}
+
+        def apply(values):
+            state = values[store_key]
+            if not state or not state["pending"]:
+                return None  # Nothing pending, or another worker already sent the digest
+            taken.update(state)
+            return {store_key: {"last_sent": time.time(), "pending": [], "counts": {}}}
+
+        self.store.transact([store_key], apply, bump_version=False)
+        if not taken:
+            return None
+        with self._cond:
+            self.stats["digests"] += 1
+
+        pending, counts = taken["pending"], taken["counts"]
+        patient, alert_type = key
+        if len(pending) == 1 and counts[pending[0]] == 1:
+            return (pending[0], alert_type)
+
+        total = sum(counts.values())
+        lines = [f"🔔 {total} more '{alert_type}' alerts for {patient} in the last {int(self.window)}s:"]
+        for message in pending[:self.digest_max_lines]:
+            repeat = f" (x{counts[message]})" if counts[message] > 1 else ""
+            first_line = message.strip().splitlines()[0] if message.strip() else message
+            lines.append(f"• {first_line}{repeat}")
+        if len(pending) > self.digest_max_lines:
+            lines.append(f"… and {len(pending) - self.digest_max_lines} more")
+
+        # A digest carries the full text of its newest alert
+        lines.append("")
+        lines.append(pending[-1])
+        return ("\n".join(lines), alert_type)
+
+    def _dispatch(self, message, alert_type):
+        try:
+            ok = self.send_fn(message, alert_type)
+        except Exception as e:
+            print(f"❌ Alert dispatch error: {e}")
+            ok = False
+
+        with self._cond:
+            self.stats["dispatched" if ok else "failed"] += 1
+        if not ok:
+            print(f"❌ {alert_type} alert could not be queued for delivery")
+
+
+def _demo():
+    """Burst of mixed alerts through the notifier and the local Twilio stand-in"""
+    from notifier import Notifier, WhatsAppChannel
+    from standins import FakeTwilioClient
+    from whatsapp_agent import WhatsAppAgent
+
+    client = FakeTwilioClient(latency=0.05, failure_rate=0.2, seed=1)
+    agent = WhatsAppAgent(None, None, "whatsapp:+10000000000", "whatsapp:+10000000001", client=client)
+    notifier = Notifier([WhatsAppChannel(agent, ["whatsapp:+10000000001"], backoff=0.2)])
+    dispatcher = AlertDispatcher(lambda message, alert_type: notifier.notify(message, alert_type=alert_type),
+                                 window=2.0)
+
+    start = time.time()
+    for i in range(200):
+        patient = f"Patient {i % 5}"
+        alert_type = ["fall", "emergency", "high_risk", "intruder"][i % 4]
+        dispatcher.submit(patient, alert_type, f"{alert_type} alert #{i % 3} for {patient}")
+    submit_time = time.time() - start
+
+    time.sleep(2.5)
+    dispatcher.flush_all()
+    time.sleep(2.0)
+
+    stats = dispatcher.get_stats()
+    delivery = notifier.get_stats()["whatsapp"]
+    print(f"\n📊 200 alerts submitted in {submit_time * 1000:.1f} ms")
+    print(f"   Dispatched: {stats['dispatched']} | Digests: {stats['digests']}")
+    print(f"   Delivered: {delivery['delivered']} | Retries: {delivery['retries']} | Failed: {delivery['failed']}")
+    print(f"   Coalesced: {stats['coalesced']} | Deduplicated: {stats['deduplicated']}")
+    print(f"   Suppressed by type: {stats['suppressed_by_type']}")
+    print(f"   Messages delivered by stand-in: {len(client.sent)}")
+
+
+if __name__ == "__main__":
+    _demo()
@@ -0,0 +1,702 @@
+"""
+Async (ASGI) serving mode.
+
+Same routes and the same in-memory state as server.py, but request handlers
+are coroutines: MySQL goes through an aiomysql pool (SQLite and the MySQL
+stand-in through a thread pool), Groq through AsyncGroq, and the model,
+bcrypt and file appends run in executors. One process can then keep
+thousands of device and dashboard connections open while they wait on I/O.
+
+Run with:
+    python asgi_server.py
+or
+    hypercorn asgi_server:app --bind 0.0.0.0:5000
+"""
+
+import asyncio
+import os
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import wraps
+
+from quart import Quart, request, jsonify, render_template, session, redirect, url_for, g, \
+    send_from_directory, abort
+from quart_cors import cors
+
+# The Flask module owns component setup; both modes share the same objects
+from server import (
+    AUTH_ENABLED, components, engine, health_agent, clinical_agent, alert_dispatcher, notifier,
+    snapshot_store, device_auth, admission, shared_store, retention_job,
+    SNAPSHOT_CACHE_SECONDS, request_log, esp32_log, history_window, history_rows
+)
+from rate_limit import is_priority_payload, ingest_checks
+from async_db import async_db_from_env
+from db import (
+    spool_vitals, replay_vitals_spool, vitals_spool, is_transient_db_error, find_patient,
+    get_historical_vitals, get_historical_env, get_vitals_range, get_env_range
+)
+from vitals_archive import archive
+from circuit_breaker import get_breaker_stats
+from structured_log import get_logging_stats
+from metrics import stage, observe_request
+import metrics
+from ingest import (
+    DEFAULT_PATIENT, normalize_payload, extract_readings, has_vitals, has_env,
+    model_payload, advice_vitals, lookup_payload, vitals_row, csv_line,
+    emergency_message, fall_message, high_risk_message, parse_activity_updates, is_canned_advice,
+    canned_advice
+)
+
+if AUTH_ENABLED:
+    from auth import hash_password, verify_password, get_auth_pool_stats, AuthBusyError
+
+# =============================
+# APP SETUP
+# =============================
+app = cors(Quart(__name__), allow_origin="*")
+app.secret_key = os.urandom(24)
+
+db = async_db_from_env()
+
+# CPU-bound work stays off the event loop
+model_executor = ThreadPoolExecutor(max_workers=int(os.getenv("MODEL_WORKERS", 2)),
+                                    thread_name_prefix="model")
+# One writer keeps CSV rows in arrival order
+file_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="csv")
+# Shared-state calls (engine, admission, device nonces, alert cooldowns) block
+# on SQLite transactions under STATE_BACKEND=sqlite
+state_executor = ThreadPoolExecutor(max_workers=int(os.getenv("STATE_WORKERS", 8)),
+                                    thread_name_prefix="state")
+
+
+async def run_in(executor, fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+
+@app.before_serving
+async def startup():
+    try:
+        await db.start()
+    except Exception as e:
+        # Keep serving; the pool is created on first use once MySQL is
+        # reachable, and vitals are spooled until then
+        esp32_log.warning("MySQL pool unavailable at startup: %s", e)
+
+
+@app.after_serving
+async def shutdown():
+    await db.close()
+    alert_dispatcher.flush_all()
+
+
+@app.before_request
+async def log_request_info():
+    g.request_start = time.perf_counter()
+    request_log.info("%s %s", request.method, request.path, extra={"remote_addr": request.remote_addr})
+
+
+@app.after_request
+async def record_request_metrics(response):
+    start = g.get("request_start")
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        observe_request(route, request.method, response.status_code, time.perf_counter() - start)
+    return response
+
+
+def device_signed(f):
+    """Verify the HMAC device signature before running an ingest route"""
+    @wraps(f)
+    async def wrapper(*args, **kwargs):
+        body = await request.get_data(cache=True)
+        ok, device_id, reason = await run_in(state_executor, device_auth.verify, request.headers, body)
+        if not ok:
+            return jsonify({"status": "error", "message": f"Device authentication failed: {reason}"}), 401
+        g.device_id = device_id
+        return await f(*args, **kwargs)
+    return wrapper
+
+
+def rate_limited_ingest(f):
+    """Reject device floods with 429 before any real processing"""
+    @wraps(f)
+    async def wrapper(*args, **kwargs):
+        data = await request.get_json(silent=True)
+        device_id = g.get("device_id")
+        if device_id is None and isinstance(data, dict):
+            device_id = data.get("device_id")
+
+        checks = ingest_checks(is_priority_payload(data), device_id, request.remote_addr)
+        allowed, retry_after = await run_in(state_executor, admission.check, checks)
+        if not allowed:
+            return jsonify({"status": "error", "message": "Rate limit exceeded"}), 429, \
+                {"Retry-After": str(retry_after)}
+        return await f(*args, **kwargs)
+    return wrapper
+
+# ============================================================
+# AUTH ROUTES
+# ============================================================
+async def auth_unavailable(template):
+    """503 page while the auth schema is still being set up, else None"""
+    schema = components.components.get("auth_schema")
+    if schema is not None and not schema.ready:
+        return await render_template(template, error="Sign-in is starting up, please retry shortly"), 503, \
+            {"Retry-After": "5"}
+    return None
+
+
+async def authenticate_user(email, password):
+    """auth.authenticate_user on the async pool; bcrypt stays in the password pool"""
+    try:
+        user = await db.get_user_for_login(email)
+        if not user:
+            return {"success": False, "error": "Invalid email or password"}
+        if not user.get('is_verified'):
+            return {"success": False, "error": "Please verify your email before logging in."}
+        if not await asyncio.to_thread(verify_password, password, user['password_hash']):
+            return {"success": False, "error": "Invalid email or password"}
+        await db.touch_last_login(user['id'])
+        return {"success": True}
+    except AuthBusyError as e:
+        return {"success": False, "error": str(e), "busy": True}
+    except Exception as e:
+        request_log.warning("Error authenticating user: %s", e)
+        return {"success": False, "error": str(e)}
+
+
+async def create_user(email, password, full_name, role):
+    try:
+        password_hash = await asyncio.to_thread(hash_password, password)
+        user_id = await db.create_user(email, password_hash, full_name, role, secrets.token_urlsafe(32))
+        return {"success": True, "user_id": user_id}
+    except AuthBusyError as e:
+        return {"success": False, "error": str(e), "busy": True}
+    except Exception as e:
+        request_log.warning("Error creating user: %s", e)
+        return {"success": False, "error": str(e)}
+
+
+@app.route("/login", methods=["GET", "POST"])
+async def login():
+    if request.method == "POST":
+        allowed, retry_after = await run_in(state_executor, admission.check, [("login_ip", request.remote_addr)])
+        if not allowed:
+            return await render_template("login.html", error="Too many login attempts, please wait"), 429, \
+                {"Retry-After": str(retry_after)}
+
+        unavailable = await auth_unavailable("login.html")
+        if unavailable:
+            return unavailable
+
+        form = await request.form
+        email = form.get("email")
+        password = form.get("password")
+
+        if AUTH_ENABLED:
+            result = await authenticate_user(email, password)
+            if result["success"]:
+                session["logged_in"] = True
+                session["user_email"] = email
+                return redirect(url_for("dashboard"))
+            elif result.get("busy"):
+                return await render_template("login.html", error="Server busy, please try again"), 503
+            else:
+                return await render_template("login.html", error="Invalid credentials")
+        else:
+            session["logged_in"] = True
+            return redirect(url_for("dashboard"))
+
+    return await render_template("login.html")
+
+
+@app.route("/signup", methods=["GET", "POST"])
+async def signup():
+    if request.method == "POST":
+        allowed, retry_after = await run_in(state_executor, admission.check, [("login_ip", request.remote_addr)])
+        if not allowed:
+            return await render_template("signup.html", error="Too many attempts, please wait"), 429, \
+                {"Retry-After": str(retry_after)}
+
+        unavailable = await auth_unavailable("signup.html")
+        if unavailable:
+            return unavailable
+
+        form = await request.form
+        if AUTH_ENABLED:
+            result = await create_user(form.get("email"), form.get("password"),
+                                       form.get("fullname"), form.get("role"))
+            if result["success"]:
+                return await render_template("signup.html", success="Account created")
+            elif result.get("busy"):
+                return await render_template("signup.html", error="Server busy, please try again"), 503
+            else:
+                return await render_template("signup.html", error="Signup failed")
+        else:
+            session["logged_in"] = True
+            return redirect(url_for("dashboard"))
+
+    return await render_template("signup.html")
+
+
+@app.route("/logout")
+async def logout():
+    session.clear()
+    return redirect(url_for("login"))
+
+# ============================================================
+# STATS / ADVICE
+# ============================================================
+@app.route("/metrics", methods=["GET"])
+async def metrics_endpoint():
+    return metrics.render(), 200, {"Content-Type": metrics.CONTENT_TYPE}
+
+
+@app.route("/healthz", methods=["GET"])
+async def healthz():
+    return jsonify({"status": "alive"})
+
+
+@app.route("/readyz", methods=["GET"])
+async def readyz():
+    ready = components.is_ready()
+    return jsonify({"ready": ready, "components": components.status()}), 200 if ready else 503
+
+
+@app.route("/startup", methods=["GET"])
+async def startup_report():
+    return jsonify(components.timings())
+
+
+@app.route("/advice", methods=["GET"])
+async def get_advice():
+    state = await run_in(state_executor, lambda: engine.state)
+    if "--" in (state["heart_rate"], state["spo2"], state["temperature"]):
+        return jsonify({"status": "error", "message": "No vitals yet"}), 404
+
+    vitals = {
+        "age": state["age"],
+        "heart_rate": state["heart_rate"],
+        "spo2": state["spo2"],
+        "temperature": state["temperature"]
+    }
+    advice = await _advice_for(vitals, state["risk"])
+    return jsonify({"status": "ok", "risk": state["risk"], "advice": advice})
+
+
+@app.route("/advice/stats", methods=["GET"])
+async def advice_stats():
+    if not clinical_agent.ready:
+        return jsonify(components.status()["clinical_agent"]), 503
+    return jsonify(clinical_agent.get_stats())
+
+
+@app.route("/alerts/stats", methods=["GET"])
+async def alert_stats():
+    return jsonify(alert_dispatcher.get_stats())
+
+
+@app.route("/notify/stats", methods=["GET"])
+async def notify_stats():
+    return jsonify(notifier.get_stats())
+
+
+@app.route("/ratelimit/stats", methods=["GET"])
+async def ratelimit_stats():
+    return jsonify(admission.get_stats())
+
+
+@app.route("/breakers", methods=["GET"])
+async def breaker_stats():
+    return jsonify({"breakers": get_breaker_stats(), "spools": {"vitals": vitals_spool.get_stats()}})
+
+
+@app.route("/logging/stats", methods=["GET"])
+async def logging_stats():
+    return jsonify(get_logging_stats())
+
+
+@app.route("/retention/stats", methods=["GET"])
+async def retention_stats():
+    return jsonify(retention_job.get_stats())
+
+
+@app.route("/auth/stats", methods=["GET"])
+async def auth_stats():
+    if not AUTH_ENABLED:
+        return jsonify({"enabled": False})
+    return jsonify(dict(get_auth_pool_stats(), enabled=True))
+
+# ============================================================
+# FRONTEND ROUTES
+# ============================================================
+@app.route("/")
+async def dashboard():
+    return await render_template("dashboard.html")
+
+@app.route("/alerts")
+async def alerts_page():
+    return await render_template("alerts.html")
+
+@app.route("/charts")
+async def charts_page():
+    return await render_template("charts.html")
+
+# ============================================================
+# EVENT / ACTIVITY ROUTES
+# ============================================================
+def _process_event(event_type, image_path):
+    state = engine.process_event(event_type, image_path=image_path)
+    if event_type == "intruder_detected":
+        alert_dispatcher.submit(
+            "facility", "intruder",
+            "🚨 SECURITY ALERT: Intruder detected in restricted area."
+        )
+    return state
+
+
+@app.route("/event", methods=["POST"])
+@device_signed
+@rate_limited_ingest
+async def receive_event():
+    data = await request.get_json()
+    event_type = data.get("event")
+
+    image_path = None
+    snapshot_id = data.get("snapshot_id")
+    if snapshot_id:
+        image_path = f"snapshots/{snapshot_id}.jpg"
+
+    state = await run_in(state_executor, _process_event, event_type, image_path)
+    return jsonify(state)
+
+
+@app.route("/activity", methods=["POST"])
+@device_signed
+@rate_limited_ingest
+async def receive_activity():
+    updates = parse_activity_updates(await request.get_json(silent=True))
+    if updates is None:
+        return jsonify({"status": "error", "message": "JSON body required"}), 400
+    if not updates:
+        return jsonify({"status": "error", "message": "No activity in request"}), 400
+
+    latest = max(updates, key=lambda u: str(u.get("timestamp") or ""))
+    device_id = g.device_id or latest.get("device_id", "unknown")
+    timestamp = str(latest.get("timestamp") or "")
+
+    # Newest timestamp per device wins, so replayed spools never overwrite fresher state
+    state = await run_in(state_executor, engine.update_activity_if_newer, device_id, timestamp,
+                         latest["activity"])
+
+    return jsonify({
+        "status": "success",
+        "activity": state["activity"],
+        "accepted": len(updates)
+    })
+
+# ============================================================
+# INTRUDER SNAPSHOTS
+# ============================================================
+@app.route("/snapshots/<path:filename>")
+async def snapshot_file(filename):
+    if not filename.endswith(".jpg"):
+        abort(404)
+    response = await send_from_directory(snapshot_store.root, filename)
+    response.headers["Cache-Control"] = f"public, max-age={SNAPSHOT_CACHE_SECONDS}, immutable"
+    return response
+
+
+@app.route("/intruders", methods=["GET"])
+async def intruder_events():
+    before = request.args.get("before", type=float)
+    after = request.args.get("after", type=float)
+    limit = min(request.args.get("limit", default=20, type=int), 100)
+
+    events = await asyncio.to_thread(snapshot_store.list_events, before=before, after=after, limit=limit)
+    page = [{
+        "id": e["id"],
+        "ts": e["ts"],
+        "image_url": f"/snapshots/{e['image']}",
+        "thumb_url": f"/snapshots/{e['thumb']}"
+    } for e in events]
+
+    newest = snapshot_store.latest() if after is not None and page else None
+    return jsonify({
+        "events": page,
+        "next_before": page[-1]["ts"] if len(page) == limit else None,
+        # ?after= pages run oldest-first: more to fetch with after=events[0].ts
+        "has_more": bool(newest and newest["ts"] > page[0]["ts"])
+    })
+
+# ============================================================
+# ESP32 DATA ENDPOINT
+# ============================================================
+def _predict(payload):
+    # Resolving the proxy here means a first-use model load happens in the executor
+    return health_agent.predict(payload)
+
+
+async def _ensure_ready(component):
+    if not component.ready:
+        await asyncio.to_thread(component.get)
+
+
+async def _advice_for(vitals, risk):
+    """Advice from the clinical agent; canned advice if the agent cannot be built"""
+    try:
+        await _ensure_ready(clinical_agent)
+        return await clinical_agent.get_advice_async(vitals, risk)
+    except Exception as e:
+        esp32_log.warning("Clinical agent unavailable, using canned advice: %s", e)
+        return canned_advice(vitals, risk)
+
+
+def _apply_events(readings, name):
+    """Posture, environment, emergency and fall updates; blocking, run in state_executor"""
+    if readings["posture"]:
+        engine.update_activity(readings["posture"])
+
+    if has_env(readings):
+        engine.update_env_data(
+            humidity=readings["humidity"] or "--",
+            room_temp=readings["room_temp"] or "--",
+            aqi=readings["aqi"] or "--"
+        )
+
+    if readings["emergency"]:
+        engine.update_emergency(readings["emergency"])
+        alert_dispatcher.submit(name, "emergency", emergency_message(name))
+
+    if readings["fall"]:
+        engine.update_fall(readings["fall"])
+        alert_dispatcher.submit(name, "fall", fall_message(name))
+
+
+def _apply_vitals(readings, patient, risk, advice):
+    engine.update_vitals(
+        heart_rate=readings["heart_rate"],
+        spo2=readings["spo2"],
+        temperature=readings["temperature"],
+        risk=risk,
+        age=patient["age"],
+        gender=patient["gender"],
+        smoking=patient["smoking"],
+        hypertension=patient["hypertension"],
+        name=patient["name"]
+    )
+
+    if risk == "High":
+        alert_dispatcher.submit(patient["name"], "high_risk", high_risk_message(patient["name"], readings, advice))
+
+
+def _append_csv(line):
+    with open("esp32_sensor_log.csv", "a") as f:
+        f.write(line)
+
+
+async def _store_vitals(readings, patient):
+    try:
+        with stage("db_write"):
+            patient_id = await db.get_or_create_patient(lookup_payload(patient))
+            await db.log_vitals(patient_id, vitals_row(readings, patient))
+
+        # MySQL is reachable again: write what was spooled meanwhile
+        if len(vitals_spool):
+            asyncio.get_running_loop().run_in_executor(None, replay_vitals_spool)
+    except Exception as db_e:
+        if not is_transient_db_error(db_e):
+            esp32_log.error("DB rejected vitals row, not spooled: %s", db_e)
+            return
+        esp32_log.warning("DB log failed, vitals spooled: %s", db_e)
+        await run_in(file_executor, spool_vitals, lookup_payload(patient), vitals_row(readings, patient))
+
+
+@app.route("/esp32", methods=["POST"])
+@device_signed
+@rate_limited_ingest
+async def esp32_post():
+    try:
+        raw = await request.get_json()
+        with stage("normalize"):
+            data = normalize_payload(raw)
+            readings = extract_readings(data)
+
+        device_id = g.device_id or data.get("device_id", "esp32")
+        esp32_log.debug("payload %s", data, extra={"device_id": device_id})
+
+        patient = DEFAULT_PATIENT
+        name = patient["name"]
+
+        timestamp = datetime.utcnow().isoformat()
+
+        await run_in(state_executor, _apply_events, readings, name)
+
+        if has_vitals(readings):
+            with stage("predict"):
+                risk_result = await run_in(model_executor, _predict, model_payload(readings, patient))
+
+            risk = risk_result["risk"]
+            previous_risk = (await run_in(state_executor, lambda: engine.state))["risk"]
+
+            advice = None
+            if risk == "High":
+                advice = await run_in(state_executor, shared_store.get, "latest_advice")
+                if previous_risk != "High" or advice is None:
+                    with stage("advice"):
+                        advice = await _advice_for(advice_vitals(readings, patient), risk)
+                    # Canned advice is not kept: the next reading asks Groq again
+                    await run_in(state_executor, shared_store.set, "latest_advice",
+                                 None if is_canned_advice(advice) else advice)
+
+            await run_in(state_executor, _apply_vitals, readings, patient, risk, advice)
+
+            await _store_vitals(readings, patient)
+
+        with stage("csv_append"):
+            await run_in(file_executor, _append_csv, csv_line(timestamp, device_id, name, readings))
+
+        esp32_log.debug("update complete", extra={"device_id": device_id})
+        return jsonify({"status": "ok"})
+
+    except Exception as e:
+        esp32_log.exception("endpoint error: %s", e)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+# ============================================================
+# DASHBOARD DATA
+# ============================================================
+@app.route("/data", methods=["GET"])
+async def get_data():
+    return jsonify(await run_in(state_executor, lambda: engine.state))
+
+
+def _version_and_state():
+    return engine.version(), engine.state
+
+
+class _StateWatch:
+    """
+    One engine.wait_for_change() per process, in a thread, for all waiting
+    dashboards: they park on an asyncio.Condition and share the version and
+    state it returns, so thousands of long-polls cost no store queries.
+    """
+
+    def __init__(self):
+        self._cond = None
+        self._task = None
+        self._waiters = 0
+        self.version = None
+        self.state = None
+
+    async def wait(self, since, timeout):
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        self._waiters += 1
+        try:
+            if self._task is None or self._task.done():
+                # Not watched since the last waiter left: the version may be stale
+                self.version = None
+                self._task = asyncio.create_task(self._watch())
+            async with self._cond:
+                try:
+                    await asyncio.wait_for(
+                        self._cond.wait_for(lambda: self.version is not None and self.version != since), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            if self.version is None:
+                return await run_in(state_executor, _version_and_state)
+            return self.version, self.state
+        finally:
+            self._waiters -= 1
+
+    async def _watch(self):
+        version, state = await run_in(state_executor, _version_and_state)
+        while True:
+            if version != self.version:
+                async with self._cond:
+                    self.version, self.state = version, state
+                    self._cond.notify_all()
+            if not self._waiters:
+                return
+            version, state = await run_in(state_executor, engine.wait_for_change, version, 5.0)
+
+
+state_watch = _StateWatch()
+
+
+@app.route("/data/changes", methods=["GET"])
+async def data_changes():
+    """Long-poll: answers as soon as the state version moves past ?since=<version>"""
+    since = request.args.get("since", type=int)
+    timeout = min(request.args.get("timeout", default=25, type=float), 60)
+    if since is None:
+        version, state = await run_in(state_executor, _version_and_state)
+    else:
+        version, state = await state_watch.wait(since, timeout)
+    return jsonify({"version": version, "state": state})
+
+# ============================================================
+# HISTORY (charts)
+# ============================================================
+# Range queries merge live rows with the columnar archive; they run on the
+# blocking db.py path in a thread, like server.py
+def _history_vitals(window, limit):
+    patient_id = find_patient(lookup_payload())
+    if patient_id is None:
+        return []
+    if window:
+        return get_vitals_range(patient_id, *window)
+    return get_historical_vitals(patient_id, limit=limit)
+
+
+def _history_env(window, limit):
+    if window:
+        return get_env_range(*window)
+    return get_historical_env(limit=limit)
+
+
+async def _history(query):
+    try:
+        window = history_window(request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"Bad history range: {e}"}), 400
+    try:
+        rows = await asyncio.to_thread(query, window, min(request.args.get("limit", 50, type=int), 1000))
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 503
+    return jsonify(history_rows(rows))
+
+
+@app.route("/api/history/vitals", methods=["GET"])
+async def history_vitals():
+    """Last ?limit= readings, or ?start=&end=[&resolution=] across live and archived data"""
+    return await _history(_history_vitals)
+
+
+@app.route("/api/history/env", methods=["GET"])
+async def history_env():
+    return await _history(_history_env)
+
+
+@app.route("/archive/stats", methods=["GET"])
+async def archive_stats():
+    return jsonify(archive.get_stats())
+
+# ============================================================
+# RUN SERVER
+# ============================================================
+def main():
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [f"0.0.0.0:{int(os.getenv('PORT', 5000))}"]
+    config.keep_alive_timeout = 75
+    asyncio.run(serve(app, config))
+
+
+if __name__ == "__main__":
+    main()
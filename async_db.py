@@ -0,0 +1,226 @@
+"""
+aiomysql versions of the db.py / auth.py queries used by asgi_server.py.
+Same tables, same SQL and the same "mysql" circuit breaker as db.py.
+
+On the other backends (DB_BACKEND=sqlite, STANDINS=mysql) async_db_from_env()
+returns ThreadedDB, which runs the db.py queries in a thread pool instead.
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+try:
+    import aiomysql
+except ImportError:  # Only needed for MySQL
+    aiomysql = None
+
+import db
+from circuit_breaker import get_breaker
+from storage import MySQLBackend
+
+
+class AsyncDB:
+    def __init__(self, minsize=1, maxsize=None):
+        self.minsize = minsize
+        self.maxsize = maxsize or int(os.getenv("DB_POOL_SIZE", 20))
+        self.breaker = get_breaker("mysql")
+        self.pool = None
+        self._pool_lock = asyncio.Lock()
+
+    async def start(self):
+        """Create the pool now; if MySQL is down, _acquire retries on later calls"""
+        await self._ensure_pool()
+
+    async def _ensure_pool(self):
+        if self.pool is not None:
+            return self.pool
+        async with self._pool_lock:
+            if self.pool is None:
+                self.pool = await self._create_pool()
+        return self.pool
+
+    async def _create_pool(self):
+        if aiomysql is None:
+            raise RuntimeError("asgi_server.py on MySQL needs aiomysql: pip install aiomysql")
+        return await aiomysql.create_pool(
+            host=os.getenv("DB_HOST", "localhost"),
+            user=os.getenv("DB_USER", "root"),
+            password=os.getenv("DB_PASSWORD", "Tanisop123@"),
+            db=os.getenv("DB_NAME", "ieee"),
+            connect_timeout=int(os.getenv("DB_CONNECT_TIMEOUT", 5)),
+            minsize=self.minsize,
+            maxsize=self.maxsize,
+            # Pool.release() closes a connection left inside a transaction, so
+            # read-only queries must not open one
+            autocommit=True
+        )
+
+    async def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            await self.pool.wait_closed()
+
+    async def _acquire(self):
+        # Runs inside the breaker, so while MySQL is down the pool is not
+        # retried on every request, only on the breaker's trial calls
+        pool = await self._ensure_pool()
+        return await pool.acquire()
+
+    async def _run(self, work):
+        """Run work(conn) on a pooled connection through the breaker"""
+        conn = await self.breaker.call_async(self._acquire)
+        try:
+            return await work(conn)
+        finally:
+            self.pool.release(conn)
+
+    async def get_or_create_patient(self, data):
+        async def work(conn):
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    "SELECT id FROM patients WHERE name=%s AND age=%s AND gender=%s",
+                    (data["name"], data["age"], data["gender"])
+                )
+                result = await cursor.fetchone()
+                if result:
+                    return result[0]
+
+                await cursor.execute(
+                    """
+                    INSERT INTO patients
+                    (name, age, gender, smoking, hypertension)
+                    VALUES (%s, %s, %s, %s, %s)
+                    """,
+                    (data["name"], data["age"], data["gender"], data["smoking"], data["hypertension"])
+                )
+                await conn.commit()
+                return cursor.lastrowid
+        return await self._run(work)
+
+    async def log_vitals(self, patient_id, data, risk_result=None, timestamp=None):
+        if risk_result is None:
+            risk_result = {"risk": "Monitoring", "probability": 0.0}
+
+        async def work(conn):
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    """
+                    INSERT INTO vitals_log
+                    (patient_id, heart_rate, spo2, temperature, weight, risk, probability, timestamp)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, COALESCE(%s, CURRENT_TIMESTAMP))
+                    """,
+                    (
+                        patient_id,
+                        data.get("heart_rate"),
+                        data.get("spo2"),
+                        data.get("temperature"),
+                        data.get("weight"),
+                        risk_result.get("risk", "Monitoring"),
+                        risk_result.get("probability", 0.0),
+                        timestamp
+                    )
+                )
+            await conn.commit()
+        await self._run(work)
+
+    async def get_user_for_login(self, email):
+        async def work(conn):
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
+                return await cursor.fetchone()
+        return await self._run(work)
+
+    async def touch_last_login(self, user_id):
+        async def work(conn):
+            async with conn.cursor() as cursor:
+                await cursor.execute("UPDATE users SET last_login = %s WHERE id = %s",
+                                     (datetime.now(), user_id))
+            await conn.commit()
+        await self._run(work)
+
+    async def create_user(self, email, password_hash, full_name, role, verification_token):
+        async def work(conn):
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    """
+                    INSERT INTO users (email, password_hash, full_name, role, verification_token)
+                    VALUES (%s, %s, %s, %s, %s)
+                    """,
+                    (email, password_hash, full_name, role, verification_token)
+                )
+                await conn.commit()
+                return cursor.lastrowid
+        return await self._run(work)
+
+
+class ThreadedDB:
+    """AsyncDB's interface over db.get_backend(), for backends aiomysql cannot reach"""
+
+    def __init__(self, workers=None):
+        self._executor = ThreadPoolExecutor(max_workers=workers or int(os.getenv("DB_POOL_SIZE", 20)),
+                                            thread_name_prefix="db")
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        self._executor.shutdown(wait=False)
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def get_or_create_patient(self, data):
+        return await self._run(db.get_or_create_patient, data)
+
+    async def log_vitals(self, patient_id, data, risk_result=None, timestamp=None):
+        await self._run(db.log_vitals, patient_id, data, risk_result, timestamp)
+
+    async def get_user_for_login(self, email):
+        def work():
+            conn = db.get_connection()
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
+            user = cursor.fetchone()
+            cursor.close()
+            conn.close()
+            return user
+        return await self._run(work)
+
+    async def touch_last_login(self, user_id):
+        def work():
+            conn = db.get_connection()
+            cursor = conn.cursor()
+            cursor.execute("UPDATE users SET last_login = %s WHERE id = %s", (datetime.now(), user_id))
+            conn.commit()
+            cursor.close()
+            conn.close()
+        await self._run(work)
+
+    async def create_user(self, email, password_hash, full_name, role, verification_token):
+        def work():
+            conn = db.get_connection()
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                INSERT INTO users (email, password_hash, full_name, role, verification_token)
+                VALUES (%s, %s, %s, %s, %s)
+                """,
+                (email, password_hash, full_name, role, verification_token)
+            )
+            conn.commit()
+            user_id = cursor.lastrowid
+            cursor.close()
+            conn.close()
+            return user_id
+        return await self._run(work)
+
+
+def async_db_from_env():
+    """AsyncDB on MySQL; ThreadedDB on SQLite and the MySQL stand-in"""
+    backend = db.get_backend()
+    if isinstance(backend, MySQLBackend):
+        return AsyncDB()
+    print(f"🗄️ Async DB: {backend.name} through a thread pool")
+    return ThreadedDB()
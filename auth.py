@@ -1,7 +1,127 @@
 import bcrypt
 from db import get_connection
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+import os
 import secrets
+import threading
+import time
+
+# Password hashing runs in a separate process pool so bcrypt never holds the
+# GIL of the Flask process (AUTH_POOL_WORKERS=0 hashes inline)
+AUTH_POOL_WORKERS = int(os.getenv("AUTH_POOL_WORKERS", 2))
+AUTH_MAX_PENDING = int(os.getenv("AUTH_MAX_PENDING", 16))
+AUTH_QUEUE_TIMEOUT = float(os.getenv("AUTH_QUEUE_TIMEOUT", 2.0))
+AUTH_TASK_TIMEOUT = float(os.getenv("AUTH_TASK_TIMEOUT", 5.0))
+
+
+class AuthBusyError(Exception):
+    """Raised when the password pool is saturated or too slow"""
+
+
+class PasswordPool:
+    """
+    Bounded process pool for bcrypt work.
+    - max_pending caps hashes queued + running; callers wait at most
+      queue_timeout for a slot before getting AuthBusyError
+    - task_timeout bounds the total time a caller waits for a result
+    """
+
+    def __init__(self, workers=AUTH_POOL_WORKERS, max_pending=AUTH_MAX_PENDING,
+                 queue_timeout=AUTH_QUEUE_TIMEOUT, task_timeout=AUTH_TASK_TIMEOUT):
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self.task_timeout = task_timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+        self._latencies = []  # Most recent call durations (seconds)
+        self._max_samples = 1000
+        self.stats = {"calls": 0, "rejected": 0, "timeouts": 0, "errors": 0, "in_flight": 0}
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._count("rejected")
+            raise AuthBusyError("Password hashing queue is full")
+
+        self._count("in_flight")
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._release(None)
+            self._count("errors")
+            raise
+        # The slot is held until the job has actually finished (or was
+        # cancelled), so abandoned jobs still count against max_pending
+        future.add_done_callback(self._release)
+
+        try:
+            return future.result(timeout=self.task_timeout)
+        except FutureTimeout:
+            future.cancel()  # Only succeeds while still queued; a running hash keeps its slot
+            self._count("timeouts")
+            raise AuthBusyError("Password hashing timed out")
+        except Exception:
+            self._count("errors")
+            raise
+        finally:
+            self._count("calls")
+            self._record(time.perf_counter() - start)
+
+    def _count(self, key, delta=1):
+        with self._lock:
+            self.stats[key] += delta
+
+    def _release(self, future):
+        self._count("in_flight", -1)
+        self._slots.release()
+
+    def _record(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+            if len(self._latencies) > self._max_samples:
+                del self._latencies[:len(self._latencies) - self._max_samples]
+
+    def get_stats(self):
+        with self._lock:
+            samples = sorted(self._latencies)
+            stats = dict(self.stats)
+
+        def pct(p):
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(p / 100 * len(samples)))] * 1000, 2)
+
+        return dict(stats, workers=self.workers,
+                    latency_ms={"p50": pct(50), "p95": pct(95), "p99": pct(99)})
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+password_pool = PasswordPool()
+
+
+def _bcrypt_hash(password):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+
+def _bcrypt_check(password, password_hash):
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
 
 def create_users_table():
     """Create users table if it doesn't exist"""
@@ -30,25 +150,26 @@ def create_users_table():
     print("Users table created successfully!")
 
 def hash_password(password):
-    """Hash a password using bcrypt"""
-    # Generate salt and hash password
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
-    return hashed.decode('utf-8')
+    """Hash a password using bcrypt (in the password pool)"""
+    return password_pool.run(_bcrypt_hash, password)
 
 def verify_password(password, password_hash):
-    """Verify a password against its hash"""
-    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+    """Verify a password against its hash (in the password pool)"""
+    return password_pool.run(_bcrypt_check, password, password_hash)
+
+def get_auth_pool_stats():
+    """Password pool counters and recent latency percentiles"""
+    return password_pool.get_stats()
 
 def create_user(email, password, full_name, role):
     """Create a new user in the database"""
     try:
+        # Hash the password before taking a DB connection
+        password_hash = hash_password(password)
+        
         conn = get_connection()
         cursor = conn.cursor()
         
-        # Hash the password
-        password_hash = hash_password(password)
-        
         # Generate verification token
         verification_token = secrets.token_urlsafe(32)
         
@@ -66,6 +187,9 @@ def create_user(email, password, full_name, role):
         
         return {"success": True, "user_id": user_id, "verification_token": verification_token}
     
+    except AuthBusyError as e:
+        print(f"Signup rejected, auth busy: {e}")
+        return {"success": False, "error": str(e), "busy": True}
     except Exception as e:
         print(f"Error creating user: {e}")
         return {"success": False, "error": str(e)}
@@ -80,21 +204,23 @@ def authenticate_user(email, password):
         query = "SELECT * FROM users WHERE email = %s"
         cursor.execute(query, (email,))
         user = cursor.fetchone()
+
+        # Hand the connection back before bcrypt runs
+        cursor.close()
+        conn.close()
         
         if not user:
-            cursor.close()
-            conn.close()
             return {"success": False, "error": "Invalid email or password"}
         
         # Check if verified
         if not user.get('is_verified'):
-            cursor.close()
-            conn.close()
             return {"success": False, "error": "Please verify your email before logging in."}
         
         # Verify password
         if verify_password(password, user['password_hash']):
             # Update last login
+            conn = get_connection()
+            cursor = conn.cursor()
             update_query = "UPDATE users SET last_login = %s WHERE id = %s"
             cursor.execute(update_query, (datetime.now(), user['id']))
             conn.commit()
@@ -112,10 +238,11 @@ def authenticate_user(email, password):
                 }
             }
         else:
-            cursor.close()
-            conn.close()
             return {"success": False, "error": "Invalid email or password"}
     
+    except AuthBusyError as e:
+        print(f"Login rejected, auth busy: {e}")
+        return {"success": False, "error": str(e), "busy": True}
     except Exception as e:
         print(f"Error authenticating user: {e}")
         return {"success": False, "error": str(e)}
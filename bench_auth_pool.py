@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Measure login latency during a burst and its effect on ingest latency.
+
+Simulates a shift-change login burst (many concurrent bcrypt verifications)
+while a probe thread runs a small ingest-sized task every few milliseconds,
+once with bcrypt inline in the request threads and once with the password
+process pool. No database or server is needed.
+
+Usage:
+    python bench_auth_pool.py --logins 64 --concurrency 16
+"""
+
+import argparse
+import threading
+import time
+
+import bcrypt
+
+from auth import PasswordPool, _bcrypt_check, AUTH_POOL_WORKERS
+
+PROBE_INTERVAL = 0.005
+SAMPLE_PAYLOAD = {
+    "Device_ID": "esp32-01", "HR": 72, "SpO2": 98, "Temp": 36.6,
+    "Humidity": 55, "Room_Temp": 22, "AQI": 50, "Fall": False
+}
+
+
+def percentiles(samples):
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    s = sorted(samples)
+
+    def pct(p):
+        return round(s[min(len(s) - 1, int(p / 100 * len(s)))] * 1000, 2)
+
+    return {"p50": pct(50), "p95": pct(95), "p99": pct(99), "max": round(s[-1] * 1000, 2)}
+
+
+def ingest_probe(stop_event, samples):
+    """Stand-in for /esp32 request handling: normalise a payload on a fixed cadence"""
+    next_run = time.perf_counter()
+    while not stop_event.is_set():
+        next_run += PROBE_INTERVAL
+        start = time.perf_counter()
+        data = {str(k).lower().strip(): v for k, v in SAMPLE_PAYLOAD.items()}
+        _ = [data.get(k) for k in ("heart_rate", "hr", "pulse", "bpm")]
+        # Lateness + work time is what a device request would observe
+        samples.append(time.perf_counter() - start + max(0.0, start - next_run + PROBE_INTERVAL))
+        sleep_for = next_run - time.perf_counter()
+        if sleep_for > 0:
+            time.sleep(sleep_for)
+
+
+def run_burst(pool, password_hash, logins, concurrency):
+    login_times = []
+    rejected = [0]
+    lock = threading.Lock()
+    remaining = [logins]
+
+    def worker():
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            start = time.perf_counter()
+            try:
+                pool.run(_bcrypt_check, "correct horse", password_hash)
+            except Exception:
+                with lock:
+                    rejected[0] += 1
+                continue
+            with lock:
+                login_times.append(time.perf_counter() - start)
+
+    probe_samples = []
+    stop_event = threading.Event()
+    probe = threading.Thread(target=ingest_probe, args=(stop_event, probe_samples), daemon=True)
+    probe.start()
+
+    # Baseline ingest latency before the burst
+    time.sleep(0.5)
+    baseline = list(probe_samples)
+    probe_samples.clear()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    stop_event.set()
+    probe.join()
+
+    return {
+        "logins": len(login_times),
+        "rejected": rejected[0],
+        "logins_per_sec": round(len(login_times) / wall, 1),
+        "login_ms": percentiles(login_times),
+        "ingest_idle_ms": percentiles(baseline),
+        "ingest_during_burst_ms": percentiles(probe_samples),
+    }
+
+
+def print_result(name, r):
+    print(f"\n{name}")
+    print(f"  Logins: {r['logins']} ok, {r['rejected']} rejected ({r['logins_per_sec']}/s)")
+    print(f"  Login latency   ms: {r['login_ms']}")
+    print(f"  Ingest (idle)   ms: {r['ingest_idle_ms']}")
+    print(f"  Ingest (burst)  ms: {r['ingest_during_burst_ms']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Login burst vs ingest latency benchmark")
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=AUTH_POOL_WORKERS or 2)
+    args = parser.parse_args()
+
+    password_hash = bcrypt.hashpw(b"correct horse", bcrypt.gensalt()).decode("utf-8")
+
+    inline = PasswordPool(workers=0)
+    print_result("bcrypt inline (request threads)", run_burst(inline, password_hash, args.logins, args.concurrency))
+
+    pool = PasswordPool(workers=args.workers, max_pending=max(args.concurrency, 1))
+    # Start the worker processes before measuring
+    pool.run(_bcrypt_check, "warm-up", password_hash)
+    print_result(f"bcrypt in process pool ({args.workers} workers)",
+                 run_burst(pool, password_hash, args.logins, args.concurrency))
+    pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
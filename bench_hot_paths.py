@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the hot paths, with regression tracking.
+
+Covers /esp32 payload normalization (ingest.get_best_vital and friends),
+HealthAgent.predict, EventEngine updates on both state backends,
+SimplePostureDetector.detect_posture on canned frames, and face matching in
+recognize.py. Inputs are fixed: seeded synthetic vitals, captured.jpg and the
+known_faces/ gallery, and frames drawn the same way every run (or your own
+recorded frames with --frames).
+
+Each benchmark is calibrated so one sample runs at least --min-time seconds,
+then sampled --repeat times; the per-call median is what gets compared.
+
+    python bench_hot_paths.py                       # run, compare with bench_baseline.json
+    python bench_hot_paths.py --save-baseline       # record this machine's baseline
+    python bench_hot_paths.py --only ingest engine --tolerance 0.10
+    python bench_hot_paths.py --output bench_results.json
+
+Exits with status 1 when a benchmark's median is slower than the baseline
+by more than the tolerance (default 20%, or the benchmark's own "tolerance"
+in the baseline file), or when a baselined benchmark was selected but did
+not run. Baselines are machine-specific: record one on the machine that
+runs the comparison. Benchmarks whose dependencies are not installed are
+reported as skipped. --save-baseline merges into the existing file, so
+--only re-baselines just those benchmarks; skipped ones are not recorded.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BASELINE_PATH = "bench_baseline.json"
+FIXTURE_SEED = 1234
+
+BENCHMARKS = {}
+
+
+def benchmark(name, group):
+    """Register a setup function; it returns the callable to time"""
+    def register(setup):
+        BENCHMARKS[name] = (group, setup)
+        return setup
+    return register
+
+
+# =============================
+# FIXTURES
+# =============================
+def synthetic_payloads(count=500):
+    """Raw ESP32 payloads with the key variants devices actually send"""
+    rng = random.Random(FIXTURE_SEED)
+    aliases = [("HR", "SpO2", "Temp"), ("heart_rate", "spo2", "temperature"), ("bpm", "ox", "t"), ("Pulse ", "oxygen", "temp")]
+    payloads = []
+    for i in range(count):
+        hr_key, spo2_key, temp_key = aliases[i % len(aliases)]
+        payload = {
+            "Device_ID": f"esp32-{i % 8:02d}",
+            hr_key: rng.choice([0, round(rng.uniform(55, 140))]),
+            spo2_key: round(rng.uniform(85, 100), 1),
+            temp_key: round(rng.uniform(36.0, 39.0), 1),
+            "Humidity": round(rng.uniform(30, 70), 1),
+            "Room_Temp": round(rng.uniform(18, 30), 1),
+            "AQI": rng.randint(20, 200),
+        }
+        if i % 3 == 0:
+            payload["hr"] = round(rng.uniform(55, 140))  # Second alias for the same vital
+        payloads.append(payload)
+    return payloads
+
+
+def synthetic_vitals(count=200):
+    """Model inputs around the default patient"""
+    from ingest import DEFAULT_PATIENT
+    rng = random.Random(FIXTURE_SEED)
+    return [
+        dict(DEFAULT_PATIENT,
+             heart_rate=round(rng.uniform(55, 140)),
+             spo2=round(rng.uniform(85, 100), 1),
+             temperature=round(rng.uniform(36.0, 39.0), 1))
+        for _ in range(count)
+    ]
+
+
+def posture_frames(frames_dir=None):
+    """
+    640x480 BGR frames: a bright standing, sitting and lying figure on a dark
+    room, plus captured.jpg. With frames_dir, the images found there instead.
+    """
+    import cv2
+    import numpy as np
+
+    if frames_dir:
+        paths = sorted(
+            os.path.join(frames_dir, f) for f in os.listdir(frames_dir)
+            if f.lower().endswith((".jpg", ".jpeg", ".png"))
+        )
+        return [cv2.imread(p) for p in paths]
+
+    frames = []
+    for box in ((280, 80, 80, 320), (250, 240, 140, 150), (140, 330, 340, 90)):
+        frame = np.full((480, 640, 3), 40, dtype=np.uint8)
+        x, y, w, h = box
+        cv2.ellipse(frame, (x + w // 2, y + h // 2), (w // 2, h // 2), 0, 0, 360, (210, 210, 210), -1)
+        frames.append(frame)
+    if os.path.exists("captured.jpg"):
+        frames.append(cv2.resize(cv2.imread("captured.jpg"), (640, 480)))
+    return frames
+
+
+def _cycle(items):
+    state = {"i": 0}
+
+    def next_item():
+        item = items[state["i"] % len(items)]
+        state["i"] += 1
+        return item
+    return next_item
+
+
+# =============================
+# BENCHMARKS
+# =============================
+@benchmark("ingest.get_best_vital", "ingest")
+def bench_get_best_vital(args):
+    from ingest import VITAL_KEYS, get_best_vital, normalize_payload
+    payloads = [normalize_payload(p) for p in synthetic_payloads()]
+
+    def run():
+        for data in payloads:
+            for keys in VITAL_KEYS.values():
+                get_best_vital(data, keys)
+    return run, len(payloads)
+
+
+@benchmark("ingest.normalize_extract", "ingest")
+def bench_normalize_extract(args):
+    from ingest import normalize_payload, extract_readings, has_vitals, model_payload
+    payloads = synthetic_payloads()
+
+    def run():
+        for raw in payloads:
+            readings = extract_readings(normalize_payload(raw))
+            if has_vitals(readings):
+                model_payload(readings)
+    return run, len(payloads)
+
+
+@benchmark("health_agent.predict", "model")
+def bench_predict(args):
+    from health_agent import HealthAgent
+    agent = HealthAgent(model_path="model.pkl", scaler_path="scaler.pkl")
+    next_vitals = _cycle(synthetic_vitals())
+    return lambda: agent.predict(next_vitals()), 1
+
+
+def _engine_updates(engine):
+    next_vitals = _cycle(synthetic_vitals())
+
+    def run():
+        v = next_vitals()
+        engine.update_vitals(heart_rate=v["heart_rate"], spo2=v["spo2"], temperature=v["temperature"],
+                             risk="Normal", age=v["age"], gender=v["gender"], smoking=v["smoking"],
+                             hypertension=v["hypertension"], name=v["name"])
+        engine.update_env_data(humidity=55, room_temp=22, aqi=50)
+        engine.update_activity("Sitting")
+    return run
+
+
+@benchmark("event_engine.updates[memory]", "engine")
+def bench_engine_memory(args):
+    from event_engine import EventEngine
+    from shared_state import MemoryStore
+    return _engine_updates(EventEngine(MemoryStore())), 3
+
+
+@benchmark("event_engine.updates[sqlite]", "engine")
+def bench_engine_sqlite(args):
+    from event_engine import EventEngine
+    from shared_state import SQLiteStore
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_state_"), "state.db")
+    return _engine_updates(EventEngine(SQLiteStore(path))), 3
+
+
+@benchmark("posture.detect_posture[full]", "posture")
+def bench_posture_full(args):
+    from posture_detector import SimplePostureDetector
+    detector = SimplePostureDetector(server_url=None)
+    next_frame = _cycle(posture_frames(args.frames))
+
+    def run():
+        detector.reset_tracking()  # Full-frame pass every time
+        detector.detect_posture(next_frame())
+    return run, 1
+
+
+@benchmark("posture.detect_posture[tracked]", "posture")
+def bench_posture_tracked(args):
+    from posture_detector import SimplePostureDetector
+    detector = SimplePostureDetector(server_url=None)
+    frame = posture_frames(args.frames)[0]
+    detector.detect_posture(frame)  # Acquire the track once
+    return lambda: detector.detect_posture(frame), 1
+
+
+@benchmark("recognize.match_face", "face")
+def bench_match_face(args):
+    from recognize import load_known_images, match_face
+    gallery = load_known_images()
+    if not gallery or not os.path.exists("captured.jpg"):
+        raise RuntimeError("needs captured.jpg and images in known_faces/")
+    match_face("captured.jpg", gallery, verbose=False)  # Loads the model
+    return lambda: match_face("captured.jpg", gallery, verbose=False), 1
+
+
+# =============================
+# HARNESS
+# =============================
+def measure(fn, ops_per_call, min_time, repeat):
+    """Per-operation seconds for `repeat` samples of a calibrated loop count"""
+    fn()  # Warm-up
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 1_000_000:
+            break
+        loops *= 2 if elapsed < min_time / 4 else 1 + int(min_time / max(elapsed, 1e-9))
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        samples.append((time.perf_counter() - start) / (loops * ops_per_call))
+    samples.sort()
+    return {
+        "median_us": round(statistics.median(samples) * 1e6, 3),
+        "min_us": round(samples[0] * 1e6, 3),
+        "max_us": round(samples[-1] * 1e6, 3),
+        "stdev_us": round(statistics.stdev(samples) * 1e6, 3) if len(samples) > 1 else 0.0,
+        "loops": loops,
+        "ops_per_call": ops_per_call,
+        "samples": repeat,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results, baseline, default_tolerance):
+    """Returns the names of regressed benchmarks, and of baselined ones that did not run"""
+    regressions = []
+    missing = []
+    print(f"\n📊 Against baseline {baseline.get('git_sha', '?')} ({baseline.get('machine', '?')})")
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base or "median_us" not in base:
+            continue
+        if "median_us" not in result:
+            print(f"  {name:<34} ❌ in the baseline but skipped: {result.get('skipped')}")
+            missing.append(name)
+            continue
+        tolerance = base.get("tolerance", default_tolerance)
+        change = result["median_us"] / base["median_us"] - 1
+        if change > tolerance:
+            verdict = "❌ REGRESSION"
+            regressions.append(name)
+        elif change < -tolerance:
+            verdict = "✅ faster"
+        else:
+            verdict = "ok"
+        print(f"  {name:<34} {base['median_us']:>12.3f} -> {result['median_us']:>12.3f} µs "
+              f"({change:+.1%}, tolerance {tolerance:.0%})  {verdict}")
+
+    stale = [name for name in baseline.get("results", {}) if name not in BENCHMARKS]
+    if stale:
+        print(f"  ⚠️ In the baseline but no longer defined: {', '.join(stale)}")
+    return regressions, missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot-path microbenchmarks with regression tracking")
+    parser.add_argument("--only", nargs="+", help="Benchmark groups or names to run "
+                        f"(groups: {', '.join(sorted({g for g, _ in BENCHMARKS.values()}))})")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Seconds per sample")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--frames", help="Directory of recorded frames for the posture benchmarks")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.20, help="Allowed median slowdown (0.20 = 20%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    selected = {
+        name: setup for name, (group, setup) in BENCHMARKS.items()
+        if not args.only or group in args.only or name in args.only
+    }
+
+    if not selected:
+        parser.error(f"--only matched no benchmark: {' '.join(args.only)}")
+
+    print(f"⏱️ {len(selected)} benchmarks | Python {platform.python_version()} | {platform.machine()}")
+    results = {}
+    for name, setup in selected.items():
+        try:
+            fn, ops = setup(args)
+        except Exception as e:
+            # Missing optional dependency or fixture
+            results[name] = {"skipped": str(e)[:200]}
+            print(f"  {name:<34} skipped: {e}")
+            continue
+        result = measure(fn, ops, args.min_time, args.repeat)
+        results[name] = result
+        print(f"  {name:<34} {result['median_us']:>12.3f} µs/op  (min {result['min_us']}, ±{result['stdev_us']})")
+
+    run = {
+        "git_sha": git_revision(),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()} {os.cpu_count()} cpu",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+    if args.save_baseline:
+        # Merge: benchmarks not run (--only) or skipped keep their previous
+        # entry, and hand-set per-benchmark tolerances survive re-baselining
+        merged = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                merged = json.load(f).get("results", {})
+        skipped = []
+        for name, result in results.items():
+            if "median_us" not in result:
+                skipped.append(name)
+                continue
+            if "tolerance" in merged.get(name, {}):
+                result["tolerance"] = merged[name]["tolerance"]
+            merged[name] = result
+        with open(args.baseline, "w") as f:
+            json.dump(dict(run, results=merged), f, indent=2)
+        print(f"💾 Baseline written to {args.baseline} ({len(results) - len(skipped)} updated, "
+              f"{len(merged)} total)")
+        if skipped:
+            print(f"⚠️ Not recorded (skipped): {', '.join(skipped)}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"ℹ️ No baseline at {args.baseline}; record one with --save-baseline")
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions, missing = compare(results, baseline, args.tolerance)
+    if missing:
+        print(f"\n❌ {len(missing)} baselined benchmark(s) did not run: {', '.join(missing)}")
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s): {', '.join(regressions)}")
+    if regressions or missing:
+        sys.exit(1)
+    print("\n✅ No regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Storage backend benchmark: insert and history-query latency per backend.
+
+Runs the real db.py functions against each backend:
+- single:  log_vitals, one reading per connection and commit (the /esp32 path)
+- batch:   log_vitals_many, --batch-size readings per transaction
+- history: get_historical_vitals(limit=50) once the table holds --rows readings
+
+The MySQL backend uses the usual DB_* settings and writes under a dedicated
+"Storage Bench" patient; --cleanup deletes those rows afterwards. The SQLite
+backend uses a fresh temporary file unless --sqlite-path is given.
+
+Usage:
+    python bench_storage.py                          # sqlite only
+    python bench_storage.py --backends sqlite mysql --rows 50000 --cleanup
+    python bench_storage.py --output storage_bench.json
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+import db
+from storage import MySQLBackend, SQLiteBackend
+
+BENCH_PATIENT = {"name": "Storage Bench", "age": 40, "gender": "male", "smoking": False, "hypertension": False}
+
+
+def percentiles(samples):
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    s = sorted(samples)
+
+    def pct(p):
+        return round(s[min(len(s) - 1, int(p / 100 * len(s)))] * 1000, 3)
+
+    return {"p50": pct(50), "p95": pct(95), "p99": pct(99), "max": round(s[-1] * 1000, 3)}
+
+
+def reading(rng):
+    return {
+        "heart_rate": round(rng.uniform(55, 140)),
+        "spo2": round(rng.uniform(85, 100), 1),
+        "temperature": round(rng.uniform(36.0, 39.0), 1),
+        "weight": 70.0,
+    }
+
+
+def run_backend(backend, args):
+    db.set_backend(backend)
+    rng = random.Random(7)
+    patient_id = db.get_or_create_patient(BENCH_PATIENT)
+
+    single = []
+    for _ in range(args.single):
+        start = time.perf_counter()
+        db.log_vitals(patient_id, reading(rng), {"risk": "Normal", "probability": 0.1})
+        single.append(time.perf_counter() - start)
+
+    batches = []
+    inserted = 0
+    start_all = time.perf_counter()
+    while inserted < args.rows:
+        count = min(args.batch_size, args.rows - inserted)
+        rows = [(reading(rng), {"risk": "Normal", "probability": 0.1}, None) for _ in range(count)]
+        start = time.perf_counter()
+        db.log_vitals_many(patient_id, rows)
+        batches.append(time.perf_counter() - start)
+        inserted += count
+    batch_wall = time.perf_counter() - start_all
+
+    history = []
+    for _ in range(args.queries):
+        start = time.perf_counter()
+        db.get_historical_vitals(patient_id, limit=50)
+        history.append(time.perf_counter() - start)
+
+    return {
+        "backend": backend.describe(),
+        "single_insert_ms": percentiles(single),
+        "single_inserts_per_sec": round(len(single) / sum(single), 1) if single else None,
+        "batch_ms": percentiles(batches),
+        "batch_size": args.batch_size,
+        "batched_rows_per_sec": round(inserted / batch_wall, 1) if batch_wall else None,
+        "history_query_ms": percentiles(history),
+        "rows_in_table": args.single + inserted,
+    }, patient_id
+
+
+def cleanup(patient_id):
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM vitals_log WHERE patient_id = %s", (patient_id,))
+    cursor.execute("DELETE FROM patients WHERE id = %s", (patient_id,))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def print_result(r):
+    print(f"\n🗄️ {r['backend']}")
+    print(f"  Single insert  ms: {r['single_insert_ms']}  ({r['single_inserts_per_sec']}/s)")
+    print(f"  Batch of {r['batch_size']:<5} ms: {r['batch_ms']}  ({r['batched_rows_per_sec']} rows/s)")
+    print(f"  History (50)   ms: {r['history_query_ms']}  over {r['rows_in_table']} rows")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Insert and history-query latency per storage backend")
+    parser.add_argument("--backends", nargs="+", default=["sqlite"], choices=["sqlite", "mysql"])
+    parser.add_argument("--single", type=int, default=500, help="Single-row inserts to time")
+    parser.add_argument("--rows", type=int, default=20000, help="Rows loaded in batches before the history queries")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=500, help="History queries to time")
+    parser.add_argument("--sqlite-path", help="SQLite file (default: a new temporary file)")
+    parser.add_argument("--cleanup", action="store_true", help="Delete the benchmark rows afterwards")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = []
+    for kind in args.backends:
+        if kind == "sqlite":
+            path = args.sqlite_path or os.path.join(tempfile.mkdtemp(prefix="bench_storage_"), "bench.db")
+            backend = SQLiteBackend(path)
+        else:
+            backend = MySQLBackend()
+        try:
+            result, patient_id = run_backend(backend, args)
+        except Exception as e:
+            print(f"\n❌ {kind}: {e}")
+            continue
+        print_result(result)
+        results.append(result)
+        if args.cleanup:
+            cleanup(patient_id)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
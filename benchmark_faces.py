@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Offline face-recognition benchmark.
+
+Runs a directory of labelled probe images against the enrolled gallery and
+reports embedding/match latency (p50/p95/p99), throughput per core and
+FAR/FRR across thresholds for one or more DeepFace model backends.
+
+Probe layout: one sub-directory per identity, e.g.
+    probes/authorized/*.jpg   -> should be accepted
+    probes/intruder/*.jpg     -> should be rejected
+
+A flat gallery (like known_faces/) is treated the way recognize.py treats it:
+every enrolled image grants access, so its label is "authorized". A gallery
+with sub-directories uses the sub-directory names as identities.
+
+Usage:
+    python benchmark_faces.py probes/ --models VGG-Face Facenet512 ArcFace
+    python benchmark_faces.py probes/ --thresholds 0.2 0.7 0.02 --output face_bench.json
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+from deepface import DeepFace
+
+from recognize import (
+    KNOWN_FACES_DIR, MODEL_NAME, MATCH_THRESHOLD, ACCEPT_THRESHOLD, match_face
+)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+FLAT_GALLERY_LABEL = "authorized"
+
+
+def list_labelled_images(root, flat_label=None):
+    """Return [(label, path)] using sub-directory names as labels"""
+    items = []
+    for entry in sorted(os.listdir(root)):
+        path = os.path.join(root, entry)
+        if os.path.isdir(path):
+            for file in sorted(os.listdir(path)):
+                if file.lower().endswith(IMAGE_EXTENSIONS):
+                    items.append((entry, os.path.join(path, file)))
+        elif flat_label and entry.lower().endswith(IMAGE_EXTENSIONS):
+            items.append((flat_label, path))
+    return items
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    return float(np.percentile(values, p))
+
+
+def latency_summary(seconds):
+    ms = [s * 1000 for s in seconds]
+    return {
+        "count": len(ms),
+        "mean_ms": float(np.mean(ms)) if ms else None,
+        "p50_ms": percentile(ms, 50),
+        "p95_ms": percentile(ms, 95),
+        "p99_ms": percentile(ms, 99),
+    }
+
+
+def embed(img_path, model_name):
+    """Embedding for the first face in the image (L2-normalised)"""
+    reps = DeepFace.represent(img_path=img_path, model_name=model_name, enforce_detection=False)
+    vec = np.asarray(reps[0]["embedding"], dtype=np.float32)
+    return vec / (np.linalg.norm(vec) + 1e-10)
+
+
+def far_frr_curve(results, gallery_labels, identity_gallery, thresholds):
+    """
+    results: [(probe_label, best_label, best_distance)]
+    A genuine probe is falsely rejected when its best match is above the
+    threshold (or, for identity galleries, is the wrong person). An impostor
+    probe is falsely accepted when anything matches below the threshold.
+    """
+    genuine = [r for r in results if r[0] in gallery_labels]
+    impostor = [r for r in results if r[0] not in gallery_labels]
+
+    curve = []
+    for t in thresholds:
+        false_rejects = 0
+        for probe_label, best_label, distance in genuine:
+            accepted = distance < t and (not identity_gallery or best_label == probe_label)
+            if not accepted:
+                false_rejects += 1
+
+        false_accepts = sum(1 for _, _, distance in impostor if distance < t)
+
+        curve.append({
+            "threshold": round(float(t), 4),
+            "far": false_accepts / len(impostor) if impostor else None,
+            "frr": false_rejects / len(genuine) if genuine else None,
+        })
+    return curve, len(genuine), len(impostor)
+
+
+def equal_error_rate(curve):
+    points = [p for p in curve if p["far"] is not None and p["frr"] is not None]
+    if not points:
+        return None
+    best = min(points, key=lambda p: abs(p["far"] - p["frr"]))
+    return {"threshold": best["threshold"], "eer": (best["far"] + best["frr"]) / 2}
+
+
+def benchmark_model(model_name, gallery, probes, thresholds, identity_gallery):
+    print(f"\n🔬 Model: {model_name}")
+
+    # Warm-up: the first call loads the model weights
+    embed(gallery[0][1], model_name)
+
+    gallery_labels = []
+    gallery_vecs = []
+    for label, path in gallery:
+        try:
+            gallery_vecs.append(embed(path, model_name))
+            gallery_labels.append(label)
+        except Exception as e:
+            print(f"  ✗ Gallery image {os.path.basename(path)} skipped: {e}")
+    gallery_matrix = np.vstack(gallery_vecs)
+
+    embed_times = []
+    match_times = []
+    results = []
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+
+    for label, path in probes:
+        t0 = time.perf_counter()
+        try:
+            vec = embed(path, model_name)
+        except Exception as e:
+            print(f"  ✗ Probe {os.path.basename(path)} skipped: {e}")
+            continue
+        t1 = time.perf_counter()
+
+        # Cosine distance against the whole gallery in one matrix product
+        distances = 1.0 - gallery_matrix @ vec
+        best = int(np.argmin(distances))
+        t2 = time.perf_counter()
+
+        embed_times.append(t1 - t0)
+        match_times.append(t2 - t1)
+        results.append((label, gallery_labels[best], float(distances[best])))
+
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    processed = len(results)
+
+    if not processed:
+        print("  ✗ No probes could be embedded")
+        return {"model": model_name, "probes": 0}
+
+    curve, n_genuine, n_impostor = far_frr_curve(results, set(gallery_labels), identity_gallery, thresholds)
+
+    report = {
+        "model": model_name,
+        "gallery_size": len(gallery_labels),
+        "probes": processed,
+        "genuine_probes": n_genuine,
+        "impostor_probes": n_impostor,
+        "embedding_latency": latency_summary(embed_times),
+        "match_latency": latency_summary(match_times),
+        "throughput_per_sec": processed / wall if wall > 0 else None,
+        # CPU seconds per probe across all threads -> probes one core can handle
+        "throughput_per_core": processed / cpu if cpu > 0 else None,
+        "cores_used": cpu / wall if wall > 0 else None,
+        "far_frr": curve,
+        "eer": equal_error_rate(curve),
+    }
+
+    print_report(report)
+    return report
+
+
+def benchmark_end_to_end(probes, known_images, limit):
+    """Time recognize.match_face exactly as the access-control loop runs it"""
+    print(f"\n⏱  End-to-end recognize.match_face ({MODEL_NAME}, {len(known_images)} gallery images)")
+    times = []
+    for _, path in probes[:limit]:
+        t0 = time.perf_counter()
+        match_face(path, known_images, verbose=False)
+        times.append(time.perf_counter() - t0)
+    summary = latency_summary(times)
+    print(f"  p50 {summary['p50_ms']:.1f} ms | p95 {summary['p95_ms']:.1f} ms | p99 {summary['p99_ms']:.1f} ms")
+    return summary
+
+
+def print_report(report):
+    e = report["embedding_latency"]
+    m = report["match_latency"]
+    print(f"  Probes: {report['probes']} ({report['genuine_probes']} genuine, "
+          f"{report['impostor_probes']} impostor) | Gallery: {report['gallery_size']}")
+    print(f"  Embedding: p50 {e['p50_ms']:.1f} ms | p95 {e['p95_ms']:.1f} ms | p99 {e['p99_ms']:.1f} ms")
+    print(f"  Match:     p50 {m['p50_ms']:.3f} ms | p95 {m['p95_ms']:.3f} ms | p99 {m['p99_ms']:.3f} ms")
+    print(f"  Throughput: {report['throughput_per_sec']:.2f} probes/s "
+          f"({report['throughput_per_core']:.2f} per core, {report['cores_used']:.1f} cores busy)")
+
+    print("  Threshold   FAR      FRR")
+    for point in report["far_frr"]:
+        far = "  --  " if point["far"] is None else f"{point['far']:.3f}"
+        frr = "  --  " if point["frr"] is None else f"{point['frr']:.3f}"
+        marker = "  ← recognize.py" if abs(point["threshold"] - MATCH_THRESHOLD) < 1e-9 else ""
+        print(f"  {point['threshold']:<10.3f}{far:<9}{frr}{marker}")
+
+    if report["eer"]:
+        print(f"  EER ≈ {report['eer']['eer']:.3f} at threshold {report['eer']['threshold']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark face matching speed and accuracy")
+    parser.add_argument("probes", help="Directory of probe images, one sub-directory per identity")
+    parser.add_argument("--gallery", default=KNOWN_FACES_DIR, help="Enrolled gallery directory")
+    parser.add_argument("--models", nargs="+", default=[MODEL_NAME],
+                        help="DeepFace model backends, e.g. VGG-Face Facenet512 ArcFace SFace")
+    parser.add_argument("--thresholds", nargs=3, type=float, metavar=("START", "STOP", "STEP"),
+                        default=[0.1, 0.8, 0.05], help="Cosine distance thresholds to sweep")
+    parser.add_argument("--end-to-end", type=int, default=0, metavar="N",
+                        help="Also time recognize.match_face on the first N probes")
+    parser.add_argument("--output", help="Write the full report as JSON")
+    args = parser.parse_args()
+
+    gallery = list_labelled_images(args.gallery, flat_label=FLAT_GALLERY_LABEL)
+    probes = list_labelled_images(args.probes)
+    identity_gallery = any(label != FLAT_GALLERY_LABEL for label, _ in gallery)
+
+    if not gallery or not probes:
+        print("❌ Need at least one gallery image and one labelled probe image")
+        return
+
+    start, stop, step = args.thresholds
+    thresholds = list(np.arange(start, stop + step / 2, step))
+    for t in (MATCH_THRESHOLD, ACCEPT_THRESHOLD):
+        if not any(abs(t - x) < 1e-9 for x in thresholds):
+            thresholds.append(t)
+    thresholds.sort()
+
+    print(f"📂 Gallery: {len(gallery)} images | Probes: {len(probes)} images | CPUs: {os.cpu_count()}")
+
+    reports = [benchmark_model(m, gallery, probes, thresholds, identity_gallery) for m in args.models]
+
+    output = {"gallery": args.gallery, "probes": args.probes, "cpu_count": os.cpu_count(), "models": reports}
+    if args.end_to_end:
+        output["end_to_end"] = benchmark_end_to_end(probes, [p for _, p in gallery], args.end_to_end)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"\n💾 Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+import json
+import os
+import threading
+import time
+from functools import wraps
+
+from shared_state import file_lock
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a dependency whose breaker is open"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} circuit open, retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failure_threshold` consecutive failures.
+    Open: calls fail fast with CircuitOpenError for `reset_timeout` seconds.
+    Half-open: up to `half_open_max_calls` trial calls go through; a success
+    closes the breaker, a failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, half_open_max_calls=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._lock = threading.Lock()
+        self.stats = {
+            "calls": 0, "successes": 0, "failures": 0,
+            "rejected": 0, "trips": 0, "fallbacks": 0,
+        }
+        self.last_error = None
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        # Caller holds self._lock
+        if self._state == self.OPEN and time.time() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._half_open_calls = 0
+        return self._state
+
+    def _before_call(self):
+        with self._lock:
+            state = self._current_state()
+            if state == self.OPEN or (state == self.HALF_OPEN and
+                                      self._half_open_calls >= self.half_open_max_calls):
+                self.stats["rejected"] += 1
+                retry_after = max(0.0, self.reset_timeout - (time.time() - self._opened_at))
+                raise CircuitOpenError(self.name, retry_after)
+            if state == self.HALF_OPEN:
+                self._half_open_calls += 1
+            self.stats["calls"] += 1
+            return state
+
+    def _on_success(self, state):
+        with self._lock:
+            self.stats["successes"] += 1
+            self._consecutive_failures = 0
+            if state == self.HALF_OPEN:
+                self._half_open_calls -= 1
+                # Only a probe closes the breaker; a call that started before
+                # it tripped says nothing about the dependency now
+                if self._state == self.HALF_OPEN:
+                    self._state = self.CLOSED
+                    print(f"✅ Circuit [{self.name}] closed")
+
+    def _on_failure(self, state, error):
+        with self._lock:
+            self.stats["failures"] += 1
+            self.last_error = str(error)[:200]
+            self._consecutive_failures += 1
+            if state == self.HALF_OPEN:
+                self._half_open_calls -= 1
+            if state == self.HALF_OPEN or (self._state == self.CLOSED and
+                                           self._consecutive_failures >= self.failure_threshold):
+                self._state = self.OPEN
+                self._opened_at = time.time()
+                self.stats["trips"] += 1
+                print(f"🔌 Circuit [{self.name}] open for {self.reset_timeout:.0f}s: {self.last_error}")
+
+    def call(self, fn, *args, **kwargs):
+        state = self._before_call()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._on_failure(state, e)
+            raise
+        self._on_success(state)
+        return result
+
+    async def call_async(self, fn, *args, **kwargs):
+        """call() for coroutine functions"""
+        state = self._before_call()
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception as e:
+            self._on_failure(state, e)
+            raise
+        self._on_success(state)
+        return result
+
+    def record_fallback(self):
+        with self._lock:
+            self.stats["fallbacks"] += 1
+
+    def get_stats(self):
+        with self._lock:
+            state = self._current_state()
+            retry_after = None
+            if state == self.OPEN:
+                retry_after = round(max(0.0, self.reset_timeout - (time.time() - self._opened_at)), 1)
+            return dict(
+                self.stats,
+                state=state,
+                consecutive_failures=self._consecutive_failures,
+                retry_after=retry_after,
+                last_error=self.last_error,
+            )
+
+
+def guarded(breaker, fallback=None):
+    """
+    Decorator: run fn through the breaker. With a fallback, any failure
+    (including an open circuit) returns fallback(*args, **kwargs) instead.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                return breaker.call(fn, *args, **kwargs)
+            except Exception:
+                if fallback is None:
+                    raise
+                breaker.record_fallback()
+                return fallback(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name):
+    """
+    Shared breaker per dependency. Tune with
+    BREAKER_<NAME>_THRESHOLD (consecutive failures) and BREAKER_<NAME>_RESET (seconds).
+    """
+    with _breakers_lock:
+        if name not in _breakers:
+            key = name.upper()
+            _breakers[name] = CircuitBreaker(
+                name,
+                failure_threshold=int(os.getenv(f"BREAKER_{key}_THRESHOLD", 3)),
+                reset_timeout=float(os.getenv(f"BREAKER_{key}_RESET", 30)),
+            )
+        return _breakers[name]
+
+
+def get_breaker_stats():
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {b.name: b.get_stats() for b in breakers}
+
+
+class Spool:
+    """
+    Append-only JSONL file for work that could not be done because a
+    dependency was down. drain() replays it once the dependency is back.
+
+    Records stay in the file until they have been handled, so a crash
+    mid-drain replays them again rather than losing them. Records that keep
+    failing with a non-transient error are moved to `<path>.dead`.
+
+    Under launcher.py every worker shares the file: appends and rewrites hold
+    `<path>.lock`, and only one worker at a time drains (`<path>.drain.lock`).
+    """
+
+    def __init__(self, path, max_entries=10000, max_attempts=3, dead_letter_path=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_attempts = max_attempts
+        self.dead_letter_path = dead_letter_path or path + ".dead"
+        self.lock = threading.Lock()
+        self._drain_lock = threading.Lock()
+        self.dropped = 0
+        self.dead_lettered = 0
+        self.count = 0
+        self._size = None  # File size self.count was taken at
+        with self.lock, file_lock(self.path + ".lock"):
+            self._refresh()
+
+    def __len__(self):
+        # Another worker may have appended or drained since
+        if self._file_size() != self._size:
+            with self.lock, file_lock(self.path + ".lock"):
+                self._refresh()
+        return self.count
+
+    def _file_size(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def _refresh(self):
+        # Caller holds self.lock and the file lock
+        size = self._file_size()
+        if size != self._size:
+            self.count = len(self._load())
+            self._size = size
+
+    def append(self, record):
+        with self.lock, file_lock(self.path + ".lock"):
+            self._refresh()
+            if self.count >= self.max_entries:
+                self.dropped += 1
+                return False
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+            self.count += 1
+            self._size = self._file_size()
+            return True
+
+    def _load(self):
+        entries = []
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        pass  # Torn write from a crash
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def drain(self, handler, is_transient=None):
+        """
+        Call handler(record) for every spooled record, oldest first. Returns
+        the number of records handled.
+
+        A transient failure (every failure, without is_transient) stops the
+        replay and keeps that record and the rest for next time. Any other
+        failure counts against the record; after max_attempts it goes to the
+        dead-letter file and the replay moves on.
+        """
+        if not self._drain_lock.acquire(blocking=False):
+            return 0
+        try:
+            with file_lock(self.path + ".drain.lock", blocking=False) as acquired:
+                if not acquired:
+                    return 0  # Another worker is draining
+                return self._drain(handler, is_transient)
+        finally:
+            self._drain_lock.release()
+
+    def _drain(self, handler, is_transient):
+        # Caller holds the drain locks
+        with self.lock, file_lock(self.path + ".lock"):
+            entries = self._load()
+
+        done = 0
+        removed = 0
+        head = None
+        for record in entries:
+            try:
+                handler(record)
+            except Exception as e:
+                if is_transient is None or is_transient(e):
+                    print(f"⚠️ Spool {self.path}: replay stopped after {done} records: {e}")
+                    break
+                record["attempts"] = record.get("attempts", 0) + 1
+                if record["attempts"] < self.max_attempts:
+                    print(f"⚠️ Spool {self.path}: record failed ({record['attempts']}/{self.max_attempts}): {e}")
+                    head = record
+                    break
+                self._dead_letter(record, e)
+                removed += 1
+                continue
+            done += 1
+            removed += 1
+
+        if removed or head is not None:
+            self._rewrite(removed, head)
+        return done
+
+    def _rewrite(self, removed, head):
+        # Appends only ever add to the end and only the draining worker removes
+        # from the front, so the first `removed` records are still the ones replayed
+        with self.lock, file_lock(self.path + ".lock"):
+            remaining = self._load()[removed:]
+            if head is not None and remaining:
+                remaining[0] = head
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                for record in remaining:
+                    f.write(json.dumps(record) + "\n")
+            os.replace(tmp_path, self.path)
+            self.count = len(remaining)
+            self._size = self._file_size()
+
+    def _dead_letter(self, record, error):
+        print(f"🪦 Spool {self.path}: record moved to {self.dead_letter_path} after "
+              f"{record['attempts']} attempts: {error}")
+        with open(self.dead_letter_path, "a") as f:
+            f.write(json.dumps(dict(record, error=str(error)[:200])) + "\n")
+        self.dead_lettered += 1
+
+    def get_stats(self):
+        return {"path": self.path, "pending": self.count, "dropped": self.dropped,
+                "dead_lettered": self.dead_lettered}
@@ -1,11 +1,125 @@
-from groq import Groq
+from groq import Groq, AsyncGroq
+import json
+import threading
+
+from circuit_breaker import get_breaker
+from ingest import canned_advice
+from shared_state import MemoryStore
+from structured_log import get_logger
+
+log = get_logger("advice")
+
+
+def _bucket(value, step):
+    """Round a reading to the nearest step; non-numeric values are kept as text"""
+    try:
+        return round(round(float(value) / step) * step, 2)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def advice_key(vitals, risk):
+    """Advice depends on the clinical situation, not on every decimal of a reading"""
+    try:
+        age_band = int(float(vitals["age"]) // 10) * 10
+    except (TypeError, ValueError):
+        age_band = str(vitals["age"])
+    return (
+        _bucket(vitals["heart_rate"], 5),     # bpm
+        _bucket(vitals["spo2"], 1),           # %
+        _bucket(vitals["temperature"], 0.2),  # °C
+        age_band,
+        risk,
+    )
+
+
+class AdviceCache:
+    """
+    LRU cache with a time-to-live for generated advice. Entries live in a
+    shared_state store, so under launcher.py a situation is sent to Groq once,
+    not once per worker.
+    """
+
+    def __init__(self, max_entries=256, ttl=3600, store=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.store = store if store is not None else MemoryStore()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key):
+        advice = self.store.cache_get("advice", json.dumps(key))
+        with self._lock:
+            self.stats["misses" if advice is None else "hits"] += 1
+        return advice
+
+    def put(self, key, advice):
+        evicted = self.store.cache_put("advice", json.dumps(key), advice, self.ttl, self.max_entries)
+        with self._lock:
+            self.stats["evictions"] += evicted
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        return dict(
+            stats,
+            size=self.store.cache_size("advice"),
+            hit_rate=round(stats["hits"] / lookups, 3) if lookups else None
+        )
+
 
 class ClinicalAgent:
-    def __init__(self, api_key, model="openai/gpt-oss-120b"):
-        self.client = Groq(api_key=api_key)
+    def __init__(self, api_key, model="openai/gpt-oss-120b", cache=None, timeout=15.0, breaker=None,
+                 client=None, async_client=None):
+        # client/async_client: inject stand-ins (see standins.FakeGroqClient)
+        # The breaker does the retrying across requests; the SDK should not
+        self.client = client or Groq(api_key=api_key, timeout=timeout, max_retries=0)
+        self.api_key = api_key
+        self.timeout = timeout
+        self._async_client = async_client
         self.model = model
+        self.cache = cache or AdviceCache()
+        self.breaker = breaker or get_breaker("groq")
+        self.llm_calls = 0
 
-    def generate_advice(self, vitals, risk):
+    def get_advice(self, vitals, risk):
+        """
+        Advice for this clinical situation, from the cache when possible.
+        Falls back to canned_advice (not cached) when Groq fails or its
+        circuit is open.
+        """
+        key = advice_key(vitals, risk)
+        advice = self.cache.get(key)
+        if advice is None:
+            try:
+                advice = self.breaker.call(self.generate_advice, vitals, risk)
+            except Exception as e:
+                log.warning("Groq unavailable, using canned advice: %s", e)
+                self.breaker.record_fallback()
+                return canned_advice(vitals, risk)
+            self.cache.put(key, advice)
+        return advice
+
+    async def get_advice_async(self, vitals, risk):
+        """get_advice for the async server; same cache, breaker and fallback"""
+        key = advice_key(vitals, risk)
+        advice = self.cache.get(key)
+        if advice is None:
+            try:
+                advice = await self.breaker.call_async(self.generate_advice_async, vitals, risk)
+            except Exception as e:
+                log.warning("Groq unavailable, using canned advice: %s", e)
+                self.breaker.record_fallback()
+                return canned_advice(vitals, risk)
+            self.cache.put(key, advice)
+        return advice
+
+    def get_stats(self):
+        return dict(self.cache.get_stats(), llm_calls=self.llm_calls,
+                    breaker=self.breaker.get_stats()["state"])
+
+    def _messages(self, vitals, risk):
         prompt = f"""
 You are a medical monitoring assistant.
 
@@ -25,12 +139,28 @@ Your task:
 
 """
 
+        return [
+            {"role": "system", "content": "You are a clinical decision assistant."},
+            {"role": "user", "content": prompt}
+        ]
+
+    def generate_advice(self, vitals, risk):
+        self.llm_calls += 1
         response = self.client.chat.completions.create(
             model=self.model,
-            messages=[
-                {"role": "system", "content": "You are a clinical decision assistant."},
-                {"role": "user", "content": prompt}
-            ],
+            messages=self._messages(vitals, risk),
+            temperature=0.3
+        )
+
+        return response.choices[0].message.content
+
+    async def generate_advice_async(self, vitals, risk):
+        if self._async_client is None:
+            self._async_client = AsyncGroq(api_key=self.api_key, timeout=self.timeout, max_retries=0)
+        self.llm_calls += 1
+        response = await self._async_client.chat.completions.create(
+            model=self.model,
+            messages=self._messages(vitals, risk),
             temperature=0.3
         )
 
@@ -0,0 +1,148 @@
+"""
+Lazily built, concurrently warmed server components.
+
+Each component is a proxy: attribute access builds the real object on
+first use. warm_up() builds every component on background threads right
+after startup, so the server answers health checks at once and the first
+real request normally finds everything ready. Import and construction time
+is measured per component for the startup report.
+"""
+
+import importlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class LazyComponent:
+    """
+    - imports: modules to import before calling factory (timed separately)
+    - retry: keep retrying a failed warm-up with backoff (e.g. DB schema
+      setup while MySQL is still starting)
+    """
+
+    def __init__(self, name, factory, imports=(), required=True, retry=False, max_backoff=30.0):
+        self._name = name
+        self._factory = factory
+        self._imports = imports
+        self._required = required
+        self._retry = retry
+        self._max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._target = None
+        self._ready = False
+        self._error = None
+        self._attempts = 0
+        self._import_ms = None
+        self._init_ms = None
+
+    @property
+    def ready(self):
+        return self._ready
+
+    def get(self):
+        if self._ready:
+            return self._target
+        with self._lock:
+            if not self._ready:
+                self._build()
+        return self._target
+
+    def _build(self):
+        # Caller holds self._lock
+        self._attempts += 1
+        try:
+            start = time.perf_counter()
+            for module in self._imports:
+                importlib.import_module(module)
+            imported = time.perf_counter()
+            target = self._factory()
+            self._import_ms = round((imported - start) * 1000, 1)
+            self._init_ms = round((time.perf_counter() - imported) * 1000, 1)
+        except Exception as e:
+            self._error = str(e)[:200]
+            raise
+        self._target = target
+        self._error = None
+        self._ready = True
+
+    def warm_up(self):
+        delay = 1.0
+        while True:
+            try:
+                self.get()
+                return
+            except Exception as e:
+                if not self._retry:
+                    print(f"❌ {self._name} failed to initialize: {e}")
+                    return
+                print(f"⏳ {self._name} not ready ({e}); retrying in {delay:.0f}s")
+                time.sleep(delay)
+                delay = min(delay * 2, self._max_backoff)
+
+    def status(self):
+        return {
+            "ready": self._ready,
+            "required": self._required,
+            "attempts": self._attempts,
+            "import_ms": self._import_ms,
+            "init_ms": self._init_ms,
+            "error": self._error,
+        }
+
+    def __getattr__(self, attr):
+        # Only called for attributes not found on the proxy itself
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+        return getattr(self.get(), attr)
+
+
+class ComponentRegistry:
+    def __init__(self):
+        self.components = {}
+        self.started = time.perf_counter()
+        self.import_ms = None
+        self.ready_ms = None
+        self._warm_thread = None
+
+    def register(self, name, factory, **kwargs):
+        component = LazyComponent(name, factory, **kwargs)
+        self.components[name] = component
+        return component
+
+    def mark_imported(self):
+        """Call once the server module's own imports are done"""
+        self.import_ms = round((time.perf_counter() - self.started) * 1000, 1)
+
+    def warm_up(self, workers=None):
+        """Build all components concurrently in the background; returns at once"""
+        def run():
+            with ThreadPoolExecutor(max_workers=workers or len(self.components) or 1,
+                                    thread_name_prefix="warm-up") as pool:
+                for component in self.components.values():
+                    pool.submit(component.warm_up)
+            self.ready_ms = round((time.perf_counter() - self.started) * 1000, 1)
+            print(self.report())
+
+        self._warm_thread = threading.Thread(target=run, name="warm-up", daemon=True)
+        self._warm_thread.start()
+
+    def is_ready(self):
+        return all(c.ready for c in self.components.values() if c.status()["required"])
+
+    def status(self):
+        return {name: c.status() for name, c in self.components.items()}
+
+    def timings(self):
+        return {
+            "module_import_ms": self.import_ms,
+            "all_ready_ms": self.ready_ms,
+            "components": self.status(),
+        }
+
+    def report(self):
+        lines = [f"⏱️ Startup: module imports {self.import_ms} ms, components ready after {self.ready_ms} ms"]
+        for name, s in self.status().items():
+            state = "ready" if s["ready"] else f"NOT READY ({s['error']})"
+            lines.append(f"   {name:<16} import {s['import_ms']} ms | init {s['init_ms']} ms | {state}")
+        return "\n".join(lines)
@@ -1,13 +1,55 @@
-import mysql.connector
 import os
+import threading
+from datetime import datetime
+
+import standins
+from circuit_breaker import CircuitOpenError, Spool, get_breaker
+from storage import backend_from_env
+from vitals_archive import archive, bucket_rows, NUMERIC
+
+# Every caller (server, auth) connects through this breaker, so a MySQL
+# outage fails fast instead of each request waiting out the connect timeout
+db_breaker = get_breaker("mysql")
+
+# Vitals that could not be written while MySQL was down
+vitals_spool = Spool(os.getenv("VITALS_SPOOL", "vitals_spool.jsonl"))
+_replay_lock = threading.Lock()
+
+# MySQL or embedded SQLite (DB_BACKEND), or the load-test stand-in
+# (STANDINS=mysql); chosen on first use, after .env is loaded
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = standins.mysql_from_env() if standins.enabled("mysql") else backend_from_env()
+    return _backend
+
+def set_backend(backend):
+    """Swap the storage backend (bench_storage.py, tools)"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
 
 def get_connection():
-    return mysql.connector.connect(
-        host=os.getenv("DB_HOST", "localhost"),
-        user=os.getenv("DB_USER", "root"),
-        password=os.getenv("DB_PASSWORD", "Tanisop123@"),
-        database=os.getenv("DB_NAME", "ieee")
+    return db_breaker.call(get_backend().connect)
+
+# Look a patient up without creating one (read-only routes); None if unknown
+def find_patient(data):
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT id FROM patients WHERE name=%s AND age=%s AND gender=%s",
+        (data["name"], data["age"], data["gender"])
     )
+    result = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    return result[0] if result else None
+
 
 # Get or create patient
 def get_or_create_patient(data):
@@ -46,24 +88,17 @@ def get_or_create_patient(data):
 
 
 # Log only vitals
-def log_vitals(patient_id, data, risk_result=None):
+def log_vitals(patient_id, data, risk_result=None, timestamp=None):
     conn = get_connection()
     cursor = conn.cursor()
 
-    # Ensure weight column exists
-    try:
-        cursor.execute("ALTER TABLE vitals_log ADD COLUMN weight DOUBLE AFTER temperature")
-        conn.commit()
-    except Exception:
-        pass # Column already exists
-
     if risk_result is None:
         risk_result = {"risk": "Monitoring", "probability": 0.0}
 
     query = """
         INSERT INTO vitals_log
-        (patient_id, heart_rate, spo2, temperature, weight, risk, probability)
-        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        (patient_id, heart_rate, spo2, temperature, weight, risk, probability, timestamp)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, COALESCE(%s, CURRENT_TIMESTAMP))
     """
 
     cursor.execute(query, (
@@ -73,7 +108,8 @@ def log_vitals(patient_id, data, risk_result=None):
         data.get("temperature"),
         data.get("weight"),
         risk_result.get("risk", "Monitoring"),
-        risk_result.get("probability", 0.0)
+        risk_result.get("probability", 0.0),
+        timestamp
     ))
 
     conn.commit()
@@ -81,36 +117,125 @@ def log_vitals(patient_id, data, risk_result=None):
     conn.close()
 
 
-# Log environmental data
-def log_env_data(humidity, room_temp, aqi):
+# Log many vitals rows in one transaction: rows are (data, risk_result, timestamp)
+def log_vitals_many(patient_id, rows):
     conn = get_connection()
     cursor = conn.cursor()
 
-    # First, ensure the table exists
+    query = """
+        INSERT INTO vitals_log
+        (patient_id, heart_rate, spo2, temperature, weight, risk, probability, timestamp)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, COALESCE(%s, CURRENT_TIMESTAMP))
+    """
+
+    params = []
+    for data, risk_result, timestamp in rows:
+        risk_result = risk_result or {"risk": "Monitoring", "probability": 0.0}
+        params.append((
+            patient_id,
+            data.get("heart_rate"),
+            data.get("spo2"),
+            data.get("temperature"),
+            data.get("weight"),
+            risk_result.get("risk", "Monitoring"),
+            risk_result.get("probability", 0.0),
+            timestamp
+        ))
+
     try:
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS environmental_log (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                humidity VARCHAR(10),
-                room_temp VARCHAR(10),
-                aqi VARCHAR(10),
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+        cursor.executemany(query, params)
         conn.commit()
     except Exception:
-        pass
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+    return len(params)
+
+
+# Connection-level failures (mysql.connector, pymysql/aiomysql and sqlite3
+# all name them this way); anything else is a problem with the row itself
+TRANSIENT_DB_ERRORS = ("OperationalError", "InterfaceError", "PoolError")
+
+
+def is_transient_db_error(error):
+    """True if the write may succeed later, so the row should be spooled"""
+    if isinstance(error, (CircuitOpenError, ConnectionError, TimeoutError)):
+        return True
+    return type(error).__name__ in TRANSIENT_DB_ERRORS
+
+
+# Keep vitals locally while MySQL is unreachable
+def spool_vitals(patient, data, risk_result=None):
+    return vitals_spool.append({
+        "patient": patient,
+        "data": data,
+        "risk_result": risk_result,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    })
+
+
+# Write spooled vitals with their original timestamps; safe to call often
+def replay_vitals_spool():
+    if not len(vitals_spool) or not _replay_lock.acquire(blocking=False):
+        return 0
+    try:
+        def write(record):
+            patient_id = get_or_create_patient(record["patient"])
+            log_vitals(patient_id, record["data"], record["risk_result"], timestamp=record["timestamp"])
+
+        written = vitals_spool.drain(write, is_transient=is_transient_db_error)
+        if written:
+            print(f"📤 DB: Replayed {written} spooled vitals rows")
+        return written
+    finally:
+        _replay_lock.release()
+
+
+# Log environmental data
+def log_env_data(humidity, room_temp, aqi):
+    conn = get_connection()
+    cursor = conn.cursor()
 
     query = """
-        INSERT INTO environmental_log (humidity, room_temp, aqi)
-        VALUES (%s, %s, %s)
+        INSERT INTO environmental_log (humidity, room_temp, aqi, timestamp)
+        VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
     """
     cursor.execute(query, (str(humidity), str(room_temp), str(aqi)))
-    
+
     conn.commit()
     cursor.close()
     conn.close()
 
+
+# Log many environmental rows in one transaction: rows are (humidity, room_temp, aqi, timestamp)
+def log_env_many(rows):
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    query = """
+        INSERT INTO environmental_log (humidity, room_temp, aqi, timestamp)
+        VALUES (%s, %s, %s, COALESCE(%s, CURRENT_TIMESTAMP))
+    """
+
+    params = [(str(humidity), str(room_temp), str(aqi), timestamp)
+              for humidity, room_temp, aqi, timestamp in rows]
+
+    try:
+        cursor.executemany(query, params)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+    return len(params)
+
+def _as_datetime(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
 # Fetch historical vitals for charts
 def get_historical_vitals(patient_id, limit=50):
     conn = get_connection()
@@ -129,7 +254,15 @@ def get_historical_vitals(patient_id, limit=50):
 
     cursor.close()
     conn.close()
-    return results[::-1] # Return in chronological order
+    results = results[::-1] # Return in chronological order
+
+    # Fewer live rows than asked for: the rest may have been archived
+    if len(results) < limit:
+        before = _as_datetime(results[0]["timestamp"]) if results else datetime.now()
+        older = archive.latest("vitals", limit - len(results), before, patient_id)
+        results = [{k: row[k] for k in ("heart_rate", "spo2", "temperature", "weight", "timestamp")}
+                   for row in older] + results
+    return results
 
 # Fetch historical environmental data for charts
 def get_historical_env(limit=50):
@@ -147,4 +280,53 @@ def get_historical_env(limit=50):
 
     cursor.close()
     conn.close()
-    return results[::-1] # Return in chronological order
+    results = results[::-1] # Return in chronological order
+
+    if len(results) < limit:
+        before = _as_datetime(results[0]["timestamp"]) if results else datetime.now()
+        results = archive.latest("env", limit - len(results), before) + results
+    return results
+
+
+def _range_query(kind, query, params, start, end, resolution, patient_id=None):
+    """
+    Rows in [start, end) from the columnar archive (older than its horizon)
+    and the live table (the rest), oldest first; bucketed when resolution is set.
+    """
+    horizon = archive.horizon(kind)
+    results = []
+    if horizon is not None and start < horizon:
+        results += archive.query(kind, start, min(end, horizon), patient_id=patient_id, resolution=resolution)
+
+    if horizon is None or end > horizon:
+        live_start = max(start, horizon) if horizon is not None else start
+        conn = get_connection()
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(query, params + (live_start, end))
+        live = cursor.fetchall()
+        cursor.close()
+        conn.close()
+        for row in live:
+            row["timestamp"] = _as_datetime(row["timestamp"])
+        results += bucket_rows(live, resolution, NUMERIC[kind]) if resolution else live
+    return results
+
+# Vitals between two datetimes, e.g. month-long charts (resolution in seconds)
+def get_vitals_range(patient_id, start, end, resolution=None):
+    query = """
+        SELECT heart_rate, spo2, temperature, weight, timestamp
+        FROM vitals_log
+        WHERE patient_id = %s AND timestamp >= %s AND timestamp < %s
+        ORDER BY timestamp
+    """
+    return _range_query("vitals", query, (patient_id,), start, end, resolution, patient_id)
+
+# Environment readings between two datetimes
+def get_env_range(start, end, resolution=None):
+    query = """
+        SELECT humidity, room_temp, aqi, timestamp
+        FROM environmental_log
+        WHERE timestamp >= %s AND timestamp < %s
+        ORDER BY timestamp
+    """
+    return _range_query("env", query, (), start, end, resolution)
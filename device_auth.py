@@ -0,0 +1,193 @@
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+
+from shared_state import MemoryStore, StoreFull
+
+# device_keys.json: {"esp32-01": "<shared secret>", ...}
+DEVICE_KEYS_FILE = os.getenv("DEVICE_KEYS_FILE", "device_keys.json")
+
+# off      - no verification
+# optional - signed requests must verify, unsigned requests are still accepted
+# enforce  - every request must carry a valid signature (default; "required" also works)
+DEVICE_AUTH_MODE = os.getenv("DEVICE_AUTH_MODE", "enforce").lower()
+DEVICE_AUTH_MAX_SKEW = int(os.getenv("DEVICE_AUTH_MAX_SKEW", 300))
+
+HEADER_DEVICE = "X-Device-Id"
+HEADER_TIMESTAMP = "X-Timestamp"
+HEADER_NONCE = "X-Nonce"
+HEADER_SIGNATURE = "X-Signature"
+
+
+def signing_message(device_id, timestamp, nonce, body):
+    """Bytes covered by the signature: device, timestamp, nonce and the raw body"""
+    return f"{device_id}\n{timestamp}\n{nonce}\n".encode("utf-8") + body
+
+
+def compute_signature(key, device_id, timestamp, nonce, body):
+    return hmac.new(key, signing_message(device_id, timestamp, nonce, body), hashlib.sha256).hexdigest()
+
+
+def sign_request(device_id, key, body):
+    """Headers for a signed request (used by the Python clients)"""
+    timestamp = str(int(time.time()))
+    nonce = secrets.token_hex(8)
+    if isinstance(key, str):
+        key = key.encode("utf-8")
+    return {
+        HEADER_DEVICE: device_id,
+        HEADER_TIMESTAMP: timestamp,
+        HEADER_NONCE: nonce,
+        HEADER_SIGNATURE: compute_signature(key, device_id, timestamp, nonce, body),
+    }
+
+
+def signed_post(session, url, payload, device_id, key=None, timeout=2):
+    """POST JSON, signing it when a device key is configured"""
+    if not key:
+        return session.post(url, json=payload, timeout=timeout)
+    body = json.dumps(payload).encode("utf-8")
+    headers = sign_request(device_id, key, body)
+    headers["Content-Type"] = "application/json"
+    return session.post(url, data=body, headers=headers, timeout=timeout)
+
+
+class DeviceKeyTable:
+    """
+    In-memory device_id -> HMAC key table.
+    The key file is re-read when its mtime changes (checked at most every
+    check_interval seconds) or when reload() is called, e.g. from SIGHUP.
+    """
+
+    def __init__(self, path=DEVICE_KEYS_FILE, check_interval=2.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._keys = {}
+        self._mtime = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            with open(self.path) as f:
+                raw = json.load(f)
+            keys = {str(k): str(v).encode("utf-8") for k, v in raw.items()}
+        except FileNotFoundError:
+            mtime, keys = None, {}
+        except (OSError, ValueError) as e:
+            # Keep serving the previous table if the new file is broken
+            print(f"⚠ Device key file {self.path} not reloaded: {e}")
+            return False
+
+        with self._lock:
+            self._keys = keys
+            self._mtime = mtime
+            self._last_check = time.time()
+        print(f"🔑 Loaded {len(keys)} device keys from {self.path}")
+        return True
+
+    def _maybe_reload(self):
+        now = time.time()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._mtime:
+            self.reload()
+
+    def get(self, device_id):
+        self._maybe_reload()
+        return self._keys.get(device_id)
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class DeviceAuthenticator:
+    """
+    Verifies HMAC-signed device requests against a DeviceKeyTable.
+    Seen signatures are claimed in the shared store, so a request replayed
+    to another launcher worker is rejected too.
+    """
+
+    def __init__(self, keys=None, mode=DEVICE_AUTH_MODE, max_skew=DEVICE_AUTH_MAX_SKEW,
+                 replay_cache_size=50000, store=None):
+        self.keys = keys if keys is not None else DeviceKeyTable()
+        self.mode = "enforce" if mode == "required" else mode
+        if self.mode not in ("off", "optional", "enforce"):
+            raise ValueError(f"Unknown DEVICE_AUTH_MODE {mode!r} (expected off, optional or enforce)")
+        self.max_skew = max_skew
+        self.replay_cache_size = replay_cache_size
+        self.store = store if store is not None else MemoryStore()
+        self.stats = {"verified": 0, "unsigned": 0, "rejected": 0}
+        self._warn_insecure()
+
+    def _warn_insecure(self):
+        if self.mode == "enforce" and not len(self.keys):
+            print(f"🚨 DEVICE_AUTH_MODE=enforce but {self.keys.path} has no keys: every device request "
+                  f"will be rejected. Add device keys, or set DEVICE_AUTH_MODE=off for local testing.")
+        elif self.mode != "enforce" and len(self.keys):
+            print(f"🚨 DEVICE_AUTH_MODE={self.mode}: device keys are configured but unsigned requests to "
+                  f"/esp32 and /event are accepted from anyone. Set DEVICE_AUTH_MODE=enforce.")
+
+    def verify(self, headers, body):
+        """
+        Returns (ok, device_id, reason). device_id is only set for verified
+        requests; unsigned requests pass in "optional" mode with device_id None.
+        """
+        if self.mode == "off":
+            return True, None, "disabled"
+
+        signature = headers.get(HEADER_SIGNATURE)
+        if not signature:
+            if self.mode == "enforce":
+                self.stats["rejected"] += 1
+                return False, None, "missing signature"
+            self.stats["unsigned"] += 1
+            return True, None, "unsigned"
+
+        device_id = headers.get(HEADER_DEVICE, "")
+        timestamp = headers.get(HEADER_TIMESTAMP, "")
+        nonce = headers.get(HEADER_NONCE, "")
+
+        key = self.keys.get(device_id)
+        if key is None:
+            return self._reject("unknown device")
+
+        try:
+            ts = int(timestamp)
+        except ValueError:
+            return self._reject("bad timestamp")
+
+        now = time.time()
+        if abs(now - ts) > self.max_skew:
+            return self._reject("stale timestamp")
+
+        expected = compute_signature(key, device_id, timestamp, nonce, body)
+        if not hmac.compare_digest(expected.encode("ascii"), signature.lower().encode("utf-8")):
+            return self._reject("bad signature")
+
+        # A captured request cannot be replayed inside the skew window. When the
+        # cache is full new requests are refused; live entries are never evicted
+        try:
+            if not self.store.claim("device_replay", signature.lower(), 2 * self.max_skew,
+                                    self.replay_cache_size):
+                return self._reject("replayed request")
+        except StoreFull:
+            return self._reject("replay cache full")
+
+        self.stats["verified"] += 1
+        return True, device_id, "ok"
+
+    def _reject(self, reason):
+        self.stats["rejected"] += 1
+        return False, None, reason
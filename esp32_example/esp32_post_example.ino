@@ -1,12 +1,39 @@
 #include <WiFi.h>
 #include <HTTPClient.h>
+#include <time.h>
+#include "mbedtls/md.h"
 
 const char* ssid = "YOUR_SSID";
 const char* password = "YOUR_PASSWORD";
 
-// Replace with your server URL, include port if not 80, e.g. "http://192.168.1.50:5000/esp32" 
+// Replace with your server URL, include port if not 80, e.g. "http://192.168.1.50:5000/esp32"
 const char* serverUrl = "http://YOUR_SERVER_IP:5000/esp32";
 
+// Must match this device's entry in device_keys.json on the server
+const char* deviceId = "esp32-01";
+const char* deviceKey = "YOUR_DEVICE_KEY";
+
+// HMAC-SHA256 over "<device_id>\n<timestamp>\n<nonce>\n<body>", hex encoded
+String signPayload(const String& timestamp, const String& nonce, const String& body) {
+  String message = String(deviceId) + "\n" + timestamp + "\n" + nonce + "\n" + body;
+
+  unsigned char hmac[32];
+  mbedtls_md_context_t ctx;
+  mbedtls_md_init(&ctx);
+  mbedtls_md_setup(&ctx, mbedtls_md_info_from_type(MBEDTLS_MD_SHA256), 1);
+  mbedtls_md_hmac_starts(&ctx, (const unsigned char*)deviceKey, strlen(deviceKey));
+  mbedtls_md_hmac_update(&ctx, (const unsigned char*)message.c_str(), message.length());
+  mbedtls_md_hmac_finish(&ctx, hmac);
+  mbedtls_md_free(&ctx);
+
+  char hex[65];
+  for (int i = 0; i < 32; i++) {
+    sprintf(hex + i * 2, "%02x", hmac[i]);
+  }
+  hex[64] = '\0';
+  return String(hex);
+}
+
 void setup() {
   Serial.begin(115200);
   delay(100);
@@ -19,6 +46,15 @@ void setup() {
   }
   Serial.println();
   Serial.println("WiFi connected");
+
+  // Signed requests carry a Unix timestamp, so the clock must be set
+  configTime(0, 0, "pool.ntp.org", "time.nist.gov");
+  Serial.print("Syncing time");
+  while (time(nullptr) < 1700000000) {
+    delay(500);
+    Serial.print(".");
+  }
+  Serial.println();
 }
 
 void loop() {
@@ -34,7 +70,7 @@ void loop() {
     int age = 45;
 
     String payload = "{";
-    payload += "\"device_id\": \"esp32-01\",";
+    payload += "\"device_id\": \""; payload += deviceId; payload += "\",";
     payload += "\"name\": \"Alice\",";
     payload += "\"age\": "; payload += age; payload += ",";
     payload += "\"heart_rate\": "; payload += heart_rate; payload += ",";
@@ -42,6 +78,14 @@ void loop() {
     payload += "\"temperature\": "; payload += String(temperature);
     payload += "}";
 
+    // Sign exactly the bytes that are sent
+    String timestamp = String((unsigned long)time(nullptr));
+    String nonce = String(esp_random(), HEX);
+    http.addHeader("X-Device-Id", deviceId);
+    http.addHeader("X-Timestamp", timestamp);
+    http.addHeader("X-Nonce", nonce);
+    http.addHeader("X-Signature", signPayload(timestamp, nonce, payload));
+
     int httpResponseCode = http.POST(payload);
 
     if (httpResponseCode > 0) {
@@ -1,101 +1,143 @@
+from shared_state import MemoryStore
+
+STATE_KEY = "engine_state"
+ACTIVITY_TS_KEY = "activity_ts"
+
+
+def initial_state():
+    return {
+        "access_status": "No activity",
+        "alert": "None",
+
+        # Vitals
+        "heart_rate": "--",
+        "spo2": "--",
+        "temperature": "--",
+        "risk": "--",
+
+        # Profile
+        "name": "Ramesh Gupta",
+        "age": "20",
+        "gender": "male",
+        "smoking": "False",
+        "hypertension": "False",
+
+        # Activity from accelerometer
+        "activity": "Unknown",
+
+        # Environmental Data
+        "humidity": "--",
+        "room_temp": "--",
+        "aqi": "--",
+
+        # Intruder image
+        "intruder_image": None,
+
+        # Manual Emergency Status
+        "manual_emergency": False,
+
+        # Fall Status
+        "fall_detected": False
+    }
+
+
 class EventEngine:
-    def __init__(self):
-        self.state = {
-            "access_status": "No activity",
-            "alert": "None",
-
-            # Vitals
-            "heart_rate": "--",
-            "spo2": "--",
-            "temperature": "--",
-            "risk": "--",
-
-            # Profile
-            "name": "Ramesh Gupta",
-            "age": "20",
-            "gender": "male",
-            "smoking": "False",
-            "hypertension": "False",
-
-            # Activity from accelerometer
-            "activity": "Unknown",
-
-            # Environmental Data
-            "humidity": "--",
-            "room_temp": "--",
-            "aqi": "--",
-
-            # Intruder image
-            "intruder_image": None,
-
-            # Manual Emergency Status
-            "manual_emergency": False,
-
-            # Fall Status
-            "fall_detected": False
-        }
+    """
+    Dashboard state. It lives in a shared_state store, so every server
+    worker reads and updates the same state; each update is one atomic
+    read-modify-write.
+    """
+
+    def __init__(self, store=None):
+        self.store = store or MemoryStore()
+        self.store.update(STATE_KEY, lambda state: state or initial_state())
+
+    @property
+    def state(self):
+        return self.store.get(STATE_KEY)
+
+    def version(self):
+        return self.store.version()
+
+    def wait_for_change(self, since_version, timeout=25.0):
+        """Block until the state changes (or timeout); returns (version, state)"""
+        version = self.store.wait_for_change(since_version, timeout)
+        return version, self.state
+
+    def _apply(self, mutate):
+        def apply(state):
+            state = state or initial_state()
+            mutate(state)
+            return state
+        return self.store.update(STATE_KEY, apply)
 
     def process_event(self, event_type, image_path=None):
 
-        if event_type == "authorized":
-            self.state["access_status"] = "Authorized access"
-            self.state["alert"] = "None"
+        def mutate(state):
+            if event_type == "authorized":
+                state["access_status"] = "Authorized access"
+                state["alert"] = "None"
 
-        elif event_type == "intruder_detected":
-            self.state["access_status"] = "Intruder detected"
-            self.state["alert"] = "SECURITY ALERT"
-            self.state["intruder_image"] = image_path
+            elif event_type == "intruder_detected":
+                state["access_status"] = "Intruder detected"
+                state["alert"] = "SECURITY ALERT"
+                state["intruder_image"] = image_path
 
-        elif event_type == "abnormal_vitals":
-            self.state["alert"] = "MEDICAL EMERGENCY"
+            elif event_type == "abnormal_vitals":
+                state["alert"] = "MEDICAL EMERGENCY"
 
-        return self.state
+        return self._apply(mutate)
 
     def update_vitals(self, heart_rate=None, spo2=None, temperature=None, risk=None,
                       age=None, gender=None, smoking=None, hypertension=None, name=None):
 
-        if heart_rate is not None: self.state["heart_rate"] = heart_rate
-        if spo2 is not None: self.state["spo2"] = spo2
-        if temperature is not None: self.state["temperature"] = temperature
-        if risk is not None: self.state["risk"] = risk
-
-        if name is not None: self.state["name"] = name
-        if age is not None: self.state["age"] = age
-        if gender is not None: self.state["gender"] = gender
-        if smoking is not None: self.state["smoking"] = smoking
-        if hypertension is not None: self.state["hypertension"] = hypertension
+        changes = {
+            "heart_rate": heart_rate, "spo2": spo2, "temperature": temperature, "risk": risk,
+            "name": name, "age": age, "gender": gender, "smoking": smoking, "hypertension": hypertension,
+        }
+        return self._apply(lambda state: state.update({k: v for k, v in changes.items() if v is not None}))
 
     def update_activity(self, activity):
         """Update patient activity status from accelerometer"""
-        self.state["activity"] = activity
-        return self.state
+        return self._apply(lambda state: state.update(activity=activity))
+
+    def update_activity_if_newer(self, device_id, timestamp, activity):
+        """
+        Apply an activity unless this device already reported a newer one, so
+        replayed spools never overwrite fresher state. ISO-8601 timestamps
+        sort correctly as strings; an empty timestamp always applies.
+        """
+        def apply(values):
+            seen = values[ACTIVITY_TS_KEY] or {}
+            if timestamp and timestamp < seen.get(device_id, ""):
+                return {}
+            seen[device_id] = timestamp
+            state = values[STATE_KEY] or initial_state()
+            state["activity"] = activity
+            return {ACTIVITY_TS_KEY: seen, STATE_KEY: state}
+
+        return self.store.transact([STATE_KEY, ACTIVITY_TS_KEY], apply)[STATE_KEY]
 
     def update_env_data(self, humidity, room_temp, aqi):
         """Update environmental metrics"""
-        self.state["humidity"] = humidity
-        self.state["room_temp"] = room_temp
-        self.state["aqi"] = aqi
-        return self.state
+        return self._apply(lambda state: state.update(humidity=humidity, room_temp=room_temp, aqi=aqi))
 
     def update_emergency(self, status):
         """Update manual emergency button status"""
-        self.state["manual_emergency"] = bool(status)
-        if status:
-            self.state["alert"] = "MANUAL EMERGENCY"
-        elif self.state["alert"] == "MANUAL EMERGENCY":
-            self.state["alert"] = "None"
-        return self.state
+        def mutate(state):
+            state["manual_emergency"] = bool(status)
+            if status:
+                state["alert"] = "MANUAL EMERGENCY"
+            elif state["alert"] == "MANUAL EMERGENCY":
+                state["alert"] = "None"
+        return self._apply(mutate)
 
     def update_fall(self, status):
         """Update fall detection status"""
-        self.state["fall_detected"] = bool(status)
-        if status:
-            self.state["alert"] = "FALL DETECTED"
-        elif self.state["alert"] == "FALL DETECTED":
-            self.state["alert"] = "None"
-        return self.state
-
-
-
-
-
+        def mutate(state):
+            state["fall_detected"] = bool(status)
+            if status:
+                state["alert"] = "FALL DETECTED"
+            elif state["alert"] == "FALL DETECTED":
+                state["alert"] = "None"
+        return self._apply(mutate)
@@ -0,0 +1,505 @@
+#!/usr/bin/env python3
+"""
+Bulk import of esp32_sensor_log.csv into vitals_log / environmental_log.
+
+The CSV gets every reading, but the database only gets full vitals that
+were written while it was up: partial readings are never logged there, and
+environment readings never are. This command loads what is missing.
+
+- Streams the log and its rotated segments (esp32_sensor_log.csv.1,
+  .2.gz, -20240101 ...), oldest first, --chunk-size lines at a time
+- Validates and coerces each row; malformed rows (wrong column count, bad
+  timestamp, non-numeric or out-of-range vitals) are counted and skipped
+- Resolves patients by name through a cache; lines for a patient that is
+  not in the database are kept in --unknown-out (default
+  <path>.unknown_patient.csv) and retried at the start of every run, so
+  they go in once the patient has been added
+- Loads each chunk with db.log_vitals_many / db.log_env_many (one
+  executemany per table, a multi-row INSERT on MySQL)
+- Resumable: the byte offset reached in each segment is kept in
+  --checkpoint, and segments are recognized by their first line, so
+  renaming by log rotation does not start them over
+- Idempotent: rows already in the database (written live by the server, or
+  by an interrupted import) are skipped by timestamp and values
+- Rows older than the columnar archive horizon go to the archive (checked
+  the same way), where history queries read them; rows older than the
+  retention cutoff (VITALS_RETENTION_DAYS / ENV_RETENTION_DAYS, other
+  RETENTION_MODEs) were already removed and are skipped as expired
+
+The CSV timestamps are UTC; the database keeps local time, so they are
+converted (--csv-tz local if the log was written in local time).
+
+Usage:
+    python import_csv.py                          # esp32_sensor_log.csv*
+    python import_csv.py --dry-run                # validate and count only
+    python import_csv.py --chunk-size 20000 --reset
+"""
+
+import argparse
+import bisect
+import glob
+import gzip
+import hashlib
+import json
+import os
+import re
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import db
+from ingest import CSV_COLUMNS, DEFAULT_PATIENT, lookup_payload
+from schema import RETENTION_DAYS, RETENTION_MODE, retention_cutoff
+from vitals_archive import archive, TABLES as ARCHIVE_KINDS
+
+MISSING = {"", "none", "null", "nan", "--"}
+
+# Values outside these ranges are corrupt lines. 0 (no finger on the sensor)
+# is kept, as the server stores it, so live rows still match on import
+VALID_RANGE = {
+    "heart_rate": (0, 300),
+    "spo2": (0, 100),
+    "temperature": (0, 50),
+}
+
+# A live write lands up to a few seconds after the CSV line (the advice
+# call runs first), so matches are looked for in this window
+DEDUPE_WINDOW = timedelta(seconds=float(os.getenv("IMPORT_DEDUPE_WINDOW", 20)))
+
+_ROTATED = r"(?:\.(\d+)|[-.](\d{8,14}))?(\.gz)?$"
+
+
+class RowError(ValueError):
+    pass
+
+
+def segments(path):
+    """The log and its rotated segments, oldest first"""
+    base = os.path.basename(path)
+    pattern = re.compile(re.escape(base) + _ROTATED)
+    found = []
+    for candidate in glob.glob(glob.escape(path) + "*"):
+        match = pattern.match(os.path.basename(candidate))
+        if not match:
+            continue
+        number, date, _ = match.groups()
+        if number is not None:
+            key = (1, -int(number))
+        elif date is not None:
+            key = (0, date)
+        else:
+            key = (2,)
+        found.append((key, candidate))
+    return [candidate for _, candidate in sorted(found)]
+
+
+def open_segment(path):
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+
+def fingerprint(path):
+    """sha1 of the first line: stable across renames and while the file grows"""
+    with open_segment(path) as f:
+        first = f.readline()
+    if not first.endswith(b"\n"):
+        return None
+    return hashlib.sha1(first).hexdigest()
+
+
+def coerce_number(value, field):
+    value = value.strip()
+    if value.lower() in MISSING:
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        raise RowError(f"{field}={value!r} is not a number")
+    low, high = VALID_RANGE[field]
+    if not low <= number <= high:
+        raise RowError(f"{field}={number} out of range")
+    return number
+
+
+def coerce_env(value):
+    value = value.strip()
+    return "--" if value.lower() in MISSING else value
+
+
+def parse_row(line, csv_tz):
+    fields = line.rstrip("\r\n").split(",")
+    if len(fields) != len(CSV_COLUMNS):
+        raise RowError(f"{len(fields)} columns, expected {len(CSV_COLUMNS)}")
+    row = dict(zip(CSV_COLUMNS, fields))
+    try:
+        timestamp = datetime.fromisoformat(row["timestamp"].strip())
+    except ValueError:
+        raise RowError(f"bad timestamp {row['timestamp']!r}")
+    if csv_tz == "utc":
+        timestamp = timestamp.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+    row["timestamp"] = timestamp.replace(microsecond=0)
+    row["name"] = row["name"].strip()
+    for field in VALID_RANGE:
+        row[field] = coerce_number(row[field], field)
+    for field in ("humidity", "room_temp", "aqi"):
+        row[field] = coerce_env(row[field])
+    return row
+
+
+class PatientCache:
+    """name -> patient id; the monitored patient is created if missing, others must already exist"""
+
+    def __init__(self):
+        self.ids = {}
+
+    def resolve(self, name):
+        if name not in self.ids:
+            self.ids[name] = self._lookup(name)
+        return self.ids[name]
+
+    def _lookup(self, name):
+        if name == DEFAULT_PATIENT["name"]:
+            return db.get_or_create_patient(lookup_payload())
+        conn = db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM patients WHERE name=%s ORDER BY id LIMIT 1", (name,))
+        result = cursor.fetchone()
+        cursor.close()
+        conn.close()
+        return result[0] if result else None
+
+
+def _value_key(values):
+    return tuple(None if v is None or v in MISSING else round(float(v), 2) if _is_number(v) else v
+                 for v in values)
+
+
+def _is_number(value):
+    try:
+        float(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def existing_rows(query, params):
+    """(values) -> sorted timestamps already in the database"""
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    found = defaultdict(list)
+    for row in cursor.fetchall():
+        found[_value_key(row[:-1])].append(datetime.fromisoformat(str(row[-1])))
+    cursor.close()
+    conn.close()
+    for timestamps in found.values():
+        timestamps.sort()
+    return found
+
+
+def archived_rows(kind, window, columns, patient_id=None):
+    """existing_rows() for the columnar archive"""
+    found = defaultdict(list)
+    for row in archive.query(kind, window[0], window[1] + timedelta(seconds=1), patient_id=patient_id):
+        found[_value_key([row[c] for c in columns])].append(row["timestamp"])
+    for timestamps in found.values():
+        timestamps.sort()
+    return found
+
+
+def drop_existing(rows, found):
+    """
+    rows: (values, timestamp, payload). Each database row absorbs at most one
+    CSV row, the first one at or up to DEDUPE_WINDOW before it.
+    """
+    if not found:
+        return [payload for _, _, payload in rows]
+    fresh = []
+    for values, timestamp, payload in rows:
+        candidates = found.get(_value_key(values))
+        if candidates:
+            i = bisect.bisect_left(candidates, timestamp - timedelta(seconds=1))
+            if i < len(candidates) and candidates[i] <= timestamp + DEDUPE_WINDOW:
+                del candidates[i]
+                continue
+        fresh.append(payload)
+    return fresh
+
+
+def load_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"segments": {}}
+
+
+def save_checkpoint(path, checkpoint):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp, path)
+
+
+def chunks(f, size, live):
+    """Lists of (line, end offset); a live file's unterminated last line is left for the next run"""
+    batch = []
+    for raw in f:
+        if live and not raw.endswith(b"\n"):
+            break
+        batch.append((raw.decode("utf-8", "replace"), f.tell()))
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class CSVImporter:
+    def __init__(self, path="esp32_sensor_log.csv", checkpoint_path="esp32_import.checkpoint.json",
+                 chunk_size=5000, csv_tz="utc", dry_run=False, reset=False, unknown_path=None):
+        self.path = path
+        self.unknown_path = unknown_path or path + ".unknown_patient.csv"
+        self.checkpoint_path = checkpoint_path
+        self.chunk_size = chunk_size
+        self.csv_tz = csv_tz
+        self.dry_run = dry_run
+        self.checkpoint = {"segments": {}} if reset else load_checkpoint(checkpoint_path)
+        self.patients = PatientCache()
+        # Expired rows are not re-inserted; in columnar mode they are in the archive instead
+        self.cutoffs = {table: None if RETENTION_MODE == "columnar" else retention_cutoff(days)
+                        for table, days in RETENTION_DAYS.items()}
+        self.stats = {
+            "lines": 0,
+            "vitals": 0,
+            "env": 0,
+            "duplicates": 0,
+            "rejected": 0,
+            "unknown_patient": 0,
+            "unknown_retried": 0,
+            "archived": 0,
+            "expired": 0,
+            "segments_skipped": 0,
+            "elapsed": 0.0,
+        }
+
+    def run(self):
+        start = time.perf_counter()
+        self._retry_unknown()
+        paths = segments(self.path)
+        if not paths:
+            print(f"❌ No log found at {self.path}")
+        for path in paths:
+            key = fingerprint(path)
+            if key is None:
+                continue
+            live = os.path.abspath(path) == os.path.abspath(self.path)
+            state = self.checkpoint["segments"].setdefault(key, {"offset": 0, "rows": 0, "complete": False})
+            state["path"] = path
+            if state["complete"]:
+                self.stats["segments_skipped"] += 1
+                continue
+            self._import_segment(path, live, state, start)
+            # A rotated segment no longer grows; the live file may
+            state["complete"] = not live
+            self._save()
+        self.stats["elapsed"] = time.perf_counter() - start
+        return self.stats
+
+    def rows_per_sec(self):
+        return self.stats["lines"] / self.stats["elapsed"] if self.stats["elapsed"] else 0.0
+
+    def _save(self):
+        if not self.dry_run:
+            save_checkpoint(self.checkpoint_path, self.checkpoint)
+
+    def _parse(self, batch, name):
+        parsed = []
+        for line, end in batch:
+            if not line.strip():
+                continue
+            try:
+                row = parse_row(line, self.csv_tz)
+            except RowError as e:
+                self.stats["rejected"] += 1
+                if self.stats["rejected"] <= 10:
+                    print(f"⚠️ {name} line ending at byte {end}: {e}")
+                continue
+            row["line"] = line
+            parsed.append(row)
+        return parsed
+
+    def _retry_unknown(self):
+        """Load the lines an earlier run set aside; those still unknown are set aside again"""
+        retry_path = self.unknown_path + ".retry"
+        if self.dry_run:
+            return
+        # A leftover .retry is from an interrupted retry: finish it first
+        if not os.path.exists(retry_path):
+            if not os.path.exists(self.unknown_path):
+                return
+            os.replace(self.unknown_path, retry_path)
+        with open(retry_path, "rb") as f:
+            for batch in chunks(f, self.chunk_size, False):
+                parsed = self._parse(batch, os.path.basename(retry_path))
+                if parsed:
+                    self._load(parsed)
+                self.stats["unknown_retried"] += len(batch)
+        os.remove(retry_path)
+
+    def _import_segment(self, path, live, state, start):
+        name = os.path.basename(path)
+        with open_segment(path) as f:
+            f.seek(state["offset"])
+            for batch in chunks(f, self.chunk_size, live):
+                parsed = self._parse(batch, name)
+                if parsed:
+                    self._load(parsed)
+                # Only after the chunk is committed: a crash re-reads it, and the
+                # duplicate check keeps the second pass from inserting it twice
+                self.stats["lines"] += len(batch)
+                state["offset"] = batch[-1][1]
+                state["rows"] += len(batch)
+                self._save()
+                rate = self.stats["lines"] / (time.perf_counter() - start)
+                print(f"📥 {name}: {state['rows']} lines | {rate:,.0f} rows/s")
+
+    def _split_old(self, table, rows):
+        """
+        (live rows, rows for the columnar archive). Rows older than the archive
+        horizon would be invisible in the live table, and rows older than the
+        retention cutoff were already removed: the first go to the archive,
+        which skips rows it holds, the rest are counted as expired.
+        """
+        horizon = archive.horizon(ARCHIVE_KINDS[table])
+        cutoff = self.cutoffs[table]
+        live, old = [], []
+        for row in rows:
+            if horizon is not None and row["timestamp"] < horizon:
+                old.append(row)
+            elif cutoff is not None and row["timestamp"] < cutoff:
+                self.stats["expired"] += 1
+            else:
+                live.append(row)
+        return live, old
+
+    def _load(self, parsed):
+        vitals = [r for r in parsed if any(r[k] is not None for k in VALID_RANGE)]
+        env = [r for r in parsed if any(r[k] != "--" for k in ("humidity", "room_temp", "aqi"))]
+        vitals, old_vitals = self._split_old("vitals_log", vitals)
+        env, old_env = self._split_old("environmental_log", env)
+        if self.dry_run:
+            self.stats["vitals"] += len(vitals)
+            self.stats["env"] += len(env)
+            self.stats["archived"] += len(old_vitals) + len(old_env)
+            return
+
+        window = (min(r["timestamp"] for r in parsed) - timedelta(seconds=1),
+                  max(r["timestamp"] for r in parsed) + DEDUPE_WINDOW)
+
+        by_patient = defaultdict(list)
+        old_by_patient = defaultdict(list)
+        unknown = []
+        for row, old in [(r, False) for r in vitals] + [(r, True) for r in old_vitals]:
+            patient_id = self.patients.resolve(row["name"])
+            if patient_id is None:
+                unknown.append(row["line"])
+            else:
+                (old_by_patient if old else by_patient)[patient_id].append(row)
+        if unknown:
+            # The checkpoint moves past these lines: keep them for the next run
+            with open(self.unknown_path, "a") as f:
+                f.writelines(line if line.endswith("\n") else line + "\n" for line in unknown)
+            self.stats["unknown_patient"] += len(unknown)
+
+        for patient_id, rows in by_patient.items():
+            weight = DEFAULT_PATIENT["weight"] if rows[0]["name"] == DEFAULT_PATIENT["name"] else None
+            candidates = [((r["heart_rate"], r["spo2"], r["temperature"]), r["timestamp"],
+                           ({"heart_rate": r["heart_rate"], "spo2": r["spo2"],
+                             "temperature": r["temperature"], "weight": weight}, None, r["timestamp"]))
+                          for r in rows]
+            found = existing_rows("""
+                SELECT heart_rate, spo2, temperature, timestamp FROM vitals_log
+                WHERE patient_id = %s AND timestamp >= %s AND timestamp <= %s
+            """, (patient_id,) + window)
+            fresh = drop_existing(candidates, found)
+            if fresh:
+                db.log_vitals_many(patient_id, fresh)
+            self.stats["duplicates"] += len(rows) - len(fresh)
+            self.stats["vitals"] += len(fresh)
+
+        if env:
+            candidates = [((r["humidity"], r["room_temp"], r["aqi"]), r["timestamp"],
+                           (r["humidity"], r["room_temp"], r["aqi"], r["timestamp"]))
+                          for r in env]
+            found = existing_rows("""
+                SELECT humidity, room_temp, aqi, timestamp FROM environmental_log
+                WHERE timestamp >= %s AND timestamp <= %s
+            """, window)
+            fresh = drop_existing(candidates, found)
+            if fresh:
+                db.log_env_many(fresh)
+            self.stats["duplicates"] += len(env) - len(fresh)
+            self.stats["env"] += len(fresh)
+
+
+        # Older than the horizon: the archive is where these rows are read from
+        for patient_id, rows in old_by_patient.items():
+            weight = DEFAULT_PATIENT["weight"] if rows[0]["name"] == DEFAULT_PATIENT["name"] else None
+            candidates = [((r["heart_rate"], r["spo2"], r["temperature"]), r["timestamp"],
+                           {"patient_id": patient_id, "heart_rate": r["heart_rate"], "spo2": r["spo2"],
+                            "temperature": r["temperature"], "weight": weight, "risk": "Monitoring",
+                            "probability": 0.0, "timestamp": r["timestamp"]})
+                          for r in rows]
+            found = archived_rows("vitals", window, ("heart_rate", "spo2", "temperature"), patient_id)
+            fresh = drop_existing(candidates, found)
+            if fresh:
+                archive.write_table_rows("vitals_log", fresh)
+            self.stats["duplicates"] += len(rows) - len(fresh)
+            self.stats["archived"] += len(fresh)
+
+        if old_env:
+            candidates = [((r["humidity"], r["room_temp"], r["aqi"]), r["timestamp"],
+                           {"humidity": r["humidity"], "room_temp": r["room_temp"], "aqi": r["aqi"],
+                            "timestamp": r["timestamp"]})
+                          for r in old_env]
+            found = archived_rows("env", window, ("humidity", "room_temp", "aqi"))
+            fresh = drop_existing(candidates, found)
+            if fresh:
+                archive.write_table_rows("environmental_log", fresh)
+            self.stats["duplicates"] += len(old_env) - len(fresh)
+            self.stats["archived"] += len(fresh)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import esp32_sensor_log.csv into the database")
+    parser.add_argument("--path", default="esp32_sensor_log.csv", help="Live log; rotated segments are found next to it")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Lines per transaction")
+    parser.add_argument("--checkpoint", default="esp32_import.checkpoint.json")
+    parser.add_argument("--reset", action="store_true", help="Ignore the checkpoint and read everything again")
+    parser.add_argument("--csv-tz", choices=["utc", "local"], default="utc", help="Time zone of the CSV timestamps")
+    parser.add_argument("--dry-run", action="store_true", help="Validate and count, write nothing")
+    parser.add_argument("--unknown-out", help="Where lines for patients not in the database are kept "
+                        "until they can be loaded (default: <path>.unknown_patient.csv)")
+    args = parser.parse_args()
+    if args.unknown_out and os.path.abspath(args.unknown_out) == os.path.abspath(args.path):
+        parser.error("--unknown-out must differ from --path")
+
+    importer = CSVImporter(args.path, args.checkpoint, args.chunk_size, args.csv_tz, args.dry_run, args.reset,
+                           args.unknown_out)
+    stats = importer.run()
+    print(f"\n✅ {stats['lines']} lines in {stats['elapsed']:.1f}s ({importer.rows_per_sec():,.0f} rows/s)"
+          f"{' [dry run]' if args.dry_run else ''}")
+    print(f"   vitals rows: {stats['vitals']} | env rows: {stats['env']} | "
+          f"already in DB: {stats['duplicates']} | rejected: {stats['rejected']} | "
+          f"unknown patient: {stats['unknown_patient']} | segments already done: {stats['segments_skipped']}")
+    if stats["archived"] or stats["expired"]:
+        print(f"   older than the archive horizon, to the archive: {stats['archived']} | "
+              f"older than retention, skipped: {stats['expired']}")
+    if stats["unknown_retried"]:
+        print(f"   Set-aside lines retried: {stats['unknown_retried']}")
+    if stats["unknown_patient"] and not args.dry_run:
+        print(f"   Lines for unknown patients are kept in {importer.unknown_path} and retried on the next run")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Framework-independent parts of the sensor ingest path, shared by the Flask
+server (server.py) and the async server (asgi_server.py).
+"""
+
+VITAL_KEYS = {
+    "heart_rate": ["heart_rate", "hr", "pulse", "bpm"],
+    "spo2": ["spo2", "spo", "ox", "oxygen"],
+    "temperature": ["temperature", "temp", "t"],
+}
+
+# The monitored patient (single-patient deployment)
+DEFAULT_PATIENT = {
+    "name": "Ramesh Gupta",
+    "age": 20,
+    "gender": "male",
+    "smoking": False,
+    "hypertension": False,
+    "weight": 70.0,
+    "height": 1.72,  # metres, as in the training data (BMI feature)
+}
+
+
+TRUE_VALUES = {"1", "true", "yes", "on"}
+FALSE_VALUES = {"", "0", "false", "no", "off"}
+
+
+def parse_flag(value):
+    """
+    Alert flag: only an explicit false (missing, False, 0, "0", "false", "no",
+    "off", "") is False. A fall or emergency must never be dropped because the
+    firmware spelled it differently, so any other value counts as set, and
+    values that are not a recognised true are logged.
+    """
+    if value is None or isinstance(value, bool):
+        return bool(value)
+    if isinstance(value, (int, float)):
+        return value != 0
+    text = str(value).strip().lower()
+    if text in FALSE_VALUES:
+        return False
+    if text not in TRUE_VALUES:
+        print(f"⚠️ Unrecognised flag value {value!r}, treated as set")
+    return True
+
+
+def normalize_payload(raw):
+    """Lower-case, stripped keys so 'HR', 'hr ' and 'hr' are the same field"""
+    return {str(k).lower().strip(): v for k, v in (raw or {}).items()}
+
+
+def get_best_vital(data, keys):
+    """First present alias, preferring a non-zero reading over a zero one"""
+    best_val = None
+    for k in keys:
+        val = data.get(k)
+        if val is not None:
+            is_zero = (str(val).strip() == "0" or val == 0)
+            is_best_zero = (best_val is None or str(best_val).strip() == "0" or best_val == 0)
+            if best_val is None or (is_best_zero and not is_zero):
+                best_val = val
+    return best_val
+
+
+def extract_readings(data):
+    """Vitals, environment and event flags from a normalized ESP32 payload"""
+    readings = {name: get_best_vital(data, keys) for name, keys in VITAL_KEYS.items()}
+    for key in ("humidity", "room_temp", "aqi", "posture"):
+        readings[key] = data.get(key)
+    for key in ("emergency", "fall"):
+        readings[key] = parse_flag(data.get(key))
+    return readings
+
+
+def has_vitals(readings):
+    return all(readings[k] is not None for k in VITAL_KEYS)
+
+
+def has_env(readings):
+    return any(readings[k] is not None for k in ("humidity", "room_temp", "aqi"))
+
+
+def model_payload(readings, patient=DEFAULT_PATIENT):
+    """Input for HealthAgent.predict"""
+    return dict(patient,
+                heart_rate=readings["heart_rate"],
+                spo2=readings["spo2"],
+                temperature=readings["temperature"])
+
+
+def advice_vitals(readings, patient=DEFAULT_PATIENT):
+    """Input for ClinicalAgent.get_advice"""
+    return {
+        "age": patient["age"],
+        "heart_rate": readings["heart_rate"],
+        "spo2": readings["spo2"],
+        "temperature": readings["temperature"]
+    }
+
+
+def lookup_payload(patient=DEFAULT_PATIENT):
+    """Patient identity for get_or_create_patient"""
+    return {k: patient[k] for k in ("name", "age", "gender", "smoking", "hypertension")}
+
+
+def vitals_row(readings, patient=DEFAULT_PATIENT):
+    """Row data for log_vitals"""
+    return {
+        "heart_rate": readings["heart_rate"],
+        "spo2": readings["spo2"],
+        "temperature": readings["temperature"],
+        "weight": patient["weight"]
+    }
+
+
+def emergency_message(name):
+    return f"🆘 EMERGENCY: Help button pressed by {name}!"
+
+
+def fall_message(name):
+    return f"⚠️ FALL detected for {name}! Immediate assistance required."
+
+
+def high_risk_message(name, readings, advice):
+    return f"""⚠️ MEDICAL ALERT
+Patient: {name}
+Status: HIGH RISK
+
+Heart Rate: {readings['heart_rate']} bpm
+SpO2: {readings['spo2']}%
+Temperature: {readings['temperature']}°C
+
+Advice:
+{advice[:500]}"""
+
+
+CANNED_ADVICE_NOTE = "automated advice is unavailable right now"
+
+
+def canned_advice(vitals, risk):
+    """Fixed guidance used when the LLM is unavailable"""
+    return f"""🩺 *{risk} risk* – {CANNED_ADVICE_NOTE}.
+
+Current readings: ❤️ {vitals['heart_rate']} bpm | 🫁 SpO2 {vitals['spo2']}% | 🌡️ {vitals['temperature']} °C
+
+• Check on the patient in person and confirm the readings
+• Keep them seated or lying down, calm and comfortable
+• Loosen tight clothing and make sure the room is well ventilated
+• Recheck vitals every 5 minutes
+• 🚑 Call emergency services if SpO2 stays below 92%, breathing is difficult or they become unresponsive"""
+
+
+def is_canned_advice(advice):
+    return CANNED_ADVICE_NOTE in (advice or "")
+
+
+CSV_COLUMNS = ("timestamp", "device_id", "name", "heart_rate", "spo2", "temperature",
+               "humidity", "room_temp", "aqi")
+
+
+def csv_line(timestamp, device_id, name, readings):
+    """Row for esp32_sensor_log.csv"""
+    return (f"{timestamp},{device_id},{name},{readings['heart_rate']},{readings['spo2']},"
+            f"{readings['temperature']},{readings['humidity']},{readings['room_temp']},{readings['aqi']}\n")
+
+
+def parse_activity_updates(data):
+    """
+    Accepts one update, a list of updates, or {"updates": [...]}.
+    Returns the updates that carry an activity, or None if the body is not JSON.
+    """
+    if isinstance(data, dict) and isinstance(data.get("updates"), list):
+        updates = data["updates"]
+    elif isinstance(data, list):
+        updates = data
+    elif isinstance(data, dict):
+        updates = [data]
+    else:
+        return None
+    return [u for u in updates if isinstance(u, dict) and u.get("activity")]
@@ -0,0 +1,83 @@
+"""
+Production launcher: pre-forks N server workers on one listening socket.
+
+Workers share dashboard state through the SQLite shared-state backend, so a
+reading ingested by one worker is what every other worker's /data returns.
+
+    python launcher.py                       # Flask app, one worker per core
+    python launcher.py --workers 4 --threads 8
+    python launcher.py --asgi                # asgi_server.py under uvicorn workers
+
+Linux/macOS only (uses gunicorn); on Windows run server.py directly.
+"""
+
+import argparse
+import os
+
+from gunicorn.app.base import BaseApplication
+
+
+class Launcher(BaseApplication):
+    def __init__(self, app_uri, options):
+        self.app_uri = app_uri
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # Imported in each worker after the fork: threads (alert dispatcher,
+        # log listener, pools) and DB connections must not cross a fork
+        from gunicorn.util import import_app
+        return import_app(self.app_uri)
+
+
+def reset_shared_state(server):
+    """Fresh dashboard state on every launch, like a single server.py start"""
+    from shared_state import SQLiteStore
+    SQLiteStore(os.environ["STATE_DB"]).clear()
+    print(f"🗂️ Shared state: {os.environ['STATE_DB']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the server with several worker processes")
+    parser.add_argument("--bind", default=os.getenv("BIND", "0.0.0.0:5000"))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", os.cpu_count() or 2)))
+    parser.add_argument("--threads", type=int, default=int(os.getenv("WEB_THREADS", 4)),
+                        help="Threads per worker (Flask mode)")
+    parser.add_argument("--asgi", action="store_true", help="Serve asgi_server.py with uvicorn workers")
+    parser.add_argument("--timeout", type=int, default=30)
+    args = parser.parse_args()
+
+    # Must be set before workers import server.py
+    os.environ["STATE_BACKEND"] = "sqlite"
+    os.environ.setdefault("STATE_DB", "shared_state.db")
+    # server.py sizes its long-poll cap from the thread count
+    os.environ["WEB_THREADS"] = str(args.threads)
+
+    options = {
+        "bind": args.bind,
+        "workers": args.workers,
+        "timeout": args.timeout,
+        "graceful_timeout": 10,
+        "keepalive": 75,
+        "preload_app": False,
+        "on_starting": reset_shared_state,
+        "accesslog": None,
+    }
+    if args.asgi:
+        app_uri = "asgi_server:app"
+        options["worker_class"] = "uvicorn.workers.UvicornWorker"
+    else:
+        app_uri = "server:app"
+        options["worker_class"] = "gthread"
+        options["threads"] = args.threads
+
+    print(f"🚀 Starting {args.workers} workers ({'asgi' if args.asgi else 'flask'}) on {args.bind}")
+    Launcher(app_uri, options).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Load generator: a synthetic fleet of ESP32 devices posting to /esp32.
+
+Each simulated device sends vitals and room readings at a fixed rate, drifts
+into High-risk episodes now and then, and raises fall / emergency events at
+configurable rates. The fleet is ramped through increasing device counts;
+every step reports throughput, latency percentiles and error rates, and the
+first step the server cannot keep up with is reported as the saturation
+point. Results are saved per git commit so two commits can be compared.
+
+Run the server against local stand-ins so no real MySQL, Groq or Twilio is
+touched (and ingest rate limits raised, since all devices share one IP):
+
+    STANDINS=all RATE_INGEST_IP_RATE=100000 RATE_INGEST_IP_BURST=100000 python server.py
+    python loadgen.py --ramp 5,10,25,50,100 --step-seconds 20
+    python loadgen.py --ramp 5,10,25,50,100 --baseline 1a2b3c4   # compare with a saved run
+    python loadgen.py --diff loadgen_results/1a2b3c4.json loadgen_results/5d6e7f8.json
+
+Latency is measured from when a request was due, not when it was sent, so a
+backed-up device still counts the time it spent waiting (no coordinated
+omission).
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+from device_auth import signed_post
+
+RESULTS_DIR = "loadgen_results"
+
+
+def percentiles(samples):
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    s = sorted(samples)
+
+    def pct(p):
+        return round(s[min(len(s) - 1, int(p / 100 * len(s)))] * 1000, 2)
+
+    return {"p50": pct(50), "p95": pct(95), "p99": pct(99), "max": round(s[-1] * 1000, 2)}
+
+
+class SimulatedDevice:
+    """One ESP32: vitals as a bounded random walk around a personal baseline"""
+
+    def __init__(self, device_id, rng, high_risk_share, falls_per_hour, emergencies_per_hour, rate):
+        self.device_id = device_id
+        self.rng = rng
+        self.base = {
+            "heart_rate": rng.uniform(62, 85),
+            "spo2": rng.uniform(96, 99),
+            "temperature": rng.uniform(36.3, 36.9),
+        }
+        self.vitals = dict(self.base)
+        self.room = {"humidity": rng.uniform(40, 65), "room_temp": rng.uniform(20, 27), "aqi": rng.uniform(30, 90)}
+        self.high_risk_share = high_risk_share
+        # Per-payload probabilities from per-hour rates
+        self.p_fall = falls_per_hour / (3600.0 * rate)
+        self.p_emergency = emergencies_per_hour / (3600.0 * rate)
+        self.episode_left = 0
+
+    def _step_vitals(self):
+        if self.episode_left == 0 and self.rng.random() < self.high_risk_share / 20:
+            # Episodes last ~20 readings, so high_risk_share of readings are abnormal
+            self.episode_left = self.rng.randint(10, 30)
+        if self.episode_left:
+            self.episode_left -= 1
+            target = {"heart_rate": 128.0, "spo2": 88.0, "temperature": 38.6}
+        else:
+            target = self.base
+        for key, spread in (("heart_rate", 2.0), ("spo2", 0.3), ("temperature", 0.05)):
+            value = self.vitals[key]
+            value += (target[key] - value) * 0.3 + self.rng.gauss(0, spread)
+            self.vitals[key] = value
+        self.vitals["spo2"] = min(self.vitals["spo2"], 100.0)
+        for key, spread in (("humidity", 0.5), ("room_temp", 0.1), ("aqi", 2.0)):
+            self.room[key] = max(0.0, self.room[key] + self.rng.gauss(0, spread))
+
+    def payload(self):
+        self._step_vitals()
+        payload = {
+            "device_id": self.device_id,
+            "heart_rate": round(self.vitals["heart_rate"]),
+            "spo2": round(self.vitals["spo2"], 1),
+            "temperature": round(self.vitals["temperature"], 1),
+            "humidity": round(self.room["humidity"], 1),
+            "room_temp": round(self.room["room_temp"], 1),
+            "aqi": round(self.room["aqi"]),
+        }
+        if self.rng.random() < self.p_fall:
+            payload["fall"] = True
+        if self.rng.random() < self.p_emergency:
+            payload["emergency"] = True
+        return payload
+
+
+class StepResult:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.ok = 0
+        self.throttled = 0
+        self.errors = {}
+
+    def record(self, latency, outcome):
+        with self.lock:
+            if outcome == "ok":
+                self.ok += 1
+                self.latencies.append(latency)
+            elif outcome == "429":
+                self.throttled += 1
+            else:
+                self.errors[outcome] = self.errors.get(outcome, 0) + 1
+
+
+def run_device(device, url, key, rate, timeout, deadline, result):
+    session = requests.Session()
+    interval = 1.0 / rate
+    due = time.perf_counter() + device.rng.uniform(0, interval)  # spread the fleet out
+    while True:
+        now = time.perf_counter()
+        if due > now:
+            time.sleep(due - now)
+        if due >= deadline:
+            break
+        try:
+            response = signed_post(session, url, device.payload(), device.device_id, key=key, timeout=timeout)
+            outcome = "ok" if response.status_code < 400 else str(response.status_code)
+        except requests.Timeout:
+            outcome = "timeout"
+        except requests.RequestException:
+            outcome = "connection"
+        result.record(time.perf_counter() - due, outcome)
+        due += interval
+    session.close()
+
+
+def run_step(args, devices, keys):
+    result = StepResult()
+    url = args.url.rstrip("/") + "/esp32"
+    start = time.perf_counter()
+    deadline = start + args.step_seconds
+    threads = [
+        threading.Thread(
+            target=run_device,
+            args=(d, url, keys.get(d.device_id), args.rate, args.timeout, deadline, result),
+            daemon=True,
+        )
+        for d in devices
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    sent = result.ok + result.throttled + sum(result.errors.values())
+    errors = sum(result.errors.values())
+    offered = len(devices) * args.rate
+    return {
+        "devices": len(devices),
+        "offered_rps": round(offered, 2),
+        "throughput_rps": round(result.ok / elapsed, 2),
+        "requests": sent,
+        "ok": result.ok,
+        "throttled": result.throttled,
+        "errors": result.errors,
+        "error_rate": round(errors / sent, 4) if sent else None,
+        "latency_ms": percentiles(result.latencies),
+        "seconds": round(elapsed, 1),
+    }
+
+
+def is_saturated(step, args):
+    reasons = []
+    if step["throughput_rps"] < 0.9 * step["offered_rps"]:
+        reasons.append("throughput below 90% of offered load")
+    if step["error_rate"] and step["error_rate"] > args.max_error_rate:
+        reasons.append(f"error rate {step['error_rate']:.2%}")
+    p95 = step["latency_ms"]["p95"]
+    if p95 is not None and p95 > args.slo_ms:
+        reasons.append(f"p95 {p95} ms over {args.slo_ms} ms")
+    return reasons
+
+
+def wait_until_ready(url, seconds=60):
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        try:
+            if requests.get(url.rstrip("/") + "/readyz", timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    return False
+
+
+def git_revision():
+    try:
+        sha = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+        dirty = bool(subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], text=True).strip())
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+    return sha, dirty
+
+
+def load_keys(path):
+    if not path:
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def results_path(name):
+    """A saved run by path or by git sha"""
+    if os.path.exists(name):
+        return name
+    return os.path.join(RESULTS_DIR, f"{name}.json")
+
+
+def print_step(step, saturated):
+    lat = step["latency_ms"]
+    flag = "  <- SATURATED" if saturated else ""
+    print(f"  {step['devices']:>5} dev | offered {step['offered_rps']:>7} rps | done {step['throughput_rps']:>7} rps | "
+          f"p50 {lat['p50']} p95 {lat['p95']} p99 {lat['p99']} ms | "
+          f"err {step['error_rate']} | 429 {step['throttled']}{flag}")
+
+
+def compare(old, new):
+    print(f"\n📊 {old['git_sha']} -> {new['git_sha']}")
+    old_steps = {s["devices"]: s for s in old["steps"]}
+    for step in new["steps"]:
+        before = old_steps.get(step["devices"])
+        if before is None:
+            continue
+        print(f"  {step['devices']:>5} dev | rps {before['throughput_rps']} -> {step['throughput_rps']} | "
+              f"p95 {before['latency_ms']['p95']} -> {step['latency_ms']['p95']} ms | "
+              f"err {before['error_rate']} -> {step['error_rate']}")
+    print(f"  sustained: {old['sustained_rps']} -> {new['sustained_rps']} rps")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic ESP32 fleet load test")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--ramp", default="5,10,25,50,100", help="Device counts, one step each")
+    parser.add_argument("--step-seconds", type=float, default=20)
+    parser.add_argument("--rate", type=float, default=1.0, help="Payloads per second per device")
+    parser.add_argument("--high-risk-share", type=float, default=0.05, help="Share of readings in a High-risk episode")
+    parser.add_argument("--falls-per-hour", type=float, default=2.0, help="Per device")
+    parser.add_argument("--emergencies-per-hour", type=float, default=1.0, help="Per device")
+    parser.add_argument("--keys", help="device_keys.json; devices esp32-load-<n> found in it sign requests")
+    parser.add_argument("--timeout", type=float, default=5.0)
+    parser.add_argument("--slo-ms", type=float, default=1000, help="p95 above this counts as saturated")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--keep-going", action="store_true", help="Run every step even after saturation")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baseline", help="Saved run (path or git sha) to compare against")
+    parser.add_argument("--diff", nargs=2, metavar=("OLD", "NEW"), help="Compare two saved runs and exit")
+    args = parser.parse_args()
+
+    if args.diff:
+        with open(results_path(args.diff[0])) as f:
+            old = json.load(f)
+        with open(results_path(args.diff[1])) as f:
+            new = json.load(f)
+        compare(old, new)
+        return
+
+    if not wait_until_ready(args.url):
+        print(f"❌ {args.url} is not ready (GET /readyz)")
+        return
+
+    keys = load_keys(args.keys)
+    rng = random.Random(args.seed)
+    ramp = [int(n) for n in args.ramp.split(",")]
+    fleet = [
+        SimulatedDevice(f"esp32-load-{i:04d}", random.Random(rng.random()), args.high_risk_share,
+                        args.falls_per_hour, args.emergencies_per_hour, args.rate)
+        for i in range(max(ramp))
+    ]
+
+    sha, dirty = git_revision()
+    print(f"🚀 Load test against {args.url} at {sha}{' (dirty)' if dirty else ''}")
+    steps = []
+    saturation = None
+    for count in ramp:
+        step = run_step(args, fleet[:count], keys)
+        reasons = is_saturated(step, args)
+        step["saturated"] = reasons
+        steps.append(step)
+        print_step(step, bool(reasons))
+        if reasons and saturation is None:
+            saturation = {"devices": count, "offered_rps": step["offered_rps"], "reasons": reasons}
+            if not args.keep_going:
+                break
+
+    healthy = [s for s in steps if not s["saturated"]]
+    sustained = max((s["throughput_rps"] for s in healthy), default=0.0)
+    if saturation:
+        print(f"🔴 Saturated at {saturation['devices']} devices: {', '.join(saturation['reasons'])}")
+    else:
+        print("🟢 No saturation within the ramp")
+    print(f"📈 Sustained throughput: {sustained} rps")
+
+    run = {
+        "git_sha": sha,
+        "dirty": dirty,
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("baseline", "diff", "keys")},
+        "steps": steps,
+        "saturation": saturation,
+        "sustained_rps": sustained,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{sha}{'-dirty' if dirty else ''}.json")
+    with open(path, "w") as f:
+        json.dump(run, f, indent=2)
+    print(f"💾 Saved {path}")
+
+    if args.baseline:
+        with open(results_path(args.baseline)) as f:
+            compare(json.load(f), run)
+
+
+if __name__ == "__main__":
+    main()
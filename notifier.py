@@ -0,0 +1,266 @@
+import json
+import os
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.text import MIMEText
+
+import requests
+
+from metrics import stage
+
+
+def _split(value):
+    return [v.strip() for v in (value or "").split(",") if v.strip()]
+
+
+# Alert types that are never expired or dropped, however long the queue
+CRITICAL_ALERT_TYPES = ("emergency", "fall")
+
+
+class Channel:
+    """
+    A notification backend. Subclasses implement deliver(recipient, subject, message).
+    - max_concurrency: deliveries in flight at once on this channel
+    - timeout: per-delivery network timeout
+    - max_queue_age: the longest a delivery may wait (queue + retries) before
+      it is dropped as expired; separate from, and much longer than, timeout
+    - max_queue: deliveries waiting beyond this are dropped immediately
+    - retries / backoff: failed deliveries are retried after backoff, 2x backoff, ...
+    Critical alert types (emergency, fall) are never expired or dropped.
+    """
+
+    name = "channel"
+
+    def __init__(self, recipients, max_concurrency=4, timeout=10.0, max_queue=100, retries=3,
+                 backoff=2.0, max_queue_age=600.0):
+        self.recipients = list(recipients)
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_queue = max_queue
+        self.retries = retries
+        self.backoff = backoff
+        self.max_queue_age = max_queue_age
+
+    def deliver(self, recipient, subject, message):
+        raise NotImplementedError
+
+
+class WhatsAppChannel(Channel):
+    name = "whatsapp"
+
+    def __init__(self, agent, recipients, **kwargs):
+        super().__init__(recipients, **kwargs)
+        self.agent = agent
+
+    def deliver(self, recipient, subject, message):
+        if not self.agent.send_alert(message, to=recipient):
+            raise RuntimeError("WhatsApp send failed")
+
+
+class EmailChannel(Channel):
+    name = "email"
+
+    def __init__(self, recipients, server, port, user, password, **kwargs):
+        super().__init__(recipients, **kwargs)
+        self.server = server
+        self.port = port
+        self.user = user
+        self.password = password
+
+    def deliver(self, recipient, subject, message):
+        msg = MIMEText(message)
+        msg['Subject'] = subject
+        msg['From'] = self.user
+        msg['To'] = recipient
+        with smtplib.SMTP(self.server, self.port, timeout=self.timeout) as server:
+            server.starttls()
+            server.login(self.user, self.password)
+            server.send_message(msg)
+
+
+class WebhookChannel(Channel):
+    name = "webhook"
+
+    def __init__(self, recipients, **kwargs):
+        super().__init__(recipients, **kwargs)
+        self.session = requests.Session()
+
+    def deliver(self, recipient, subject, message):
+        response = self.session.post(recipient, json={"subject": subject, "message": message,
+                                                      "ts": time.time()}, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class FileChannel(Channel):
+    """Local stand-in channel: appends every notification to a JSONL file"""
+
+    name = "file"
+
+    def __init__(self, path, latency=0.0, **kwargs):
+        super().__init__([path], **kwargs)
+        self.latency = latency
+        self._lock = threading.Lock()
+
+    def deliver(self, recipient, subject, message):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            with open(recipient, "a") as f:
+                f.write(json.dumps({"ts": time.time(), "subject": subject, "message": message}) + "\n")
+
+
+class _ChannelStats:
+    def __init__(self, max_samples=500):
+        self.lock = threading.Lock()
+        self.counts = {"delivered": 0, "failed": 0, "expired": 0, "dropped": 0, "retries": 0}
+        self.queued = 0
+        self.latencies = []
+        self.max_samples = max_samples
+
+    def record_latency(self, seconds):
+        with self.lock:
+            self.latencies.append(seconds)
+            if len(self.latencies) > self.max_samples:
+                del self.latencies[:len(self.latencies) - self.max_samples]
+
+    def snapshot(self):
+        with self.lock:
+            samples = sorted(self.latencies)
+            counts = dict(self.counts)
+            queued = self.queued
+
+        def pct(p):
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(p / 100 * len(samples)))] * 1000, 1)
+
+        return dict(counts, queued=queued,
+                    latency_ms={"p50": pct(50), "p95": pct(95), "max": pct(100)})
+
+
+class Notifier:
+    """
+    Fans an alert out to every recipient of every configured channel.
+
+    Each channel has its own thread pool sized to its concurrency cap, so a
+    slow or hanging channel only ever delays its own deliveries. notify()
+    returns as soon as the deliveries are queued; retries happen here, per
+    channel and recipient, so a recipient that already got the alert is
+    never sent it twice. Outcomes are in get_stats().
+    """
+
+    def __init__(self, channels):
+        self.channels = channels
+        self._executors = {
+            c.name: ThreadPoolExecutor(max_workers=c.max_concurrency, thread_name_prefix=f"notify-{c.name}")
+            for c in channels
+        }
+        self._stats = {c.name: _ChannelStats() for c in channels}
+
+    def notify(self, message, subject=None, alert_type=None):
+        """Queue the message on all channels; returns False if nothing could be queued"""
+        if subject is None:
+            first_line = message.strip().splitlines()[0] if message.strip() else "Alert"
+            subject = f"HealthGuard: {first_line[:80]}"
+        critical = alert_type in CRITICAL_ALERT_TYPES
+
+        queued = 0
+        for channel in self.channels:
+            stats = self._stats[channel.name]
+            for recipient in channel.recipients:
+                with stats.lock:
+                    if stats.queued >= channel.max_queue and not critical:
+                        stats.counts["dropped"] += 1
+                        continue
+                    stats.queued += 1
+                self._submit(channel, recipient, subject, message, time.time(), critical, 0)
+                queued += 1
+        return queued > 0
+
+    def _submit(self, channel, recipient, subject, message, enqueued_at, critical, attempt):
+        self._executors[channel.name].submit(
+            self._deliver, channel, recipient, subject, message, enqueued_at, critical, attempt
+        )
+
+    def _deliver(self, channel, recipient, subject, message, enqueued_at, critical, attempt):
+        stats = self._stats[channel.name]
+        if not critical and time.time() - enqueued_at > channel.max_queue_age:
+            self._finish(stats, "expired")
+            return
+
+        start = time.perf_counter()
+        try:
+            with stage(f"notify_{channel.name}"):
+                channel.deliver(recipient, subject, message)
+        except Exception as e:
+            print(f"❌ Notify [{channel.name}] to {recipient} failed (attempt {attempt + 1}): {e}")
+            if attempt < channel.retries:
+                with stats.lock:
+                    stats.counts["retries"] += 1
+                # Back off on a timer, not in the pool: a failing channel keeps its workers free
+                retry = threading.Timer(channel.backoff * (2 ** attempt), self._submit,
+                                        (channel, recipient, subject, message, enqueued_at, critical, attempt + 1))
+                retry.daemon = True
+                retry.start()
+                return
+            self._finish(stats, "failed")
+            return
+
+        stats.record_latency(time.perf_counter() - start)
+        self._finish(stats, "delivered")
+
+    def _finish(self, stats, outcome):
+        with stats.lock:
+            stats.counts[outcome] += 1
+            stats.queued -= 1
+
+    def get_stats(self):
+        return {name: stats.snapshot() for name, stats in self._stats.items()}
+
+
+def build_notifier_from_env(whatsapp_agent=None):
+    """
+    NOTIFY_CHANNELS=whatsapp,email,file,webhook (default: whatsapp)
+    Per channel: NOTIFY_<NAME>_CONCURRENCY, NOTIFY_<NAME>_TIMEOUT,
+    NOTIFY_<NAME>_RETRIES, NOTIFY_<NAME>_MAX_QUEUE_AGE
+    """
+    names = _split(os.getenv("NOTIFY_CHANNELS", "whatsapp"))
+
+    def limits(name):
+        key = name.upper()
+        return {
+            "max_concurrency": int(os.getenv(f"NOTIFY_{key}_CONCURRENCY", 4)),
+            "timeout": float(os.getenv(f"NOTIFY_{key}_TIMEOUT", 10)),
+            "retries": int(os.getenv(f"NOTIFY_{key}_RETRIES", 3)),
+            "max_queue_age": float(os.getenv(f"NOTIFY_{key}_MAX_QUEUE_AGE", 600)),
+        }
+
+    channels = []
+    if "whatsapp" in names and whatsapp_agent is not None:
+        recipients = _split(os.getenv("WHATSAPP_RECIPIENTS") or os.getenv("DOCTOR_WHATSAPP_NUMBER"))
+        channels.append(WhatsAppChannel(whatsapp_agent, recipients, **limits("whatsapp")))
+
+    if "email" in names:
+        recipients = _split(os.getenv("EMAIL_RECIPIENTS"))
+        if recipients:
+            channels.append(EmailChannel(
+                recipients,
+                os.getenv("SMTP_SERVER", "smtp.gmail.com"),
+                int(os.getenv("SMTP_PORT", 587)),
+                os.getenv("SMTP_USER", ""),
+                os.getenv("SMTP_PASS", ""),
+                **limits("email")
+            ))
+
+    if "webhook" in names:
+        recipients = _split(os.getenv("NOTIFY_WEBHOOK_URLS"))
+        if recipients:
+            channels.append(WebhookChannel(recipients, **limits("webhook")))
+
+    if "file" in names:
+        channels.append(FileChannel(os.getenv("NOTIFY_FILE", "notifications.jsonl"), **limits("file")))
+
+    print(f"📣 Notification channels: {', '.join(c.name for c in channels) or 'none'}")
+    return Notifier(channels)
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Offline posture classification for recorded video.
+
+Decodes archived ward video as fast as possible, runs every frame through
+SimplePostureDetector and writes a compact activity timeline per file.
+Files are spread across worker processes; interrupted runs resume where
+they stopped.
+
+Usage:
+    python posture_batch.py ward_video/ --workers 4 --output timelines/
+    python posture_batch.py night.mp4 --per-frame --stride 2
+"""
+
+import argparse
+import csv
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+from posture_detector import SimplePostureDetector
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mkv", ".mov", ".m4v", ".webm")
+DEFAULT_FPS = 30.0
+
+
+def find_videos(path):
+    """A single file, or every video file below a directory"""
+    if os.path.isfile(path):
+        return [path]
+    videos = []
+    for root, _, files in os.walk(path):
+        for file in sorted(files):
+            if file.lower().endswith(VIDEO_EXTENSIONS):
+                videos.append(os.path.join(root, file))
+    return sorted(videos)
+
+
+def timeline_path(video, input_root, output_dir):
+    base = os.path.dirname(input_root) if os.path.isfile(input_root) else input_root
+    rel = os.path.relpath(video, base)
+    return os.path.join(output_dir, rel + ".timeline.csv")
+
+
+def resume_point(part_path):
+    """Next frame to process, taken from the last row already written to the .part file"""
+    if not os.path.exists(part_path):
+        return 0
+    last_frame = -1
+    with open(part_path, newline="") as f:
+        for row in csv.reader(f):
+            if row and row[0].isdigit():
+                # Segment rows: start,end,...; per-frame rows: frame,...
+                last_frame = int(row[1]) if len(row) == 5 else int(row[0])
+    return last_frame + 1
+
+
+def put_until_stopped(out_queue, item, stop_event):
+    """Bounded put that gives up once the consumer has stopped, so the reader never hangs"""
+    while not stop_event.is_set():
+        try:
+            out_queue.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def read_batches(cap, batch_size, stride, out_queue, stop_event, errors):
+    """Decode frames in batches on a separate thread (OpenCV releases the GIL while decoding)"""
+    try:
+        index = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+        while not stop_event.is_set():
+            batch = []
+            while len(batch) < batch_size:
+                if not cap.grab():
+                    break
+                if (index % stride) == 0:
+                    ok, frame = cap.retrieve()
+                    if not ok:
+                        break
+                    batch.append((index, frame))
+                index += 1
+            else:
+                if not put_until_stopped(out_queue, batch, stop_event):
+                    return
+                continue
+            # End of stream
+            put_until_stopped(out_queue, batch, stop_event)
+            return
+    except Exception as e:
+        errors.append(f"decode: {e}")
+    finally:
+        # Sentinel: the worker stops reading even if decoding failed
+        put_until_stopped(out_queue, None, stop_event)
+
+
+def process_video(job):
+    """Worker entry point: any error is reported for this file instead of aborting the run"""
+    try:
+        return classify_video(*job)
+    except Exception as e:
+        return {"video": job[0], "error": f"{type(e).__name__}: {e}"}
+
+
+def classify_video(video, out_path, per_frame, batch_size, stride, scale):
+    """Classify one video and write its timeline"""
+    cv2.setNumThreads(1)  # One core per worker process
+
+    part_path = out_path + ".part"
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+
+    cap = cv2.VideoCapture(video)
+    if not cap.isOpened():
+        return {"video": video, "error": "could not open"}
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+    start_frame = resume_point(part_path)
+    if start_frame:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+    detector = SimplePostureDetector(server_url=None, scale=scale)
+
+    batches = queue.Queue(maxsize=4)
+    stop_event = threading.Event()
+    reader_errors = []
+    reader = threading.Thread(target=read_batches,
+                              args=(cap, batch_size, stride, batches, stop_event, reader_errors), daemon=True)
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    frames = 0
+    frame_errors = 0
+    segment = None  # [start_frame, end_frame, activity]
+
+    new_file = not os.path.exists(part_path)
+    with open(part_path, "a", newline="") as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(["frame", "seconds", "activity"] if per_frame
+                            else ["start_frame", "end_frame", "start_sec", "end_sec", "activity"])
+
+        def write_segment(seg):
+            writer.writerow([seg[0], seg[1], f"{seg[0] / fps:.2f}", f"{(seg[1] + 1) / fps:.2f}", seg[2]])
+
+        reader.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    break
+
+                for index, frame in batch:
+                    try:
+                        activity = detector.smooth_prediction(detector.detect_posture(frame))
+                    except Exception as e:
+                        # One bad frame is skipped; its neighbours still get classified
+                        if frame_errors == 0:
+                            print(f"⚠ {video} frame {index}: {e}")
+                        frame_errors += 1
+                        continue
+                    frames += 1
+
+                    if per_frame:
+                        writer.writerow([index, f"{index / fps:.2f}", activity])
+                    elif segment is None:
+                        segment = [index, index, activity]
+                    elif activity == segment[2]:
+                        segment[1] = index
+                    else:
+                        write_segment(segment)
+                        segment = [index, index, activity]
+
+                # Checkpoint after every batch so a crash loses at most one batch
+                f.flush()
+        finally:
+            stop_event.set()
+            reader.join(timeout=5)
+
+        if segment is not None:
+            write_segment(segment)
+
+    cap.release()
+    if reader_errors:
+        # Keep the .part file: the next run resumes after the last good batch
+        return {"video": video, "error": reader_errors[0]}
+    os.replace(part_path, out_path)
+
+    return {
+        "video": video,
+        "frames": frames,
+        "resumed_from": start_frame,
+        "frame_errors": frame_errors,
+        "wall_seconds": time.perf_counter() - wall_start,
+        "cpu_seconds": time.process_time() - cpu_start,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline posture classification for recorded video")
+    parser.add_argument("input", help="Video file or directory of videos")
+    parser.add_argument("--output", default="timelines", help="Directory for timeline CSV files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--batch-size", type=int, default=64, help="Frames decoded per batch")
+    parser.add_argument("--stride", type=int, default=1, help="Classify every Nth frame")
+    parser.add_argument("--scale", type=float, default=0.25, help="Detector downscale factor")
+    parser.add_argument("--per-frame", action="store_true", help="One row per frame instead of segments")
+    parser.add_argument("--force", action="store_true", help="Re-process videos that already have a timeline")
+    args = parser.parse_args()
+
+    videos = find_videos(args.input)
+    if not videos:
+        print(f"❌ No video files found in {args.input}")
+        return
+
+    jobs = []
+    skipped = 0
+    for video in videos:
+        out_path = timeline_path(video, args.input, args.output)
+        if os.path.exists(out_path) and not args.force:
+            skipped += 1
+            continue
+        if args.force and os.path.exists(out_path + ".part"):
+            os.remove(out_path + ".part")
+        jobs.append((video, out_path, args.per_frame, args.batch_size, max(1, args.stride), args.scale))
+
+    workers = max(1, min(args.workers, len(jobs))) if jobs else 1
+    print(f"🎞  {len(videos)} videos | {skipped} already done | {len(jobs)} to process on {workers} workers")
+
+    wall_start = time.perf_counter()
+    total_frames = 0
+    total_cpu = 0.0
+    failed = 0
+
+    with multiprocessing.Pool(workers) as pool:
+        for result in pool.imap_unordered(process_video, jobs):
+            if "error" in result:
+                failed += 1
+                print(f"✗ {result['video']}: {result['error']}")
+                continue
+            total_frames += result["frames"]
+            total_cpu += result["cpu_seconds"]
+            fps = result["frames"] / result["wall_seconds"] if result["wall_seconds"] > 0 else 0
+            resumed = f" (resumed at frame {result['resumed_from']})" if result["resumed_from"] else ""
+            errors = f", {result['frame_errors']} frames failed" if result["frame_errors"] else ""
+            print(f"✓ {result['video']}: {result['frames']} frames at {fps:.0f} FPS{resumed}{errors}")
+
+    wall = time.perf_counter() - wall_start
+    if failed:
+        print(f"\n⚠ {failed} of {len(jobs)} videos failed; re-run to retry them")
+    if total_frames and wall > 0:
+        print(f"\n📊 {total_frames} frames in {wall:.1f}s | {total_frames / wall:.0f} FPS total | "
+              f"{total_frames / wall / workers:.0f} FPS per core "
+              f"({total_frames / total_cpu:.0f} FPS per CPU-second)")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,128 @@ import cv2
 import numpy as np
 import requests
 from datetime import datetime
+import argparse
 import json
+import os
+import queue
+import threading
+import time
+from device_auth import signed_post
 
 # Server config
 SERVER_URL = "http://localhost:5000/activity"
-DEVICE_ID = "camera-01"
+DEVICE_ID = os.getenv("DEVICE_ID", "camera-01")
+DEVICE_KEY = os.getenv("DEVICE_KEY")  # Signs requests when set (see device_auth.py)
+
+# Updates that could not be delivered are kept here and replayed in bulk
+SPOOL_PATH = "activity_spool.jsonl"
+SPOOL_RETRY_SECONDS = 5
+# Throttled / timed out on the server side: keep the update and retry later
+RETRYABLE_STATUS = (408, 429)
+SPOOL_BATCH_SIZE = 500
+
+
+class ActivitySpool:
+    """
+    Append-only on-disk queue of activity updates the server has not accepted.
+    Survives restarts; beyond max_entries the oldest are dropped, down to 90%
+    of the cap so the file is not rewritten on every append while offline.
+
+    Delivered entries are skipped with a read offset (kept in <path>.head)
+    rather than rewriting the file; it is compacted once the delivered part
+    is most of it.
+    """
+
+    def __init__(self, path=SPOOL_PATH, max_entries=10000):
+        self.path = path
+        self.head_path = path + ".head"
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.head = self._read_head()
+        self.count = len(self.load())
+
+    def _read_head(self):
+        try:
+            with open(self.head_path) as f:
+                head = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        return head if 0 <= head <= size else 0
+
+    def _write_head(self):
+        tmp_path = self.head_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(self.head))
+        os.replace(tmp_path, self.head_path)
+
+    def append(self, payload):
+        with self.lock:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(payload) + "\n")
+            self.count += 1
+            if self.count > self.max_entries:
+                self._truncate(int(self.max_entries * 0.9))
+
+    def _read(self, limit=None):
+        """Up to limit entries from the read offset, and the offset after the last one"""
+        entries = []
+        offset = self.head
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(self.head)
+                for line in f:
+                    offset += len(line)
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        continue  # Torn write from a crash
+                    if limit is not None and len(entries) >= limit:
+                        break
+        except FileNotFoundError:
+            pass
+        return entries, offset
+
+    def load(self):
+        return self._read()[0]
+
+    def peek(self, n):
+        """The n oldest entries, without reading the rest of the file"""
+        with self.lock:
+            return self._read(n)[0]
+
+    def remove_first(self, n):
+        """Drop the n oldest entries after they were delivered"""
+        with self.lock:
+            removed, self.head = self._read(n)
+            self.count = max(0, self.count - len(removed))
+            if not self.count:
+                self._truncate(0)
+            elif self.head > os.path.getsize(self.path) // 2:
+                self._truncate(self.count)
+            else:
+                self._write_head()
+
+    def _truncate(self, keep):
+        entries = self.load()[-keep:] if keep > 0 else []
+        self.head = 0
+        if not entries:
+            for path in (self.path, self.head_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.count = 0
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+        # Head first: a crash in between replays entries rather than skipping them
+        self._write_head()
+        os.replace(tmp_path, self.path)
+        self.count = len(entries)
+
+    def __len__(self):
+        return self.count
 
 
 class SimplePostureDetector:
@@ -15,12 +132,41 @@ class SimplePostureDetector:
     Detects standing, sitting, or sleeping based on contour analysis.
     """
     
-    def __init__(self, server_url=SERVER_URL):
+    def __init__(self, server_url=SERVER_URL, scale=0.25, roi_padding=0.5, redetect_interval=30):
         self.server_url = server_url
         self.last_activity = None
         self.activity_history = []
         self.max_history = 5
-        
+
+        # Detection runs on a downscaled image; kernel sizes and the minimum
+        # area were tuned at full 640x480 resolution, so scale them too
+        self.scale = scale
+        self.blur_size = max(3, int(round(21 * scale)) | 1)  # Must be odd
+        self.kernel = cv2.getStructuringElement(
+            cv2.MORPH_ELLIPSE, (max(3, int(round(30 * scale))),) * 2
+        )
+        self.min_area = 500 * scale * scale
+
+        # ROI tracking: after a detection only a padded box around the person
+        # is processed, with a periodic full-frame pass to re-acquire
+        self.roi_padding = roi_padding
+        self.redetect_interval = redetect_interval
+        self.track_box = None  # (x, y, w, h) in full-frame pixels
+        self.frames_since_full = 0
+        self.stats = {"full_frame": 0, "roi": 0, "track_lost": 0}
+
+        # Keep-alive HTTP session, reused for every update; offline use
+        # (server_url=None, e.g. posture_batch.py) opens neither it nor the spool
+        self.session = requests.Session() if server_url else None
+        self.spool = ActivitySpool() if server_url else None
+        self.last_spool_attempt = 0
+        self.retry_not_before = 0  # From the server's Retry-After
+
+        # Optional non-blocking publish hook (see PosturePipeline); when unset,
+        # process_frame sends synchronously as before
+        self.publisher = None
+        self.last_queued = None
+
     def detect_posture(self, frame):
         """
         Detect posture using simple contour analysis.
@@ -28,54 +174,26 @@ class SimplePostureDetector:
         - Sitting: Shorter, wider contour, centered
         - Sleeping: Very wide, low contour (person lying down)
         """
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        
-        # Background subtraction / simple foreground detection
-        blur = cv2.GaussianBlur(gray, (21, 21), 0)
-        
-        # Threshold to find body
-        _, thresh = cv2.threshold(blur, 100, 255, cv2.THRESH_BINARY)
-        
-        # Morphological operations
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (30, 30))
-        thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
-        thresh = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel)
-        
-        # Find contours
-        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        if len(contours) == 0:
-            return "Unknown"
-        
-        # Get the largest contour (should be the person)
-        largest_contour = max(contours, key=cv2.contourArea)
-        area = cv2.contourArea(largest_contour)
-        
-        if area < 500:  # Too small to be a person
+        person = self.locate_person(frame)
+        if person is None:
             return "Unknown"
-        
-        # Get bounding box
-        x, y, w, h = cv2.boundingRect(largest_contour)
-        
+
+        x, y, w, h, cx, cy = person
+
         # Calculate aspect ratio (height / width)
         aspect_ratio = h / (w + 1e-5)
-        
-        # Get center of mass
-        M = cv2.moments(largest_contour)
-        if M["m00"] != 0:
-            cx = int(M["m10"] / M["m00"])
-            cy = int(M["m01"] / M["m00"])
-        else:
-            cx, cy = x + w // 2, y + h // 2
-        
-        # Heuristic-based classification
+
+        # Geometry is already mapped back to full-frame pixels
+        frame_height = frame.shape[0]
+        vertical_position = cy / frame_height  # 0 = top, 1 = bottom
+
+        return self.classify(aspect_ratio, vertical_position)
+
+    def classify(self, aspect_ratio, vertical_position):
+        """Heuristic posture classification from bounding box shape"""
         # Standing: tall (aspect_ratio > 1.2), centered vertically
         # Sitting: medium height (0.8 < aspect_ratio < 1.2), lower in frame
         # Sleeping: wide and short (aspect_ratio < 0.8), very low in frame
-        
-        frame_height = frame.shape[0]
-        vertical_position = cy / frame_height  # 0 = top, 1 = bottom
-        
         if aspect_ratio > 1.5:
             # Tall shape
             if vertical_position < 0.6:
@@ -94,7 +212,113 @@ class SimplePostureDetector:
         else:
             # Very wide and short
             return "Sleeping"
-    
+
+    def locate_person(self, frame):
+        """
+        Find the person's bounding box and centroid in full-frame pixels.
+        Uses the tracked ROI when possible and falls back to the full frame
+        when the track is lost.
+        """
+        frame_h, frame_w = frame.shape[:2]
+        full = (0, 0, frame_w, frame_h)
+
+        roi = self._tracking_roi(frame_w, frame_h)
+        if roi is not None:
+            person = self._find_person(frame, roi)
+            if person is not None and not self._touches_roi_edge(person, roi, full):
+                self.stats["roi"] += 1
+                self.frames_since_full += 1
+                self.track_box = person[:4]
+                return person
+            self.stats["track_lost"] += 1
+
+        person = self._find_person(frame, full)
+        self.stats["full_frame"] += 1
+        self.frames_since_full = 0
+        self.track_box = person[:4] if person is not None else None
+        return person
+
+    def reset_tracking(self):
+        self.track_box = None
+        self.frames_since_full = 0
+
+    def _tracking_roi(self, frame_w, frame_h):
+        if self.track_box is None or self.frames_since_full >= self.redetect_interval:
+            return None
+
+        x, y, w, h = self.track_box
+        pad_x = int(w * self.roi_padding)
+        pad_y = int(h * self.roi_padding)
+        x0 = max(0, x - pad_x)
+        y0 = max(0, y - pad_y)
+        x1 = min(frame_w, x + w + pad_x)
+        y1 = min(frame_h, y + h + pad_y)
+        return (x0, y0, x1 - x0, y1 - y0)
+
+    def _touches_roi_edge(self, person, roi, full):
+        """A box clipped by the ROI (but not by the frame) means the person moved out of it"""
+        x, y, w, h = person[:4]
+        rx, ry, rw, rh = roi
+        margin = max(1, int(round(1 / self.scale)))
+        return (
+            (rx > full[0] and x <= rx + margin) or
+            (ry > full[1] and y <= ry + margin) or
+            (rx + rw < full[2] and x + w >= rx + rw - margin) or
+            (ry + rh < full[3] and y + h >= ry + rh - margin)
+        )
+
+    def _find_person(self, frame, roi):
+        rx, ry, rw, rh = roi
+        crop = frame[ry:ry + rh, rx:rx + rw]
+
+        small_w = max(1, int(rw * self.scale))
+        small_h = max(1, int(rh * self.scale))
+        small = cv2.resize(crop, (small_w, small_h), interpolation=cv2.INTER_AREA)
+
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+        # Background subtraction / simple foreground detection
+        blur = cv2.GaussianBlur(gray, (self.blur_size, self.blur_size), 0)
+
+        # Threshold to find body
+        _, thresh = cv2.threshold(blur, 100, 255, cv2.THRESH_BINARY)
+
+        # Morphological operations
+        thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, self.kernel)
+        thresh = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, self.kernel)
+
+        # Find contours
+        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        if len(contours) == 0:
+            return None
+
+        # Get the largest contour (should be the person)
+        largest_contour = max(contours, key=cv2.contourArea)
+        area = cv2.contourArea(largest_contour)
+
+        if area < self.min_area:  # Too small to be a person
+            return None
+
+        # Get bounding box
+        x, y, w, h = cv2.boundingRect(largest_contour)
+
+        # Get center of mass
+        M = cv2.moments(largest_contour)
+        if M["m00"] != 0:
+            cx = M["m10"] / M["m00"]
+            cy = M["m01"] / M["m00"]
+        else:
+            cx, cy = x + w / 2, y + h / 2
+
+        # Map back to full-frame pixels
+        sx = rw / small_w
+        sy = rh / small_h
+        return (
+            rx + int(x * sx), ry + int(y * sy), int(w * sx), int(h * sy),
+            int(rx + cx * sx), int(ry + cy * sy)
+        )
+
     def smooth_prediction(self, current_activity):
         """Apply smoothing to reduce jitter"""
         self.activity_history.append(current_activity)
@@ -108,14 +332,22 @@ class SimplePostureDetector:
         return current_activity
     
     def send_activity(self, activity):
-        """Send detected activity to server"""
+        """Send detected activity to server, spooling it to disk if the server is unreachable"""
+        payload = {
+            "activity": activity,
+            "device_id": DEVICE_ID,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        if self.server_url is None:
+            return False
+
+        # Keep ordering: if older updates are waiting, this one goes behind them
+        if len(self.spool) or time.time() < self.retry_not_before:
+            self.spool.append(payload)
+            return self.flush_spool()
+
         try:
-            payload = {
-                "activity": activity,
-                "device_id": DEVICE_ID,
-                "timestamp": datetime.utcnow().isoformat()
-            }
-            response = requests.post(self.server_url, json=payload, timeout=2)
+            response = signed_post(self.session, self.server_url, payload, DEVICE_ID, DEVICE_KEY, timeout=2)
             
             if response.status_code == 200:
                 print(f"✓ Activity '{activity}' sent to server")
@@ -123,15 +355,68 @@ class SimplePostureDetector:
                 return True
             else:
                 print(f"✗ Server returned {response.status_code}: {response.text}")
+                if response.status_code in RETRYABLE_STATUS:
+                    self._back_off(response)
+                    self.spool.append(payload)
+                elif response.status_code >= 500 or response.status_code == 404:
+                    self.spool.append(payload)
                 return False
         except requests.exceptions.ConnectionError:
-            print(f"⚠ Server unreachable. Activity not sent (offline mode)")
+            print(f"⚠ Server unreachable. Activity spooled ({len(self.spool) + 1} pending)")
+            self.spool.append(payload)
             return False
         except Exception as e:
             print(f"✗ Error sending activity: {e}")
+            self.spool.append(payload)
             return False
+
+    def _back_off(self, response):
+        """Pause sending until the server's Retry-After has passed"""
+        try:
+            delay = float(response.headers.get("Retry-After", SPOOL_RETRY_SECONDS))
+        except ValueError:
+            delay = SPOOL_RETRY_SECONDS
+        self.retry_not_before = time.time() + max(delay, 1)
+
+    def flush_spool(self):
+        """Replay spooled updates in bulk. Returns True once the spool is empty."""
+        if time.time() < self.retry_not_before:
+            return False
+        self.last_spool_attempt = time.time()
+        while len(self.spool):
+            batch = self.spool.peek(SPOOL_BATCH_SIZE)
+            if not batch:
+                return True
+            try:
+                response = signed_post(self.session, self.server_url, {"updates": batch}, DEVICE_ID, DEVICE_KEY, timeout=5)
+            except requests.exceptions.RequestException:
+                return False
+
+            if response.status_code != 200:
+                if response.status_code in RETRYABLE_STATUS:
+                    # Throttled: keep the batch and stop until Retry-After
+                    print(f"⚠ Server throttled replay ({response.status_code}); {len(self.spool)} updates kept")
+                    self._back_off(response)
+                    return False
+                if 400 <= response.status_code < 500 and response.status_code != 404:
+                    # Server rejected the batch outright; retrying will not help
+                    print(f"✗ Server rejected {len(batch)} spooled updates: {response.status_code}")
+                    self.spool.remove_first(len(batch))
+                    continue
+                return False
+
+            self.spool.remove_first(len(batch))
+            self.last_activity = batch[-1]["activity"]
+            print(f"✓ Replayed {len(batch)} spooled activity updates")
+        return True
+
+    def retry_spool_if_due(self):
+        """Periodic reconnect attempt while updates are pending"""
+        if self.spool is not None and len(self.spool) and \
+                time.time() - self.last_spool_attempt >= SPOOL_RETRY_SECONDS:
+            self.flush_spool()
     
-    def process_frame(self, frame):
+    def process_frame(self, frame, draw=True):
         """Process a video frame and detect posture"""
         # Detect posture
         current_activity = self.detect_posture(frame)
@@ -140,9 +425,16 @@ class SimplePostureDetector:
         smoothed_activity = self.smooth_prediction(current_activity)
         
         # Send to server only if activity changed
-        if self.last_activity != smoothed_activity:
+        if self.publisher is not None:
+            if self.last_queued != smoothed_activity:
+                self.publisher(smoothed_activity)
+                self.last_queued = smoothed_activity
+        elif self.last_activity != smoothed_activity:
             self.send_activity(smoothed_activity)
         
+        if not draw:
+            return frame
+        
         # Draw info on frame
         cv2.putText(frame, f"Posture: {smoothed_activity}", (10, 30),
                    cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 255, 0), 2)
@@ -153,59 +445,158 @@ class SimplePostureDetector:
         return frame
 
 
-def main():
-    """Run posture detection from camera stream"""
-    print("🎥 Starting Posture Detector...")
-    print(f"📡 Server: {SERVER_URL}")
-    print("Press 'q' to quit\n")
-    
-    detector = SimplePostureDetector(server_url=SERVER_URL)
-    
-    cap = cv2.VideoCapture(0)
-    
-    if not cap.isOpened():
-        print("❌ Error: Could not open camera")
-        return
-    
-    # Set frame properties for better performance
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-    cap.set(cv2.CAP_PROP_FPS, 30)
-    
-    frame_count = 0
-    
-    try:
-        while cap.isOpened():
+def put_drop_oldest(q, item):
+    """Put into a bounded queue, discarding the oldest entry when full. Returns True if something was dropped."""
+    dropped = False
+    while True:
+        try:
+            q.put_nowait(item)
+            return dropped
+        except queue.Full:
+            try:
+                q.get_nowait()
+                dropped = True
+            except queue.Empty:
+                pass
+
+
+class PosturePipeline:
+    """
+    Capture, detection and publish stages running concurrently.
+
+    The stages are connected by bounded queues that drop the oldest entry when
+    full, so a slow server or GUI never stalls the camera, and detection always
+    works on the freshest frame.
+    """
+
+    def __init__(self, detector, source=0, headless=False, frame_queue_size=2, publish_queue_size=32):
+        self.detector = detector
+        self.source = source
+        self.headless = headless
+
+        self.frames = queue.Queue(maxsize=frame_queue_size)
+        self.updates = queue.Queue(maxsize=publish_queue_size)
+        self.stop_event = threading.Event()
+
+        self.stats = {
+            "captured": 0,
+            "processed": 0,
+            "frames_dropped": 0,
+            "updates_dropped": 0,
+            "published": 0,
+        }
+
+        self.detector.publisher = self.publish
+
+    def publish(self, activity):
+        """Called from the detection stage; never blocks"""
+        if put_drop_oldest(self.updates, activity):
+            self.stats["updates_dropped"] += 1
+
+    def _capture_loop(self, cap):
+        while not self.stop_event.is_set():
             ret, frame = cap.read()
-            
             if not ret:
                 print("❌ Failed to read frame")
+                self.stop_event.set()
                 break
-            
-            frame_count += 1
-            
-            # Process every frame
-            frame = detector.process_frame(frame)
-            
-            # Show statistics
-            if frame_count % 10 == 0:
-                print(f"📊 Frames processed: {frame_count} | Last activity: {detector.last_activity}")
-            
-            # Display the frame
-            cv2.imshow("Posture Detector", frame)
-            
-            # Exit on 'q'
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                print("\n👋 Exiting...")
-                break
-    
-    except KeyboardInterrupt:
-        print("\n⚠ Interrupted by user")
-    
-    finally:
-        cap.release()
-        cv2.destroyAllWindows()
-        print("✓ Camera released")
+            self.stats["captured"] += 1
+            if put_drop_oldest(self.frames, frame):
+                self.stats["frames_dropped"] += 1
+
+    def _publish_loop(self):
+        while not self.stop_event.is_set() or not self.updates.empty():
+            try:
+                activity = self.updates.get(timeout=0.5)
+            except queue.Empty:
+                self.detector.retry_spool_if_due()
+                continue
+            if self.detector.send_activity(activity):
+                self.stats["published"] += 1
+
+    def run(self):
+        cap = cv2.VideoCapture(self.source)
+
+        if not cap.isOpened():
+            print("❌ Error: Could not open camera")
+            return
+
+        # Set frame properties for better performance
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+        cap.set(cv2.CAP_PROP_FPS, 30)
+
+        capture = threading.Thread(target=self._capture_loop, args=(cap,), name="capture", daemon=True)
+        publisher = threading.Thread(target=self._publish_loop, name="publisher", daemon=True)
+        capture.start()
+        publisher.start()
+
+        started = time.time()
+        last_report = started
+
+        try:
+            # Detection runs on the main thread (cv2.imshow must stay here)
+            while not self.stop_event.is_set():
+                try:
+                    frame = self.frames.get(timeout=1)
+                except queue.Empty:
+                    continue
+
+                frame = self.detector.process_frame(frame, draw=not self.headless)
+                self.stats["processed"] += 1
+
+                now = time.time()
+                if now - last_report >= 5:
+                    elapsed = now - started
+                    print(f"📊 Detect FPS: {self.stats['processed'] / elapsed:.1f} | "
+                          f"Capture FPS: {self.stats['captured'] / elapsed:.1f} | "
+                          f"Frames dropped: {self.stats['frames_dropped']} | "
+                          f"Updates sent: {self.stats['published']} (dropped {self.stats['updates_dropped']}) | "
+                          f"Last activity: {self.detector.last_activity} | "
+                          f"ROI frames: {self.detector.stats['roi']} | Full frames: {self.detector.stats['full_frame']}")
+                    last_report = now
+
+                if not self.headless:
+                    # Display the frame
+                    cv2.imshow("Posture Detector", frame)
+
+                    # Exit on 'q'
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        print("\n👋 Exiting...")
+                        break
+
+        except KeyboardInterrupt:
+            print("\n⚠ Interrupted by user")
+
+        finally:
+            self.stop_event.set()
+            capture.join(timeout=2)
+            publisher.join(timeout=3)
+            cap.release()
+            if not self.headless:
+                cv2.destroyAllWindows()
+            print("✓ Camera released")
+
+
+def main():
+    """Run posture detection from camera stream"""
+    parser = argparse.ArgumentParser(description="Camera-based posture detector")
+    parser.add_argument("--server", default=SERVER_URL, help="Activity endpoint URL")
+    parser.add_argument("--source", default="0", help="Camera index or video stream URL")
+    parser.add_argument("--headless", action="store_true", help="Run without a preview window")
+    args = parser.parse_args()
+
+    source = int(args.source) if args.source.isdigit() else args.source
+
+    print("🎥 Starting Posture Detector...")
+    print(f"📡 Server: {args.server}")
+    if args.headless:
+        print("Headless mode: press Ctrl+C to quit\n")
+    else:
+        print("Press 'q' to quit\n")
+
+    detector = SimplePostureDetector(server_url=args.server)
+    PosturePipeline(detector, source=source, headless=args.headless).run()
 
 
 if __name__ == "__main__":
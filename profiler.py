@@ -0,0 +1,199 @@
+"""
+On-demand profiling for the live Flask server.
+
+- SamplingProfiler: a background thread snapshots the stacks of threads
+  that are currently serving a request (sys._current_frames) every few
+  milliseconds and counts them as folded stacks ("a;b;c 42"), the input
+  format of flamegraph.pl and speedscope. Nothing runs while no session is
+  active.
+- CallTracer: for the next N matching requests, records every call into
+  db.py, health_agent.py and the external agents with its duration, using
+  a per-thread sys.setprofile hook.
+
+Both are driven from admin-only routes in server.py.
+"""
+
+import collections
+import os
+import sys
+import threading
+import time
+
+# Modules whose calls the tracer records
+TRACED_FILES = {
+    "db.py", "health_agent.py", "clinical_agent.py", "whatsapp_agent.py",
+    "notifier.py", "auth.py", "async_db.py",
+}
+
+
+class ActiveRequests:
+    """Which thread is serving which route right now"""
+
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def begin(self, route):
+        with self._lock:
+            self._routes[threading.get_ident()] = route
+
+    def end(self):
+        with self._lock:
+            route = self._routes.pop(threading.get_ident(), None)
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(route)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._routes)
+
+    def add_listener(self, fn):
+        with self._lock:
+            self._listeners.append(fn)
+
+    def remove_listener(self, fn):
+        with self._lock:
+            if fn in self._listeners:
+                self._listeners.remove(fn)
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _folded(frame, route):
+    stack = []
+    while frame is not None:
+        stack.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    stack.append(route)
+    return ";".join(reversed(stack))
+
+
+class SamplingProfiler:
+    def __init__(self, active_requests):
+        self.active = active_requests
+        self._lock = threading.Lock()
+        self._running = False
+
+    @property
+    def running(self):
+        return self._running
+
+    def run(self, seconds=10.0, max_requests=None, route=None, interval=0.005):
+        """
+        Sample request threads until `seconds` pass or `max_requests`
+        matching requests have finished. Blocks; returns (folded text, info).
+        """
+        with self._lock:
+            if self._running:
+                raise RuntimeError("A profiling session is already running")
+            self._running = True
+
+        counts = collections.Counter()
+        finished = [0]
+        done = threading.Event()
+
+        def on_request_end(finished_route):
+            if route is None or finished_route == route:
+                finished[0] += 1
+                if max_requests and finished[0] >= max_requests:
+                    done.set()
+
+        self.active.add_listener(on_request_end)
+        me = threading.get_ident()
+        samples = 0
+        started = time.perf_counter()
+        deadline = started + seconds
+        try:
+            while not done.is_set() and time.perf_counter() < deadline:
+                routes = self.active.snapshot()
+                frames = sys._current_frames()
+                for thread_id, thread_route in routes.items():
+                    if thread_id == me or (route is not None and thread_route != route):
+                        continue
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        counts[_folded(frame, thread_route)] += 1
+                        samples += 1
+                del frames
+                done.wait(interval)
+        finally:
+            self.active.remove_listener(on_request_end)
+            with self._lock:
+                self._running = False
+
+        text = "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+        info = {
+            "seconds": round(time.perf_counter() - started, 2),
+            "samples": samples,
+            "requests": finished[0],
+            "distinct_stacks": len(counts),
+        }
+        return text, info
+
+
+class CallTracer:
+    """Traces the next N requests (optionally of one route)"""
+
+    def __init__(self, keep=20, max_calls=500):
+        self.keep = keep
+        self.max_calls = max_calls
+        self._lock = threading.Lock()
+        self._remaining = 0
+        self._route = None
+        self._local = threading.local()
+        self.traces = collections.deque(maxlen=keep)
+
+    def arm(self, requests=1, route=None):
+        with self._lock:
+            self._remaining = requests
+            self._route = route
+
+    def status(self):
+        with self._lock:
+            return {"armed": self._remaining, "route": self._route, "stored": len(self.traces)}
+
+    def begin(self, route):
+        with self._lock:
+            if self._remaining <= 0 or (self._route is not None and route != self._route):
+                return
+            self._remaining -= 1
+
+        calls = []
+        stack = []
+        start = time.perf_counter()
+
+        def profile(frame, event, arg):
+            if event not in ("call", "return"):
+                return
+            if os.path.basename(frame.f_code.co_filename) not in TRACED_FILES:
+                return
+            now = time.perf_counter()
+            if event == "call":
+                entry = {
+                    "call": f"{os.path.basename(frame.f_code.co_filename)[:-3]}.{frame.f_code.co_name}",
+                    "depth": len(stack),
+                    "start_ms": round((now - start) * 1000, 3),
+                }
+                stack.append((frame, now, entry))
+                if len(calls) < self.max_calls:
+                    calls.append(entry)
+            elif stack and stack[-1][0] is frame:
+                _, began, entry = stack.pop()
+                entry["ms"] = round((now - began) * 1000, 3)
+
+        self._local.trace = {"route": route, "started": time.time(), "calls": calls, "t0": start}
+        sys.setprofile(profile)
+
+    def end(self):
+        trace = getattr(self._local, "trace", None)
+        if trace is None:
+            return None
+        sys.setprofile(None)
+        self._local.trace = None
+        trace["total_ms"] = round((time.perf_counter() - trace.pop("t0")) * 1000, 3)
+        self.traces.append(trace)
+        return trace
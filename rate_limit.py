@@ -0,0 +1,100 @@
+import math
+import os
+import threading
+
+from ingest import parse_flag
+from shared_state import MemoryStore
+
+
+def _env_float(name, default):
+    return float(os.getenv(name, default))
+
+
+class TokenBucketLimiter:
+    """
+    Per-key token buckets, e.g. one per device or per client IP.
+
+    Each bucket holds up to `burst` tokens and refills at `rate` tokens per
+    second; a request costs one token. Buckets live in a shared_state store,
+    so under launcher.py every worker draws from the same bucket; in memory
+    they are LRU-capped at max_keys, and every check is O(1).
+    """
+
+    def __init__(self, name, rate, burst, max_keys=10000, store=None):
+        self.name = name
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_keys = max_keys
+        self.store = store if store is not None else MemoryStore()
+        self._lock = threading.Lock()
+        self.stats = {"allowed": 0, "rejected": 0}
+
+    def allow(self, key):
+        """Returns (allowed, retry_after_seconds)"""
+        allowed, retry_after = self.store.take_token(f"rate_{self.name}", str(key), self.rate, self.burst,
+                                                     self.max_keys)
+        with self._lock:
+            self.stats["allowed" if allowed else "rejected"] += 1
+        return allowed, retry_after
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, rate=self.rate, burst=self.burst)
+
+
+class AdmissionControl:
+    """Named limiters configured from the environment (RATE_<NAME>_RATE / RATE_<NAME>_BURST)"""
+
+    DEFAULTS = {
+        # name: (tokens per second, burst)
+        "device": (2.0, 20),      # per ESP32 / camera
+        "ingest_ip": (20.0, 100), # per client IP across all ingest routes
+        "login_ip": (0.2, 5),     # per client IP: 5 quick tries, then one every 5s
+        # Emergency/fall payloads skip the buckets above but get their own,
+        # larger one per device, so a stuck button cannot flood alerts
+        "priority": (1.0, 30),
+    }
+
+    def __init__(self, store=None):
+        self.limiters = {}
+        for name, (rate, burst) in self.DEFAULTS.items():
+            key = name.upper()
+            self.limiters[name] = TokenBucketLimiter(
+                name,
+                _env_float(f"RATE_{key}_RATE", rate),
+                _env_float(f"RATE_{key}_BURST", burst),
+                store=store,
+            )
+
+    def check(self, checks):
+        """
+        checks: [(limiter_name, key)]. All buckets must admit the request.
+        Returns (allowed, retry_after_seconds).
+        """
+        for name, key in checks:
+            allowed, retry_after = self.limiters[name].allow(key)
+            if not allowed:
+                return False, int(math.ceil(retry_after))
+        return True, 0
+
+    def get_stats(self):
+        return {name: limiter.get_stats() for name, limiter in self.limiters.items()}
+
+
+def is_priority_payload(data):
+    """Emergency button and fall payloads, judged by a strict flag parse ("false" is not set)"""
+    if isinstance(data, dict):
+        for k, v in data.items():
+            if str(k).lower().strip() in ("emergency", "fall") and parse_flag(v):
+                return True
+    return False
+
+
+def ingest_checks(priority, device_id, remote_addr):
+    """Buckets an ingest request must pass: the priority bucket alone, or device + IP"""
+    if priority:
+        return [("priority", str(device_id or remote_addr))]
+    checks = [("ingest_ip", remote_addr)]
+    if device_id:
+        checks.insert(0, ("device", str(device_id)))
+    return checks
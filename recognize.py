@@ -2,103 +2,134 @@ import cv2
 import os
 import requests
 from deepface import DeepFace
+from snapshot_store import SnapshotStore
+from device_auth import signed_post
 
 SERVER_URL = "http://localhost:5000/event"
+DEVICE_ID = os.getenv("DEVICE_ID", "door-camera-01")
+DEVICE_KEY = os.getenv("DEVICE_KEY")  # Signs requests when set (see device_auth.py)
+
+# Matcher settings (measure alternatives with benchmark_faces.py)
+KNOWN_FACES_DIR = "known_faces"
+MODEL_NAME = "VGG-Face"
+DISTANCE_METRIC = "cosine"
+MATCH_THRESHOLD = 0.4    # A gallery image only counts as a candidate below this
+ACCEPT_THRESHOLD = 0.45  # The best candidate must also be below this
+
+
+def load_known_images(known_faces_dir=KNOWN_FACES_DIR):
+    """List the enrolled gallery images"""
+    known_images = []
+    for file in os.listdir(known_faces_dir):
+        if file.endswith(".jpg") or file.endswith(".png"):
+            known_images.append(os.path.join(known_faces_dir, file))
+    return known_images
+
+
+def match_face(img_path, known_images, model_name=MODEL_NAME,
+               match_threshold=MATCH_THRESHOLD, accept_threshold=ACCEPT_THRESHOLD, verbose=True):
+    """
+    Compare a captured image against every gallery image.
+    Returns (name, distance); name is None when nobody matched.
+    """
+    best_match_distance = float('inf')
+    best_match_name = None
+
+    for known_path in known_images:
+        try:
+            result = DeepFace.verify(
+                img1_path=img_path,
+                img2_path=known_path,
+                enforce_detection=False,  # Don't fail if face not centered/detected
+                model_name=model_name,
+                distance_metric=DISTANCE_METRIC
+            )
+
+            # Get the distance (lower = more similar)
+            distance = result["distance"]
+
+            if verbose:
+                print(f"Comparing with {os.path.basename(known_path)}: distance={distance:.4f}")
+
+            # Only accept if distance is below the threshold AND it's the best match
+            if distance < match_threshold and distance < best_match_distance:
+                best_match_distance = distance
+                best_match_name = os.path.basename(known_path).split(".")[0]
+
+        except Exception as e:
+            if verbose:
+                print(f"Error processing {os.path.basename(known_path)}: {str(e)}")
+
+    # Use the best match only if it's good enough
+    if best_match_name is not None and best_match_distance < accept_threshold:
+        return best_match_name, best_match_distance
+    return None, best_match_distance
+
 
-# Load known faces
-known_faces_dir = "known_faces"
-known_images = []
+def main():
+    # Intruder captures are encoded on a background thread
+    snapshot_store = SnapshotStore()
 
-for file in os.listdir(known_faces_dir):
-    if file.endswith(".jpg") or file.endswith(".png"):
-        known_images.append(os.path.join(known_faces_dir, file))
+    # Load known faces
+    known_images = load_known_images()
+    print("Loaded authorized faces:", known_images)
 
-print("Loaded authorized faces:", known_images)
+    cap = cv2.VideoCapture(0)
 
-cap = cv2.VideoCapture(0)
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
 
-while True:
-    ret, frame = cap.read()
-    if not ret:
-        break
+        cv2.putText(frame, "Press SPACE to scan face", (20, 40),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
 
-    cv2.putText(frame, "Press SPACE to scan face", (20, 40),
-                cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+        cv2.imshow("Access Control", frame)
 
-    cv2.imshow("Access Control", frame)
+        key = cv2.waitKey(1)
 
-    key = cv2.waitKey(1)
+        # SPACE pressed
+        if key == 32:
+            print("Capturing face...")
 
-    # SPACE pressed
-    if key == 32:
-        print("Capturing face...")
+            temp_img = "captured.jpg"
+            cv2.imwrite(temp_img, frame)
 
-        temp_img = "captured.jpg"
-        cv2.imwrite(temp_img, frame)
+            name, best_match_distance = match_face(temp_img, known_images)
+            recognized = name is not None
 
-        recognized = False
-        name = "Intruder"
+            if recognized:
+                print(f"Best match: {name} with distance: {best_match_distance:.4f}")
+            else:
+                print(f"No good match found. Best distance: {best_match_distance:.4f}")
 
-        best_match_distance = float('inf')
-        best_match_name = None
-        
-        for img_path in known_images:
+            if recognized:
+                print("Authorized:", name)
+                event = "authorized"
+                snapshot_id = None
+            else:
+                print("INTRUDER DETECTED")
+                event = "intruder_detected"
+                snapshot_id = snapshot_store.submit(frame)
+
+            # Send event to server
             try:
-                result = DeepFace.verify(
-                    img1_path=temp_img,
-                    img2_path=img_path,
-                    enforce_detection=False,  # Don't fail if face not centered/detected
-                    model_name="VGG-Face",
-                    distance_metric="cosine"
-                )
-
-                # Get the distance (lower = more similar)
-                distance = result["distance"]
-                
-                print(f"Comparing with {os.path.basename(img_path)}: distance={distance:.4f}")
-                
-                # Use loosened threshold (0.45 instead of 0.35)
-                # Only accept if distance is less than 0.45 AND it's the best match
-                if distance < 0.4 and distance < best_match_distance:
-                    best_match_distance = distance
-                    best_match_name = os.path.basename(img_path).split(".")[0]
-                    recognized = True
-
-            except Exception as e:
-                print(f"Error processing {os.path.basename(img_path)}: {str(e)}")
-                pass
-        
-        # Use the best match only if it's good enough
-        if recognized and best_match_distance < 0.45:
-            name = best_match_name
-            print(f"Best match: {name} with distance: {best_match_distance:.4f}")
-        else:
-            recognized = False
-            print(f"No good match found. Best distance: {best_match_distance:.4f}")
-
-        if recognized:
-            print("Authorized:", name)
-            event = "authorized"
-            image_path = None
-        else:
-            print("INTRUDER DETECTED")
-            event = "intruder_detected"
-            image_path = "static/captured.jpg"
-            cv2.imwrite(image_path, frame)
-
-        # Send event to server
-        try:
-            requests.post(SERVER_URL, json={
-                "event": event,
-                "image": image_path
-                })
-            print("Event sent:", event)
-        except:
-            print("Server not reachable")
-
-    # ESC to exit
-    if key == 27:
-        break
-
-cap.release()
-cv2.destroyAllWindows()
+                signed_post(requests, SERVER_URL, {
+                    "event": event,
+                    "snapshot_id": snapshot_id
+                    }, DEVICE_ID, DEVICE_KEY, timeout=5)
+                print("Event sent:", event)
+            except:
+                print("Server not reachable")
+
+        # ESC to exit
+        if key == 27:
+            break
+
+    cap.release()
+    cv2.destroyAllWindows()
+    snapshot_store.flush(timeout=5)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,451 @@
+"""
+Schema setup and time-partition maintenance for vitals_log and environmental_log.
+
+MySQL: both tables are RANGE-partitioned on UNIX_TIMESTAMP(timestamp), one
+partition per month (PARTITION_UNIT=day for daily), plus a catch-all `pmax`.
+vitals_log has a covering (patient_id, timestamp, vitals...) index, so
+get_historical_vitals reads the newest rows straight from the index.
+RetentionJob keeps PARTITIONS_AHEAD empty partitions ready and removes
+expired ones whole:
+- drop: ALTER TABLE ... DROP PARTITION (no row-by-row DELETE)
+- archive: the partition is swapped out into its own table,
+  e.g. vitals_log_p202401, with EXCHANGE PARTITION, then dropped. No rows are copied.
+- columnar: the partition is exported to compressed per-day chunk files
+  (vitals_archive.py), then dropped; history queries read it from there.
+
+Tables created before partitioning existed are migrated once, explicitly
+(it rewrites the table): `python schema.py --migrate`. Partitioned InnoDB
+tables cannot have foreign keys; drop any on vitals_log first.
+
+SQLite (DB_BACKEND=sqlite) has no partitions: the same indexes are created and
+retention deletes (or moves to <table>_archive or the columnar archive)
+expired rows in chunks.
+
+    python schema.py                  # create/upgrade schema, add upcoming partitions
+    python schema.py --migrate        # partition existing unpartitioned tables
+    python schema.py --retention --dry-run
+"""
+
+import argparse
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from db import get_backend, get_connection
+from shared_state import file_lock
+from vitals_archive import archive as columnar_archive, TABLES as ARCHIVE_KINDS
+
+PARTITION_UNIT = os.getenv("PARTITION_UNIT", "month").lower()  # day | month
+PARTITIONS_AHEAD = int(os.getenv("PARTITIONS_AHEAD", 3))
+# 0 keeps rows forever
+RETENTION_DAYS = {
+    "vitals_log": int(os.getenv("VITALS_RETENTION_DAYS", 0)),
+    "environmental_log": int(os.getenv("ENV_RETENTION_DAYS", 0)),
+}
+RETENTION_MODE = os.getenv("RETENTION_MODE", "archive").lower()  # archive | drop | columnar
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", 3600))
+SQLITE_DELETE_CHUNK = 5000
+EXPORT_BATCH = 50000
+
+# Columns exported to the columnar archive (vitals_archive.py)
+EXPORT_COLUMNS = {
+    "vitals_log": "patient_id, heart_rate, spo2, temperature, weight, risk, probability, timestamp",
+    "environmental_log": "humidity, room_temp, aqi, timestamp",
+}
+
+MYSQL_TABLES = {
+    "vitals_log": """
+        CREATE TABLE IF NOT EXISTS vitals_log (
+            id INT AUTO_INCREMENT,
+            patient_id INT NOT NULL,
+            heart_rate DOUBLE,
+            spo2 DOUBLE,
+            temperature DOUBLE,
+            weight DOUBLE,
+            risk VARCHAR(20),
+            probability DOUBLE,
+            timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, timestamp),
+            INDEX idx_patient_time (patient_id, timestamp, heart_rate, spo2, temperature, weight)
+        ) PARTITION BY RANGE (UNIX_TIMESTAMP(timestamp)) ({partitions})
+    """,
+    "environmental_log": """
+        CREATE TABLE IF NOT EXISTS environmental_log (
+            id INT AUTO_INCREMENT,
+            humidity VARCHAR(10),
+            room_temp VARCHAR(10),
+            aqi VARCHAR(10),
+            timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, timestamp),
+            INDEX idx_time (timestamp, humidity, room_temp, aqi)
+        ) PARTITION BY RANGE (UNIX_TIMESTAMP(timestamp)) ({partitions})
+    """,
+}
+
+# Indexes added to existing tables that lack them
+MYSQL_INDEXES = {
+    "vitals_log": ("idx_patient_time", "(patient_id, timestamp, heart_rate, spo2, temperature, weight)"),
+    "environmental_log": ("idx_time", "(timestamp, humidity, room_temp, aqi)"),
+}
+
+
+# =============================
+# PARTITION RANGES
+# =============================
+def period_start(moment, unit=PARTITION_UNIT):
+    moment = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment if unit == "day" else moment.replace(day=1)
+
+
+def retention_cutoff(days, now=None):
+    """Rows older than this are expired (whole days, so archive chunks are written once per day); None keeps all"""
+    if days <= 0:
+        return None
+    return period_start((now or datetime.now()) - timedelta(days=days), "day")
+
+
+def next_period(start, unit=PARTITION_UNIT):
+    if unit == "day":
+        return start + timedelta(days=1)
+    return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def partition_name(start, unit=PARTITION_UNIT):
+    return start.strftime("p%Y%m%d" if unit == "day" else "p%Y%m")
+
+
+def partition_ranges(first, count, unit=PARTITION_UNIT):
+    """[(name, upper bound)] for `count` periods from the one holding `first`; bounds are epoch seconds, like UNIX_TIMESTAMP()"""
+    ranges = []
+    start = period_start(first, unit)
+    for _ in range(count):
+        end = next_period(start, unit)
+        ranges.append((partition_name(start, unit), int(end.timestamp())))
+        start = end
+    return ranges
+
+
+def partitions_sql(ranges):
+    clauses = [f"PARTITION {name} VALUES LESS THAN ({bound})" for name, bound in ranges]
+    clauses.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    return ", ".join(clauses)
+
+
+# =============================
+# MYSQL
+# =============================
+def _scalar(cursor, query, params=()):
+    cursor.execute(query, params)
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _table_exists(cursor, table):
+    return bool(_scalar(cursor, """
+        SELECT COUNT(*) FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    """, (table,)))
+
+
+def list_partitions(cursor, table):
+    """[(name, upper bound epoch or None for MAXVALUE)] in order; [] when not partitioned"""
+    cursor.execute("""
+        SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """, (table,))
+    return [(name, None if bound == "MAXVALUE" else int(bound)) for name, bound in cursor.fetchall()]
+
+
+def _ensure_columns_and_indexes(cursor, table):
+    if table == "vitals_log" and not _scalar(cursor, """
+        SELECT COUNT(*) FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'vitals_log' AND COLUMN_NAME = 'weight'
+    """):
+        cursor.execute("ALTER TABLE vitals_log ADD COLUMN weight DOUBLE AFTER temperature")
+
+    index, columns = MYSQL_INDEXES[table]
+    if not _scalar(cursor, """
+        SELECT COUNT(*) FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+    """, (table, index)):
+        print(f"🗂️ Schema: adding index {index} to {table}")
+        cursor.execute(f"ALTER TABLE {table} ADD INDEX {index} {columns}")
+
+
+def add_future_partitions(cursor, table, ahead=PARTITIONS_AHEAD, now=None):
+    """Split pmax so the current period and `ahead` more have their own partition"""
+    partitions = list_partitions(cursor, table)
+    if not partitions:
+        return 0
+    last_bound = max((bound for _, bound in partitions if bound is not None), default=None)
+    new = [(name, bound) for name, bound in partition_ranges(now or datetime.now(), ahead + 1)
+           if last_bound is None or bound > last_bound]
+    if not new:
+        return 0
+    cursor.execute(f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO ({partitions_sql(new)})")
+    return len(new)
+
+
+def _create_mysql_table(cursor, table):
+    ranges = partition_ranges(datetime.now(), PARTITIONS_AHEAD + 1)
+    cursor.execute(MYSQL_TABLES[table].format(partitions=partitions_sql(ranges)))
+    print(f"🗂️ Schema: created partitioned {table}")
+
+
+def migrate_table(cursor, table):
+    """Partition an existing unpartitioned table (rewrites it; run once, off-peak)"""
+    if list_partitions(cursor, table):
+        print(f"🗂️ Schema: {table} is already partitioned")
+        return False
+    oldest = _scalar(cursor, f"SELECT MIN(timestamp) FROM {table}") or datetime.now()
+    first = period_start(oldest)
+    periods = 0
+    start = first
+    while start <= period_start(datetime.now()):
+        periods += 1
+        start = next_period(start)
+    ranges = partition_ranges(first, periods + PARTITIONS_AHEAD)
+
+    print(f"🗂️ Schema: partitioning {table} into {len(ranges) + 1} partitions from {first:%Y-%m-%d}...")
+    # The partitioning column must be part of every unique key
+    cursor.execute(
+        f"ALTER TABLE {table} MODIFY timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, "
+        f"DROP PRIMARY KEY, ADD PRIMARY KEY (id, timestamp)"
+    )
+    cursor.execute(f"ALTER TABLE {table} PARTITION BY RANGE (UNIX_TIMESTAMP(timestamp)) ({partitions_sql(ranges)})")
+    return True
+
+
+def _expired(partitions, cutoff):
+    """Partitions whose every row is older than cutoff"""
+    cutoff_epoch = cutoff.timestamp()
+    bounded = [(name, bound) for name, bound in partitions if bound is not None]
+    expired = [name for name, bound in bounded if bound <= cutoff_epoch]
+    # Keep at least one bounded partition, so rows never all land in pmax
+    return expired[:max(0, len(bounded) - 1)]
+
+
+def _mysql_retention(cursor, table, cutoff, mode, dry_run):
+    removed = []
+    partitions = list_partitions(cursor, table)
+    for name in _expired(partitions, cutoff):
+        if dry_run:
+            removed.append(name)
+            continue
+        if mode == "columnar":
+            _export_partition(cursor, table, name)
+        elif mode == "archive":
+            archive = f"{table}_{name}"
+            if not _table_exists(cursor, archive):
+                cursor.execute(f"CREATE TABLE {archive} LIKE {table}")
+                cursor.execute(f"ALTER TABLE {archive} REMOVE PARTITIONING")
+                cursor.execute(f"ALTER TABLE {table} EXCHANGE PARTITION {name} WITH TABLE {archive}")
+            elif _scalar(cursor, f"SELECT COUNT(*) FROM {table} PARTITION ({name})"):
+                # An earlier run archived this period already; swapping again would undo it
+                raise RuntimeError(f"{archive} already exists and {table}.{name} is not empty")
+        cursor.execute(f"ALTER TABLE {table} DROP PARTITION {name}")
+        removed.append(name)
+        if mode == "columnar":
+            bound = dict(partitions)[name]
+            columnar_archive.set_horizon(ARCHIVE_KINDS[table], datetime.fromtimestamp(bound))
+    return removed
+
+
+def _export_partition(cursor, table, name):
+    """Stream one partition into the columnar archive (safe to repeat)"""
+    cursor.execute(f"SELECT {EXPORT_COLUMNS[table]} FROM {table} PARTITION ({name}) ORDER BY id")
+    names = [c.strip() for c in EXPORT_COLUMNS[table].split(",")]
+    while True:
+        batch = cursor.fetchmany(EXPORT_BATCH)
+        if not batch:
+            return
+        columnar_archive.write_table_rows(table, [dict(zip(names, row)) for row in batch])
+
+
+# =============================
+# SQLITE
+# =============================
+def _sqlite_retention(conn, cursor, table, cutoff, mode, dry_run):
+    """Chunked, so writers are only blocked for one chunk at a time"""
+    cutoff_text = cutoff.strftime("%Y-%m-%d %H:%M:%S")
+    if dry_run:
+        cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE timestamp < %s", (cutoff_text,))
+        return cursor.fetchone()[0]
+    if mode == "archive":
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {table}_archive AS SELECT * FROM {table} WHERE 0")
+    chunk = f"SELECT id FROM {table} WHERE timestamp < %s ORDER BY timestamp LIMIT {SQLITE_DELETE_CHUNK}"
+    names = [c.strip() for c in EXPORT_COLUMNS[table].split(",")]
+    removed = 0
+    while True:
+        if mode == "archive":
+            cursor.execute(f"INSERT INTO {table}_archive SELECT * FROM {table} WHERE id IN ({chunk})", (cutoff_text,))
+        elif mode == "columnar":
+            cursor.execute(f"SELECT {EXPORT_COLUMNS[table]} FROM {table} WHERE id IN ({chunk})", (cutoff_text,))
+            columnar_archive.write_table_rows(table, [dict(zip(names, row)) for row in cursor.fetchall()])
+        cursor.execute(f"DELETE FROM {table} WHERE id IN ({chunk})", (cutoff_text,))
+        deleted = cursor.rowcount
+        conn.commit()
+        removed += deleted
+        if deleted < SQLITE_DELETE_CHUNK:
+            if mode == "columnar":
+                columnar_archive.set_horizon(ARCHIVE_KINDS[table], cutoff)
+            return removed
+
+
+# =============================
+# ENTRY POINTS
+# =============================
+def ensure_schema():
+    """Create or upgrade the tables and indexes; idempotent, run at startup"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        if get_backend().name == "sqlite":
+            return  # storage.SQLITE_SCHEMA is applied on first connect
+        for table in MYSQL_TABLES:
+            if not _table_exists(cursor, table):
+                _create_mysql_table(cursor, table)
+                continue
+            _ensure_columns_and_indexes(cursor, table)
+            if list_partitions(cursor, table):
+                add_future_partitions(cursor, table)
+            else:
+                print(f"🗂️ Schema: {table} is not partitioned; run `python schema.py --migrate` off-peak")
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+class RetentionJob:
+    """
+    Background partition maintenance: upcoming partitions, then expired ones.
+    Under launcher.py every worker runs one; a named lock (GET_LOCK on
+    MySQL, a lock file next to the database on SQLite) lets only one of
+    them work at a time.
+    """
+
+    def __init__(self, interval=RETENTION_INTERVAL, retention_days=None, mode=RETENTION_MODE):
+        if mode not in ("archive", "drop", "columnar"):
+            raise ValueError(f"RETENTION_MODE must be archive, drop or columnar, not {mode!r}")
+        self.interval = interval
+        self.retention_days = retention_days or RETENTION_DAYS
+        self.mode = mode
+        self.stats = {
+            "runs": 0,
+            "skipped": 0,
+            "partitions_added": 0,
+            "partitions_removed": 0,
+            "rows_removed": 0,
+            "last_run": None,
+            "last_seconds": None,
+            "last_error": None,
+        }
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="retention", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                self.stats["last_error"] = str(e)[:200]
+                print(f"❌ Retention: {e}")
+
+    def run_once(self, dry_run=False, now=None):
+        backend = get_backend()
+        if backend.name == "sqlite" and not dry_run:
+            with file_lock(getattr(backend, "path", "healthguard.db") + ".retention.lock", blocking=False) as acquired:
+                if not acquired:
+                    self.stats["skipped"] += 1
+                    return {}
+                return self._run(dry_run, now)
+        return self._run(dry_run, now)
+
+    def _run(self, dry_run, now):
+        now = now or datetime.now()
+        start = time.perf_counter()
+        conn = get_connection()
+        cursor = conn.cursor()
+        sqlite = get_backend().name == "sqlite"
+        report = {}
+        try:
+            if not sqlite and not _scalar(cursor, "SELECT GET_LOCK('healthguard_retention', 0)"):
+                self.stats["skipped"] += 1
+                return report
+            try:
+                for table, days in self.retention_days.items():
+                    if not sqlite and not dry_run:
+                        self.stats["partitions_added"] += add_future_partitions(cursor, table, now=now)
+                    cutoff = retention_cutoff(days, now)
+                    if cutoff is None:
+                        continue
+                    if sqlite:
+                        rows = _sqlite_retention(conn, cursor, table, cutoff, self.mode, dry_run)
+                        report[table] = rows
+                        if not dry_run:
+                            self.stats["rows_removed"] += rows
+                    else:
+                        removed = _mysql_retention(cursor, table, cutoff, self.mode, dry_run)
+                        report[table] = removed
+                        if not dry_run:
+                            self.stats["partitions_removed"] += len(removed)
+                        if removed:
+                            print(f"🧹 Retention: {'would remove' if dry_run else self.mode} {table} {', '.join(removed)}")
+                conn.commit()
+            finally:
+                if not sqlite:
+                    _scalar(cursor, "SELECT RELEASE_LOCK('healthguard_retention')")
+        finally:
+            cursor.close()
+            conn.close()
+
+        if not dry_run:
+            self.stats["runs"] += 1
+            self.stats["last_run"] = now.isoformat(timespec="seconds")
+            self.stats["last_seconds"] = round(time.perf_counter() - start, 3)
+            self.stats["last_error"] = None
+        return report
+
+    def get_stats(self):
+        return dict(self.stats, mode=self.mode, interval=self.interval,
+                    retention_days=self.retention_days, partition_unit=PARTITION_UNIT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vitals schema setup, partitioning and retention")
+    parser.add_argument("--migrate", action="store_true", help="Partition existing unpartitioned tables (MySQL)")
+    parser.add_argument("--retention", action="store_true", help="Run the retention job once")
+    parser.add_argument("--dry-run", action="store_true", help="With --retention: only report what would go")
+    args = parser.parse_args()
+
+    if args.migrate and get_backend().name == "mysql":
+        conn = get_connection()
+        cursor = conn.cursor()
+        for table in MYSQL_TABLES:
+            if _table_exists(cursor, table):
+                migrate_table(cursor, table)
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+    ensure_schema()
+    print("✅ Schema ready")
+
+    if args.retention:
+        report = RetentionJob().run_once(dry_run=args.dry_run)
+        for table, removed in report.items():
+            print(f"🧹 {table}: {'would remove' if args.dry_run else 'removed'} {removed}")
+
+
+if __name__ == "__main__":
+    main()
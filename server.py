@@ -1,14 +1,44 @@
-from flask import Flask, request, jsonify, render_template, session, redirect, url_for, flash, Response
+# Starts the startup clock before the heavy imports
+from components import ComponentRegistry
+components = ComponentRegistry()
+
+from flask import Flask, request, jsonify, render_template, session, redirect, url_for, flash, Response, send_from_directory, abort, g
 from flask_cors import CORS
 from event_engine import EventEngine
-from health_agent import HealthAgent
-from clinical_agent import ClinicalAgent
-from whatsapp_agent import WhatsAppAgent
+from shared_state import get_store
+from alert_dispatcher import AlertDispatcher
+from notifier import build_notifier_from_env
+from snapshot_store import SnapshotStore
+from device_auth import DeviceAuthenticator
+from rate_limit import AdmissionControl, is_priority_payload, ingest_checks
+from functools import wraps
+import hmac
 import os
+import signal
+import threading
+import time
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning)
 from dotenv import load_dotenv
-from db import get_or_create_patient, log_vitals, get_connection
+from db import (
+    get_or_create_patient, log_vitals, get_connection, spool_vitals, replay_vitals_spool, vitals_spool,
+    is_transient_db_error,
+    get_historical_vitals, get_historical_env, get_vitals_range, get_env_range, find_patient
+)
+from vitals_archive import archive
+from circuit_breaker import get_breaker_stats
+from schema import ensure_schema, RetentionJob
+import standins
+from ingest import (
+    DEFAULT_PATIENT, normalize_payload, extract_readings, has_vitals, has_env,
+    model_payload, advice_vitals, lookup_payload, vitals_row, csv_line,
+    emergency_message, fall_message, high_risk_message, parse_activity_updates, is_canned_advice,
+    canned_advice
+)
+from structured_log import setup_logging, get_logger, get_logging_stats
+from metrics import stage, observe_request
+from profiler import ActiveRequests, SamplingProfiler, CallTracer
+import metrics
 from datetime import datetime
 import json
 
@@ -18,60 +48,210 @@ import json
 try:
     from auth import (
         create_users_table, create_user, authenticate_user,
-        get_user_by_email, verify_user_token
+        get_user_by_email, verify_user_token, get_auth_pool_stats
     )
     AUTH_ENABLED = True
-    try:
-        create_users_table()
-        print("✓ Users table initialized")
-    except Exception:
-        AUTH_ENABLED = False
 except ImportError:
     AUTH_ENABLED = False
 
+components.mark_imported()
+
 # =============================
 # APP SETUP
 # =============================
 load_dotenv()
+setup_logging()
+request_log = get_logger("request")
+esp32_log = get_logger("esp32")
+
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
+# Profiling hooks (admin routes below); idle unless a session is running
+active_requests = ActiveRequests()
+sampling_profiler = SamplingProfiler(active_requests)
+call_tracer = CallTracer()
+
 @app.before_request
 def log_request_info():
-    print(f"[REQUEST] {request.method} {request.path} from {request.remote_addr}")
+    g.request_start = time.perf_counter()
+    request_log.info("%s %s", request.method, request.path, extra={"remote_addr": request.remote_addr})
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    active_requests.begin(route)
+    call_tracer.begin(route)
+
+
+@app.teardown_request
+def end_request_profiling(exc):
+    call_tracer.end()
+    active_requests.end()
+
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.get("request_start")
+    if start is not None:
+        # Route template, not the raw path, keeps label cardinality bounded
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        observe_request(route, request.method, response.status_code, time.perf_counter() - start)
+    return response
 
 # =============================
 # COMPONENTS
 # =============================
-engine = EventEngine()
+# Dashboard state shared by all workers (STATE_BACKEND=sqlite under launcher.py)
+shared_store = get_store()
+engine = EventEngine(shared_store)
+
+# Model, LLM and Twilio clients are built in the background (see warm_up
+# below); the proxies build on first use if a request gets there first
+def _build_health_agent():
+    from health_agent import HealthAgent
+    return HealthAgent(
+        model_path="model.pkl",
+        scaler_path="scaler.pkl"
+    )
 
-health_agent = HealthAgent(
-    model_path="model.pkl",
-    scaler_path="scaler.pkl"
-)
+health_agent = components.register("health_agent", _build_health_agent, imports=("health_agent",))
 
 API_KEY = os.getenv("GROQ_API_KEY")
-clinical_agent = ClinicalAgent(API_KEY)
+
+def _build_clinical_agent():
+    from clinical_agent import AdviceCache, ClinicalAgent
+    client = async_client = None
+    if standins.enabled("groq"):
+        client, async_client = standins.groq_from_env(), standins.async_groq_from_env()
+    return ClinicalAgent(API_KEY, timeout=float(os.getenv("GROQ_TIMEOUT", 15)),
+                         cache=AdviceCache(store=shared_store), client=client, async_client=async_client)
+
+# Optional: without it (GROQ_API_KEY unset, groq missing) alerts carry canned
+# advice, so it does not hold up /readyz
+clinical_agent = components.register("clinical_agent", _build_clinical_agent, imports=("clinical_agent",),
+                                     required=False)
+
+
+def advice_for(vitals, risk):
+    """Advice from the clinical agent; canned advice if the agent cannot be built"""
+    try:
+        return clinical_agent.get_advice(vitals, risk)
+    except Exception as e:
+        esp32_log.warning("Clinical agent unavailable, using canned advice: %s", e)
+        return canned_advice(vitals, risk)
+
+# Advice generated at the last transition into High risk is kept in
+# shared_store under "latest_advice", so every worker reuses it (canned
+# fallback advice is never kept)
 
 TWILIO_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 TWILIO_FROM = os.getenv("TWILIO_WHATSAPP_NUMBER")
 TWILIO_TO = os.getenv("DOCTOR_WHATSAPP_NUMBER")
 
-whatsapp_agent = WhatsAppAgent(
-    TWILIO_SID,
-    TWILIO_TOKEN,
-    TWILIO_FROM,
-    TWILIO_TO
+def _build_whatsapp_agent():
+    from whatsapp_agent import WhatsAppAgent
+    return WhatsAppAgent(
+        TWILIO_SID,
+        TWILIO_TOKEN,
+        TWILIO_FROM,
+        TWILIO_TO,
+        client=standins.twilio_from_env() if standins.enabled("twilio") else None,
+        timeout=float(os.getenv("NOTIFY_WHATSAPP_TIMEOUT", 10))
+    )
+
+whatsapp_agent = components.register("whatsapp_agent", _build_whatsapp_agent, imports=("whatsapp_agent",))
+
+# Fan-out to WhatsApp / email / webhook / file, each channel on its own pool
+notifier = build_notifier_from_env(whatsapp_agent)
+
+# Per-(patient, type) cooldown and digests, shared by all workers; the
+# notifier owns delivery and retries
+alert_dispatcher = AlertDispatcher(
+    lambda message, alert_type: notifier.notify(message, alert_type=alert_type),
+    window=float(os.getenv("ALERT_WINDOW_SECONDS", 30)),
+    store=shared_store
 )
 
+snapshot_store = SnapshotStore()
+
+# Device keys live in memory; edit device_keys.json (or send SIGHUP) to reload
+device_auth = DeviceAuthenticator(store=shared_store)
+if hasattr(signal, "SIGHUP"):
+    signal.signal(signal.SIGHUP, lambda *_: device_auth.keys.reload())
+
+# Vitals/environment tables, indexes and upcoming partitions; retried until
+# the database answers. The retention job then maintains partitions hourly
+storage_schema = components.register("storage_schema", ensure_schema, retry=True)
+retention_job = RetentionJob()
+retention_job.start()
+
+# The users table is created in the background and retried until MySQL
+# answers; meanwhile login/signup answer 503 instead of auth being disabled
+if AUTH_ENABLED:
+    auth_schema = components.register("auth_schema", create_users_table, retry=True)
+
+components.warm_up()
+
+
+def auth_unavailable(template):
+    """503 page while the auth schema is still being set up, else None"""
+    if AUTH_ENABLED and not auth_schema.ready:
+        return render_template(template, error="Sign-in is starting up, please retry shortly"), 503, \
+            {"Retry-After": "5"}
+    return None
+
+
+def device_signed(f):
+    """Verify the HMAC device signature before running an ingest route"""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        ok, device_id, reason = device_auth.verify(request.headers, request.get_data(cache=True))
+        if not ok:
+            return jsonify({"status": "error", "message": f"Device authentication failed: {reason}"}), 401
+        g.device_id = device_id
+        return f(*args, **kwargs)
+    return wrapper
+
+
+# Token buckets per device and per client IP; emergency/fall payloads use their
+# own bucket. Kept in shared_store, so the limits hold across all workers
+admission = AdmissionControl(store=shared_store)
+
+
+def rate_limited_ingest(f):
+    """Reject device floods with 429 before any real processing"""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        data = request.get_json(silent=True)
+        device_id = g.get("device_id")
+        if device_id is None and isinstance(data, dict):
+            device_id = data.get("device_id")
+
+        checks = ingest_checks(is_priority_payload(data), device_id, request.remote_addr)
+        allowed, retry_after = admission.check(checks)
+        if not allowed:
+            response = jsonify({"status": "error", "message": "Rate limit exceeded"})
+            response.status_code = 429
+            response.headers["Retry-After"] = str(retry_after)
+            return response
+        return f(*args, **kwargs)
+    return wrapper
+
 # ============================================================
 # AUTH ROUTES
 # ============================================================
 @app.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
+        allowed, retry_after = admission.check([("login_ip", request.remote_addr)])
+        if not allowed:
+            return render_template("login.html", error="Too many login attempts, please wait"), 429, \
+                {"Retry-After": str(retry_after)}
+
+        unavailable = auth_unavailable("login.html")
+        if unavailable:
+            return unavailable
+
         email = request.form.get("email")
         password = request.form.get("password")
 
@@ -81,6 +261,8 @@ def login():
                 session["logged_in"] = True
                 session["user_email"] = email
                 return redirect(url_for("dashboard"))
+            elif result.get("busy"):
+                return render_template("login.html", error="Server busy, please try again"), 503
             else:
                 return render_template("login.html", error="Invalid credentials")
         else:
@@ -93,6 +275,15 @@ def login():
 @app.route("/signup", methods=["GET", "POST"])
 def signup():
     if request.method == "POST":
+        allowed, retry_after = admission.check([("login_ip", request.remote_addr)])
+        if not allowed:
+            return render_template("signup.html", error="Too many attempts, please wait"), 429, \
+                {"Retry-After": str(retry_after)}
+
+        unavailable = auth_unavailable("signup.html")
+        if unavailable:
+            return unavailable
+
         email = request.form.get("email")
         password = request.form.get("password")
         fullname = request.form.get("fullname")
@@ -102,6 +293,8 @@ def signup():
             result = create_user(email, password, fullname, role)
             if result["success"]:
                 return render_template("signup.html", success="Account created")
+            elif result.get("busy"):
+                return render_template("signup.html", error="Server busy, please try again"), 503
             else:
                 return render_template("signup.html", error="Signup failed")
         else:
@@ -116,6 +309,214 @@ def logout():
     session.clear()
     return redirect(url_for("login"))
 
+
+BREAKER_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+def subsystem_metrics():
+    """Counters the subsystems already keep, exported at scrape time"""
+    alerts = alert_dispatcher.get_stats()
+    for outcome in ("submitted", "dispatched", "failed", "deduplicated", "coalesced", "digests"):
+        yield "alerts_total", "counter", "Alert dispatcher events", {"outcome": outcome}, alerts[outcome]
+    yield "alerts_pending", "gauge", "Alerts waiting for a digest", {}, alerts["pending"]
+
+    for channel, stats in notifier.get_stats().items():
+        for outcome in ("delivered", "failed", "expired", "dropped", "retries"):
+            yield "notify_deliveries_total", "counter", "Notification deliveries per channel", \
+                {"channel": channel, "outcome": outcome}, stats[outcome]
+        yield "notify_queued", "gauge", "Deliveries queued per channel", {"channel": channel}, stats["queued"]
+
+    for name, stats in get_breaker_stats().items():
+        yield "circuit_breaker_state", "gauge", "0 closed, 1 half-open, 2 open", {"name": name}, \
+            BREAKER_STATE_VALUES[stats["state"]]
+        yield "circuit_breaker_trips_total", "counter", "Times the breaker opened", {"name": name}, stats["trips"]
+        yield "circuit_breaker_rejected_total", "counter", "Calls failed fast", {"name": name}, stats["rejected"]
+
+    for limiter, stats in admission.get_stats().items():
+        for outcome in ("allowed", "rejected"):
+            yield "ratelimit_decisions_total", "counter", "Admission decisions", \
+                {"limiter": limiter, "outcome": outcome}, stats[outcome]
+
+    if clinical_agent.ready:
+        advice = clinical_agent.get_stats()
+        yield "advice_cache_hits_total", "counter", "Advice cache hits", {}, advice["hits"]
+        yield "advice_cache_misses_total", "counter", "Advice cache misses", {}, advice["misses"]
+        yield "advice_llm_calls_total", "counter", "Groq completions requested", {}, advice["llm_calls"]
+
+    if AUTH_ENABLED:
+        auth = get_auth_pool_stats()
+        yield "auth_pool_in_flight", "gauge", "bcrypt jobs queued or running", {}, auth["in_flight"]
+        for outcome in ("rejected", "timeouts", "errors"):
+            yield "auth_pool_failures_total", "counter", "Password pool failures", {"outcome": outcome}, auth[outcome]
+
+    log_stats = get_logging_stats()
+    if log_stats["enabled"]:
+        yield "log_queue_depth", "gauge", "Log records waiting to be written", {}, log_stats["queued"]
+        yield "log_dropped_total", "counter", "Log records dropped on a full queue", {}, log_stats["dropped"]
+
+    yield "vitals_spool_pending", "gauge", "Vitals rows waiting for MySQL", {}, len(vitals_spool)
+    retention = retention_job.get_stats()
+    yield "retention_partitions_removed_total", "counter", "Expired partitions dropped or archived", {}, \
+        retention["partitions_removed"]
+    yield "retention_rows_removed_total", "counter", "Expired rows removed (SQLite backend)", {}, \
+        retention["rows_removed"]
+    archived = archive.get_stats()
+    yield "archive_rows_total", "counter", "Rows exported to the columnar archive", {}, archived["rows_archived"]
+    yield "archive_bytes", "gauge", "Size of the columnar archive on disk", {}, archived["bytes"]
+    for name, status in components.status().items():
+        yield "component_ready", "gauge", "1 once the component is initialized", {"component": name}, \
+            int(status["ready"])
+
+
+metrics.REGISTRY.register_collector(subsystem_metrics)
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus text format"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+# ============================================================
+# ADMIN: PROFILING
+# ============================================================
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+def admin_only(f):
+    """Requires X-Admin-Token; the admin routes do not exist without ADMIN_TOKEN"""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            abort(404)
+        token = request.headers.get("X-Admin-Token", "")
+        if not hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+            return jsonify({"status": "error", "message": "Admin token required"}), 403
+        return f(*args, **kwargs)
+    return wrapper
+
+
+@app.route("/admin/profile", methods=["POST"])
+@admin_only
+def admin_profile():
+    """
+    Sample request threads and return folded stacks (flamegraph.pl / speedscope).
+    ?seconds=10 (max 120) &requests=N (stop after N matching requests)
+    &route=/esp32 &interval_ms=5
+    """
+    seconds = min(request.args.get("seconds", default=10, type=float), 120)
+    max_requests = request.args.get("requests", type=int)
+    route = request.args.get("route")
+    interval = max(request.args.get("interval_ms", default=5, type=float), 1) / 1000
+
+    try:
+        folded, info = sampling_profiler.run(seconds, max_requests, route, interval)
+    except RuntimeError as e:
+        return jsonify({"status": "error", "message": str(e)}), 409
+
+    headers = {f"X-Profile-{k.replace('_', '-').title()}": str(v) for k, v in info.items()}
+    return Response(folded, content_type="text/plain; charset=utf-8", headers=headers)
+
+
+@app.route("/admin/trace", methods=["POST"])
+@admin_only
+def admin_trace():
+    """Trace calls into db / model / agents for the next ?requests=N (&route=/esp32) requests"""
+    call_tracer.arm(min(request.args.get("requests", default=1, type=int), 100), request.args.get("route"))
+    return jsonify(call_tracer.status())
+
+
+@app.route("/admin/traces", methods=["GET"])
+@admin_only
+def admin_traces():
+    return jsonify({"status": call_tracer.status(), "traces": list(call_tracer.traces)})
+
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness: the process is up and serving"""
+    return jsonify({"status": "alive"})
+
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """Readiness: every required component is initialized"""
+    ready = components.is_ready()
+    return jsonify({"ready": ready, "components": components.status()}), 200 if ready else 503
+
+
+@app.route("/startup", methods=["GET"])
+def startup_report():
+    return jsonify(components.timings())
+
+
+@app.route("/ratelimit/stats", methods=["GET"])
+def ratelimit_stats():
+    return jsonify(admission.get_stats())
+
+
+@app.route("/advice", methods=["GET"])
+def get_advice():
+    """On-demand advice for the current vitals (served from the cache when possible)"""
+    state = engine.state
+    if "--" in (state["heart_rate"], state["spo2"], state["temperature"]):
+        return jsonify({"status": "error", "message": "No vitals yet"}), 404
+
+    vitals = {
+        "age": state["age"],
+        "heart_rate": state["heart_rate"],
+        "spo2": state["spo2"],
+        "temperature": state["temperature"]
+    }
+    advice = advice_for(vitals, state["risk"])
+    return jsonify({"status": "ok", "risk": state["risk"], "advice": advice})
+
+
+@app.route("/advice/stats", methods=["GET"])
+def advice_stats():
+    if not clinical_agent.ready:
+        return jsonify(components.status()["clinical_agent"]), 503
+    return jsonify(clinical_agent.get_stats())
+
+
+@app.route("/alerts/stats", methods=["GET"])
+def alert_stats():
+    return jsonify(alert_dispatcher.get_stats())
+
+
+@app.route("/breakers", methods=["GET"])
+def breaker_stats():
+    """Circuit state and trip counts for Groq, Twilio and MySQL, plus their spools"""
+    return jsonify({
+        "breakers": get_breaker_stats(),
+        "spools": {
+            "vitals": vitals_spool.get_stats(),
+            "whatsapp": whatsapp_agent.spool.get_stats()
+        }
+    })
+
+
+@app.route("/logging/stats", methods=["GET"])
+def logging_stats():
+    return jsonify(get_logging_stats())
+
+
+@app.route("/notify/stats", methods=["GET"])
+def notify_stats():
+    return jsonify(notifier.get_stats())
+
+
+@app.route("/retention/stats", methods=["GET"])
+def retention_stats():
+    return jsonify(retention_job.get_stats())
+
+
+@app.route("/auth/stats", methods=["GET"])
+def auth_stats():
+    if not AUTH_ENABLED:
+        return jsonify({"enabled": False})
+    return jsonify(dict(get_auth_pool_stats(), enabled=True))
+
 # ============================================================
 # FRONTEND ROUTES
 # ============================================================
@@ -135,174 +536,201 @@ def charts_page():
 # EVENT ROUTE (intruder etc.)
 # ============================================================
 @app.route("/event", methods=["POST"])
+@device_signed
+@rate_limited_ingest
 def receive_event():
     data = request.json
     event_type = data.get("event")
 
-    state = engine.process_event(event_type)
+    image_path = None
+    snapshot_id = data.get("snapshot_id")
+    if snapshot_id:
+        image_path = f"snapshots/{snapshot_id}.jpg"
+
+    state = engine.process_event(event_type, image_path=image_path)
 
     if event_type == "intruder_detected":
-        whatsapp_agent.send_alert(
+        alert_dispatcher.submit(
+            "facility", "intruder",
             "🚨 SECURITY ALERT: Intruder detected in restricted area."
         )
 
     return jsonify(state)
 
+# ============================================================
+# ACTIVITY ROUTE (posture detector / accelerometer)
+# ============================================================
+@app.route("/activity", methods=["POST"])
+@device_signed
+@rate_limited_ingest
+def receive_activity():
+    """Accepts one update, a list of updates, or {"updates": [...]}"""
+    updates = parse_activity_updates(request.get_json(silent=True))
+    if updates is None:
+        return jsonify({"status": "error", "message": "JSON body required"}), 400
+    if not updates:
+        return jsonify({"status": "error", "message": "No activity in request"}), 400
+
+    # ISO-8601 timestamps sort correctly as strings
+    latest = max(updates, key=lambda u: str(u.get("timestamp") or ""))
+    device_id = g.device_id or latest.get("device_id", "unknown")
+    timestamp = str(latest.get("timestamp") or "")
+
+    # Newest timestamp per device wins, so replayed spools never overwrite fresher state
+    state = engine.update_activity_if_newer(device_id, timestamp, latest["activity"])
+
+    return jsonify({
+        "status": "success",
+        "activity": state["activity"],
+        "accepted": len(updates)
+    })
+
+# ============================================================
+# INTRUDER SNAPSHOTS
+# ============================================================
+SNAPSHOT_CACHE_SECONDS = 365 * 24 * 3600
+
+@app.route("/snapshots/<path:filename>")
+def snapshot_file(filename):
+    # Snapshot files are never rewritten, so browsers can cache them forever
+    if not filename.endswith(".jpg"):
+        abort(404)
+    response = send_from_directory(snapshot_store.root, filename, max_age=SNAPSHOT_CACHE_SECONDS)
+    response.headers["Cache-Control"] = f"public, max-age={SNAPSHOT_CACHE_SECONDS}, immutable"
+    return response
+
+@app.route("/intruders", methods=["GET"])
+def intruder_events():
+    """Paginated intruder index, newest first (?before=<ts> for older, ?after=<ts> for new)"""
+    before = request.args.get("before", type=float)
+    after = request.args.get("after", type=float)
+    limit = min(request.args.get("limit", default=20, type=int), 100)
+
+    events = snapshot_store.list_events(before=before, after=after, limit=limit)
+    page = [{
+        "id": e["id"],
+        "ts": e["ts"],
+        "image_url": f"/snapshots/{e['image']}",
+        "thumb_url": f"/snapshots/{e['thumb']}"
+    } for e in events]
+
+    newest = snapshot_store.latest() if after is not None and page else None
+    return jsonify({
+        "events": page,
+        "next_before": page[-1]["ts"] if len(page) == limit else None,
+        # ?after= pages run oldest-first: more to fetch with after=events[0].ts
+        "has_more": bool(newest and newest["ts"] > page[0]["ts"])
+    })
+
 # ============================================================
 # ESP32 DATA ENDPOINT
 # ============================================================
 @app.route("/esp32", methods=["POST"])
+@device_signed
+@rate_limited_ingest
 def esp32_post():
     try:
-        raw_data = request.json or {}
-
-        data = {}
-        for k, v in raw_data.items():
-            data[str(k).lower().strip()] = v
-
-        device_id = data.get("device_id", "esp32")
-
-        print(f"[ESP32] Received Data: {data}")
-
-        def get_best_vital(keys):
-            best_val = None
-            for k in keys:
-                val = data.get(k)
-                if val is not None:
-                    is_zero = (str(val).strip() == "0" or val == 0)
-                    is_best_zero = (best_val is None or str(best_val).strip() == "0" or best_val == 0)
-                    if best_val is None or (is_best_zero and not is_zero):
-                        best_val = val
-            return best_val
-
-        heart_rate = get_best_vital(["heart_rate", "hr", "pulse", "bpm"])
-        spo2 = get_best_vital(["spo2", "spo", "ox", "oxygen"])
-        temperature = get_best_vital(["temperature", "temp", "t"])
-
-        name = "Ramesh Gupta"
-        age = 20
-        gender = "male"
-        smoking = False
-        hypertension = False
-        weight = 70.0
-
-        humidity = data.get("humidity")
-        room_temp = data.get("room_temp")
-        aqi = data.get("aqi")
-        emergency = data.get("emergency")
-        fall = data.get("fall")
-        posture = data.get("posture")
+        with stage("normalize"):
+            data = normalize_payload(request.json)
+            readings = extract_readings(data)
+
+        # A verified signature pins the device identity
+        device_id = g.device_id or data.get("device_id", "esp32")
+
+        # High volume: DEBUG, and usually sampled (LOG_SAMPLE=esp32=N)
+        esp32_log.debug("payload %s", data, extra={"device_id": device_id})
+
+        patient = DEFAULT_PATIENT
+        name = patient["name"]
 
         timestamp = datetime.utcnow().isoformat()
 
-        if posture:
-            engine.update_activity(posture)
+        if readings["posture"]:
+            engine.update_activity(readings["posture"])
 
-        if humidity is not None or room_temp is not None or aqi is not None:
+        if has_env(readings):
             engine.update_env_data(
-                humidity=humidity or "--",
-                room_temp=room_temp or "--",
-                aqi=aqi or "--"
+                humidity=readings["humidity"] or "--",
+                room_temp=readings["room_temp"] or "--",
+                aqi=readings["aqi"] or "--"
             )
 
         # Emergency alert
-        if emergency:
-            engine.update_emergency(emergency)
-            whatsapp_agent.send_alert(
-                f"🆘 EMERGENCY: Help button pressed by {name}!"
-            )
+        if readings["emergency"]:
+            engine.update_emergency(readings["emergency"])
+            with stage("alert_submit"):
+                alert_dispatcher.submit(name, "emergency", emergency_message(name))
 
         # Fall alert
-        if fall:
-            engine.update_fall(fall)
-            whatsapp_agent.send_alert(
-                f"⚠️ FALL detected for {name}! Immediate assistance required."
-            )
+        if readings["fall"]:
+            engine.update_fall(readings["fall"])
+            with stage("alert_submit"):
+                alert_dispatcher.submit(name, "fall", fall_message(name))
 
         # Vitals update
-        if heart_rate is not None and spo2 is not None and temperature is not None:
-            payload = {
-                "age": age,
-                "heart_rate": heart_rate,
-                "spo2": spo2,
-                "temperature": temperature,
-                "gender": gender,
-                "smoking": smoking,
-                "hypertension": hypertension,
-                "weight": weight,
-                "name": name
-            }
-
-            risk_result = health_agent.predict(payload)
-
-            advice = clinical_agent.generate_advice(
-                vitals={
-                    "age": age,
-                    "heart_rate": heart_rate,
-                    "spo2": spo2,
-                    "temperature": temperature
-                },
-                risk=risk_result["risk"]
-            )
-
-            engine.update_vitals(
-                heart_rate=heart_rate,
-                spo2=spo2,
-                temperature=temperature,
-                risk=risk_result["risk"],
-                age=age,
-                gender=gender,
-                smoking=smoking,
-                hypertension=hypertension,
-                name=name
-            )
+        if has_vitals(readings):
+            with stage("predict"):
+                risk_result = health_agent.predict(model_payload(readings, patient))
+
+            risk = risk_result["risk"]
+            previous_risk = engine.state["risk"]
+
+            # Advice is only used in high-risk alerts: generate it when the
+            # risk turns High (cached per bucketed situation) and reuse it
+            # while the patient stays High
+            advice = None
+            if risk == "High":
+                advice = shared_store.get("latest_advice")
+                if previous_risk != "High" or advice is None:
+                    with stage("advice"):
+                        advice = advice_for(advice_vitals(readings, patient), risk)
+                    # Canned advice is not kept: the next reading asks Groq again
+                    shared_store.set("latest_advice", None if is_canned_advice(advice) else advice)
+
+            with stage("state_update"):
+                engine.update_vitals(
+                    heart_rate=readings["heart_rate"],
+                    spo2=readings["spo2"],
+                    temperature=readings["temperature"],
+                    risk=risk,
+                    age=patient["age"],
+                    gender=patient["gender"],
+                    smoking=patient["smoking"],
+                    hypertension=patient["hypertension"],
+                    name=name
+                )
 
             # High risk alert
-            if risk_result["risk"] == "High":
-                whatsapp_agent.send_alert(
-                    f"""⚠️ MEDICAL ALERT
-Patient: {name}
-Status: HIGH RISK
-
-Heart Rate: {heart_rate} bpm
-SpO2: {spo2}%
-Temperature: {temperature}°C
-
-Advice:
-{advice[:500]}"""
-                )
+            if risk == "High":
+                with stage("alert_submit"):
+                    alert_dispatcher.submit(name, "high_risk", high_risk_message(name, readings, advice))
 
             try:
-                lookup_payload = {
-                    "name": name,
-                    "age": age,
-                    "gender": gender,
-                    "smoking": smoking,
-                    "hypertension": hypertension
-                }
-                patient_id = get_or_create_patient(lookup_payload)
-
-                vitals_payload = {
-                    "heart_rate": heart_rate,
-                    "spo2": spo2,
-                    "temperature": temperature,
-                    "weight": weight
-                }
-
-                log_vitals(patient_id, vitals_payload)
+                with stage("db_write"):
+                    patient_id = get_or_create_patient(lookup_payload(patient))
+                    log_vitals(patient_id, vitals_row(readings, patient))
+
+                # MySQL is reachable again: write what was spooled meanwhile
+                if len(vitals_spool):
+                    threading.Thread(target=replay_vitals_spool, daemon=True).start()
 
             except Exception as db_e:
-                print(f"DB Log Error: {db_e}")
+                if not is_transient_db_error(db_e):
+                    esp32_log.error("DB rejected vitals row, not spooled: %s", db_e)
+                else:
+                    esp32_log.warning("DB log failed, vitals spooled: %s", db_e)
+                    spool_vitals(lookup_payload(patient), vitals_row(readings, patient))
 
         # CSV log
-        with open("esp32_sensor_log.csv", "a") as f:
-            f.write(f"{timestamp},{device_id},{name},{heart_rate},{spo2},{temperature},{humidity},{room_temp},{aqi}\n")
+        with stage("csv_append"):
+            with open("esp32_sensor_log.csv", "a") as f:
+                f.write(csv_line(timestamp, device_id, name, readings))
 
-        print("✨ Sensor data update complete")
+        esp32_log.debug("update complete", extra={"device_id": device_id})
         return jsonify({"status": "ok"})
 
     except Exception as e:
-        print(f"💥 ESP32 Endpoint Error: {e}")
+        esp32_log.exception("endpoint error: %s", e)
         return jsonify({"status": "error", "message": str(e)}), 500
 
 # ============================================================
@@ -312,6 +740,105 @@ Advice:
 def get_data():
     return jsonify(engine.state)
 
+
+# Each waiting long-poll holds a request thread, so only a few may wait at
+# once; the rest get the current state at once and are asked to retry later
+LONGPOLL_MAX_WAITERS = int(os.getenv("LONGPOLL_MAX_WAITERS", max(1, int(os.getenv("WEB_THREADS", 4)) // 4)))
+longpoll_slots = threading.BoundedSemaphore(LONGPOLL_MAX_WAITERS)
+
+
+@app.route("/data/changes", methods=["GET"])
+def data_changes():
+    """Long-poll: answers as soon as the state version moves past ?since=<version>"""
+    since = request.args.get("since", type=int)
+    timeout = min(request.args.get("timeout", default=25, type=float), 60)
+    if since is None:
+        return jsonify({"version": engine.version(), "state": engine.state})
+    if not longpoll_slots.acquire(blocking=False):
+        return jsonify({"version": engine.version(), "state": engine.state}), 200, {"Retry-After": "5"}
+    try:
+        version, state = engine.wait_for_change(since, timeout)
+    finally:
+        longpoll_slots.release()
+    return jsonify({"version": version, "state": state})
+
+# ============================================================
+# HISTORY (charts)
+# ============================================================
+def history_rows(rows):
+    for row in rows:
+        if isinstance(row["timestamp"], datetime):
+            row["timestamp"] = row["timestamp"].isoformat()
+        else:
+            row["timestamp"] = str(row["timestamp"]).replace(" ", "T")
+    return rows
+
+
+def _local_naive(value):
+    """ISO timestamp -> naive local datetime, the way rows and the archive store them"""
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment
+
+
+def history_window(args):
+    """
+    ?start=&end= (ISO, with or without offset) and ?resolution=<seconds>;
+    None when no range was asked for. Raises ValueError for a bad range.
+    """
+    start = args.get("start")
+    if not start:
+        return None
+    end = args.get("end")
+    resolution = args.get("resolution", type=int)
+    if resolution is not None and resolution <= 0:
+        raise ValueError("resolution must be a positive number of seconds")
+    return (_local_naive(start),
+            _local_naive(end) if end else datetime.now(),
+            resolution)
+
+
+@app.route("/api/history/vitals", methods=["GET"])
+def history_vitals():
+    """Last ?limit= readings, or ?start=&end=[&resolution=] across live and archived data"""
+    try:
+        window = history_window(request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"Bad history range: {e}"}), 400
+    try:
+        patient_id = find_patient(lookup_payload())
+        if patient_id is None:
+            rows = []
+        elif window:
+            rows = get_vitals_range(patient_id, *window)
+        else:
+            rows = get_historical_vitals(patient_id, limit=min(request.args.get("limit", 50, type=int), 1000))
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 503
+    return jsonify(history_rows(rows))
+
+
+@app.route("/api/history/env", methods=["GET"])
+def history_env():
+    try:
+        window = history_window(request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"Bad history range: {e}"}), 400
+    try:
+        if window:
+            rows = get_env_range(*window)
+        else:
+            rows = get_historical_env(limit=min(request.args.get("limit", 50, type=int), 1000))
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 503
+    return jsonify(history_rows(rows))
+
+
+@app.route("/archive/stats", methods=["GET"])
+def archive_stats():
+    return jsonify(archive.get_stats())
+
 # ============================================================
 # RUN SERVER
 # ============================================================
@@ -0,0 +1,427 @@
+"""
+Key-value state shared by all server workers.
+
+Values are JSON-serialisable objects. transact() is an atomic
+read-modify-write over one or more keys, and every committed change bumps a
+global version that wait_for_change() can block on (used for dashboard
+long-polling); bookkeeping that dashboards do not show passes
+bump_version=False.
+
+Besides the key-value data, shared by all workers and never bumping the
+version:
+- claim(): keys that expire after a TTL, for "seen before?" checks
+  (replayed signatures)
+- take_token(): token buckets (rate limits)
+- cache_get() / cache_put(): a TTL cache with a size cap (generated advice)
+
+Backends:
+- MemoryStore: one process (python server.py, tests)
+- SQLiteStore: many processes on one host (launcher.py); WAL mode, so
+  readers never block the writer
+
+STATE_BACKEND=memory|sqlite selects the backend, STATE_DB the SQLite file.
+"""
+
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no launcher.py, so one process only
+    fcntl = None
+
+
+class StoreFull(Exception):
+    """claim() found max_entries live claims in the namespace"""
+
+
+def _take_token(bucket, now, rate, burst):
+    """(tokens left, allowed, retry_after) after taking one token from a (tokens, updated) bucket"""
+    if bucket is None:
+        tokens = burst
+    else:
+        tokens = min(burst, bucket[0] + max(0.0, now - bucket[1]) * rate)
+    if tokens >= 1.0:
+        return tokens - 1.0, True, 0.0
+    return tokens, False, (1.0 - tokens) / rate if rate > 0 else 60.0
+
+
+class MemoryStore:
+    def __init__(self):
+        self._data = {}
+        self._claims = {}  # namespace -> OrderedDict(key -> expiry), oldest first
+        self._buckets = {}  # namespace -> OrderedDict(key -> (tokens, updated)), LRU
+        self._cache = {}  # namespace -> OrderedDict(key -> (expiry, value)), LRU
+        self._version = 0
+        self._cond = threading.Condition()
+
+    def get(self, key, default=None):
+        with self._cond:
+            if key not in self._data:
+                return default
+            return copy.deepcopy(self._data[key])
+
+    def set(self, key, value):
+        self.transact([key], lambda values: {key: value})
+
+    def update(self, key, fn):
+        """Atomically replace the value of key with fn(old value); returns the new value"""
+        return self.transact([key], lambda values: {key: fn(values[key])})[key]
+
+    def transact(self, keys, fn, bump_version=True):
+        """
+        fn receives {key: current value or None} for the given keys and
+        returns {key: new value} for the keys it changes. Returns the new
+        values of all given keys.
+        """
+        with self._cond:
+            values = {k: copy.deepcopy(self._data.get(k)) for k in keys}
+            changes = fn(values) or {}
+            if changes:
+                for k, v in changes.items():
+                    self._data[k] = copy.deepcopy(v)
+                if bump_version:
+                    self._version += 1
+                    self._cond.notify_all()
+            values.update(changes)
+            return values
+
+    def version(self):
+        with self._cond:
+            return self._version
+
+    def wait_for_change(self, since_version, timeout=25.0):
+        """Block until the version moves past since_version; returns the current version"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._version != since_version, timeout)
+            return self._version
+
+    def claim(self, namespace, key, ttl, max_entries=None):
+        """
+        True if key was not claimed (or its claim expired) and is now claimed
+        for ttl seconds; False if it is still claimed. Raises StoreFull rather
+        than evicting live claims.
+        """
+        now = time.time()
+        with self._cond:
+            claims = self._claims.setdefault(namespace, OrderedDict())
+            while claims:
+                oldest, expiry = next(iter(claims.items()))
+                if expiry > now:
+                    break
+                del claims[oldest]
+            expiry = claims.get(key)
+            if expiry is not None and expiry > now:
+                return False
+            if max_entries is not None and key not in claims and len(claims) >= max_entries:
+                raise StoreFull(namespace)
+            claims.pop(key, None)
+            claims[key] = now + ttl
+            return True
+
+    def release(self, namespace, key):
+        with self._cond:
+            self._claims.get(namespace, {}).pop(key, None)
+
+    def take_token(self, namespace, key, rate, burst, max_keys=10000):
+        """
+        Take one token from key's bucket (burst tokens, refilled at rate per
+        second). Returns (allowed, retry_after_seconds).
+        """
+        now = time.time()
+        with self._cond:
+            buckets = self._buckets.setdefault(namespace, OrderedDict())
+            tokens, allowed, retry_after = _take_token(buckets.get(key), now, rate, burst)
+            buckets[key] = (tokens, now)
+            buckets.move_to_end(key)
+            if len(buckets) > max_keys:
+                buckets.popitem(last=False)
+            return allowed, retry_after
+
+    def cache_get(self, namespace, key):
+        """Cached value, or None if missing or expired"""
+        now = time.time()
+        with self._cond:
+            entries = self._cache.get(namespace, {})
+            entry = entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del entries[key]
+                return None
+            entries.move_to_end(key)
+            return copy.deepcopy(entry[1])
+
+    def cache_put(self, namespace, key, value, ttl, max_entries):
+        """Store value for ttl seconds; returns how many entries were evicted to make room"""
+        with self._cond:
+            entries = self._cache.setdefault(namespace, OrderedDict())
+            entries[key] = (time.time() + ttl, copy.deepcopy(value))
+            entries.move_to_end(key)
+            evicted = 0
+            while len(entries) > max_entries:
+                entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def cache_size(self, namespace):
+        with self._cond:
+            return len(self._cache.get(namespace, {}))
+
+    def clear(self):
+        with self._cond:
+            self._data.clear()
+            self._claims.clear()
+            self._buckets.clear()
+            self._cache.clear()
+            self._version += 1
+            self._cond.notify_all()
+
+
+class SQLiteStore:
+    def __init__(self, path="shared_state.db", poll_interval=0.05):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        # One watcher thread per process serves every wait_for_change()
+        self._watch = threading.Condition()
+        self._waiters = 0
+        self._seen_version = None
+        self._watcher = None
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY CHECK (id = 0), version INTEGER NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO meta (id, version) VALUES (0, 0)")
+        conn.execute("CREATE TABLE IF NOT EXISTS claims (ns TEXT NOT NULL, key TEXT NOT NULL, "
+                     "expires REAL NOT NULL, PRIMARY KEY (ns, key))")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_claims_expiry ON claims (ns, expires)")
+        conn.execute("CREATE TABLE IF NOT EXISTS claim_counts (ns TEXT PRIMARY KEY, n INTEGER NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS buckets (ns TEXT NOT NULL, key TEXT NOT NULL, "
+                     "tokens REAL NOT NULL, updated REAL NOT NULL, PRIMARY KEY (ns, key))")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_buckets_updated ON buckets (ns, updated)")
+        conn.execute("CREATE TABLE IF NOT EXISTS cache (ns TEXT NOT NULL, key TEXT NOT NULL, "
+                     "value TEXT NOT NULL, expires REAL NOT NULL, PRIMARY KEY (ns, key))")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_expiry ON cache (ns, expires)")
+
+    def _conn(self):
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, default=None):
+        row = self._conn().execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, key, value):
+        self.transact([key], lambda values: {key: value})
+
+    def update(self, key, fn):
+        return self.transact([key], lambda values: {key: fn(values[key])})[key]
+
+    def transact(self, keys, fn, bump_version=True):
+        conn = self._conn()
+        # IMMEDIATE takes the write lock up front, so two workers can never
+        # both read the old value and overwrite each other
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            values = {}
+            for k in keys:
+                row = conn.execute("SELECT value FROM kv WHERE key = ?", (k,)).fetchone()
+                values[k] = json.loads(row[0]) if row else None
+            changes = fn(values) or {}
+            if changes:
+                conn.executemany(
+                    "INSERT INTO kv (key, value) VALUES (?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                    [(k, json.dumps(v)) for k, v in changes.items()]
+                )
+                if bump_version:
+                    conn.execute("UPDATE meta SET version = version + 1 WHERE id = 0")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        values.update(changes)
+        return values
+
+    def version(self):
+        return self._conn().execute("SELECT version FROM meta WHERE id = 0").fetchone()[0]
+
+    def wait_for_change(self, since_version, timeout=25.0):
+        """
+        Waiters sleep on a condition; the process's watcher thread checks
+        PRAGMA data_version (no table read) every poll_interval while anyone
+        is waiting, and reads the version only when another connection committed.
+        """
+        deadline = time.time() + timeout
+        version = self.version()
+        with self._watch:
+            self._waiters += 1
+            if self._watcher is None:
+                self._watcher = threading.Thread(target=self._watch_versions, name="state-watch", daemon=True)
+                self._watcher.start()
+            self._watch.notify_all()
+            try:
+                while True:
+                    # Versions only grow, so the newer of the two is current
+                    version = max(version, self._seen_version or 0)
+                    remaining = deadline - time.time()
+                    if version != since_version or remaining <= 0:
+                        return version
+                    self._watch.wait(remaining)
+            finally:
+                self._waiters -= 1
+
+    def _watch_versions(self):
+        conn = self._conn()
+        last = None
+        while True:
+            with self._watch:
+                while not self._waiters:
+                    self._watch.wait()
+            data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != last:
+                last = data_version
+                version = self.version()
+                with self._watch:
+                    self._seen_version = version
+                    self._watch.notify_all()
+            time.sleep(self.poll_interval)
+
+    def claim(self, namespace, key, ttl, max_entries=None):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            expired = conn.execute("DELETE FROM claims WHERE ns = ? AND expires <= ?", (namespace, now)).rowcount
+            row = conn.execute("SELECT n FROM claim_counts WHERE ns = ?", (namespace,)).fetchone()
+            count = max(0, (row[0] if row else 0) - expired)
+            if conn.execute("SELECT 1 FROM claims WHERE ns = ? AND key = ?", (namespace, key)).fetchone():
+                claimed = False
+            elif max_entries is not None and count >= max_entries:
+                raise StoreFull(namespace)
+            else:
+                conn.execute("INSERT INTO claims (ns, key, expires) VALUES (?, ?, ?)", (namespace, key, now + ttl))
+                count += 1
+                claimed = True
+            conn.execute("INSERT INTO claim_counts (ns, n) VALUES (?, ?) "
+                         "ON CONFLICT(ns) DO UPDATE SET n = excluded.n", (namespace, count))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return claimed
+
+    def release(self, namespace, key):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("DELETE FROM claims WHERE ns = ? AND key = ?", (namespace, key)).rowcount:
+                conn.execute("UPDATE claim_counts SET n = n - 1 WHERE ns = ?", (namespace,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def take_token(self, namespace, key, rate, burst, max_keys=None):
+        # max_keys is not needed here: idle buckets are deleted once full again
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE ns = ? AND key = ?",
+                               (namespace, key)).fetchone()
+            tokens, allowed, retry_after = _take_token(row, now, rate, burst)
+            conn.execute("INSERT INTO buckets (ns, key, tokens, updated) VALUES (?, ?, ?, ?) "
+                         "ON CONFLICT(ns, key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                         (namespace, key, tokens, now))
+            if row is None and rate > 0:
+                # A bucket idle long enough to refill completely is the same as no bucket
+                conn.execute("DELETE FROM buckets WHERE ns = ? AND updated < ?", (namespace, now - burst / rate))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, retry_after
+
+    def cache_get(self, namespace, key):
+        row = self._conn().execute("SELECT value FROM cache WHERE ns = ? AND key = ? AND expires > ?",
+                                   (namespace, key, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def cache_put(self, namespace, key, value, ttl, max_entries):
+        # Evicts expired entries first, then the ones closest to expiry
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT INTO cache (ns, key, value, expires) VALUES (?, ?, ?, ?) "
+                         "ON CONFLICT(ns, key) DO UPDATE SET value = excluded.value, expires = excluded.expires",
+                         (namespace, key, json.dumps(value), now + ttl))
+            conn.execute("DELETE FROM cache WHERE ns = ? AND expires <= ?", (namespace, now))
+            size = conn.execute("SELECT COUNT(*) FROM cache WHERE ns = ?", (namespace,)).fetchone()[0]
+            evicted = max(0, size - max_entries)
+            if evicted:
+                conn.execute("DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache WHERE ns = ? "
+                             "ORDER BY expires LIMIT ?)", (namespace, evicted))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return evicted
+
+    def cache_size(self, namespace):
+        return self._conn().execute("SELECT COUNT(*) FROM cache WHERE ns = ? AND expires > ?",
+                                    (namespace, time.time())).fetchone()[0]
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM kv")
+        conn.execute("DELETE FROM claims")
+        conn.execute("DELETE FROM claim_counts")
+        conn.execute("DELETE FROM buckets")
+        conn.execute("DELETE FROM cache")
+        conn.execute("UPDATE meta SET version = version + 1 WHERE id = 0")
+        conn.execute("COMMIT")
+
+
+@contextmanager
+def file_lock(path, blocking=True):
+    """
+    Exclusive lock across processes (flock on path). Yields False when
+    blocking=False and another holder has it. Two opens of the same path
+    conflict even within one process, so never nest locks on one path.
+    """
+    if fcntl is None:
+        yield True
+        return
+    with open(path, "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            acquired = True
+        except BlockingIOError:
+            acquired = False
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def get_store():
+    backend = os.getenv("STATE_BACKEND", "memory").lower()
+    if backend == "sqlite":
+        return SQLiteStore(os.getenv("STATE_DB", "shared_state.db"))
+    return MemoryStore()
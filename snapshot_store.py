@@ -0,0 +1,241 @@
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join("static", "snapshots"))
+INDEX_FILE = "index.jsonl"
+
+
+def new_event_id():
+    """Time-ordered event ID, e.g. 1739000000123-1a2b3c4d"""
+    return f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+
+
+class SnapshotStore:
+    """
+    Intruder snapshot store keyed by event ID.
+
+    Full-size JPEGs and thumbnails are encoded on a background thread so the
+    camera loop never waits on disk I/O. Every snapshot gets its own file name,
+    so the URLs never change content and can be cached forever by browsers.
+    An append-only index.jsonl lists the stored events; retention by age and
+    total size is enforced after every write.
+    """
+
+    def __init__(self, root=SNAPSHOT_DIR, thumb_width=160, jpeg_quality=85,
+                 max_age_days=None, max_total_mb=None, queue_size=16):
+        self.root = root
+        self.thumb_width = thumb_width
+        self.jpeg_quality = jpeg_quality
+        self.max_age = float(max_age_days if max_age_days is not None
+                             else os.getenv("SNAPSHOT_MAX_AGE_DAYS", 30)) * 86400
+        self.max_total_bytes = float(max_total_mb if max_total_mb is not None
+                                     else os.getenv("SNAPSHOT_MAX_TOTAL_MB", 500)) * 1024 * 1024
+
+        os.makedirs(self.root, exist_ok=True)
+        self.index_path = os.path.join(self.root, INDEX_FILE)
+
+        self._lock = threading.Lock()
+        self._events = []          # oldest first
+        self._index_sig = None     # (mtime, size) of the index we last loaded
+        self._load_index()
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._worker = None
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+    def submit(self, frame, event_id=None, meta=None):
+        """Queue a frame for encoding and return its event ID immediately"""
+        event_id = event_id or new_event_id()
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((event_id, frame.copy(), meta or {}))
+        except queue.Full:
+            print(f"⚠ Snapshot queue full, dropping snapshot {event_id}")
+        return event_id
+
+    def flush(self, timeout=None):
+        """Block until every queued snapshot is written"""
+        if self._worker is None:
+            return
+        if timeout is None:
+            self._queue.join()
+            return
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.01)
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="snapshot-writer", daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            event_id, frame, meta = self._queue.get()
+            try:
+                self._write(event_id, frame, meta)
+                self.enforce_retention()
+            except Exception as e:
+                print(f"✗ Snapshot write failed for {event_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, event_id, frame, meta):
+        import cv2  # Only the writer needs OpenCV; the server just reads the index
+
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality]
+
+        ok, full = cv2.imencode(".jpg", frame, params)
+        if not ok:
+            raise RuntimeError("JPEG encoding failed")
+
+        h, w = frame.shape[:2]
+        thumb_h = max(1, int(h * self.thumb_width / w))
+        thumb_frame = cv2.resize(frame, (self.thumb_width, thumb_h), interpolation=cv2.INTER_AREA)
+        ok, thumb = cv2.imencode(".jpg", thumb_frame, params)
+        if not ok:
+            raise RuntimeError("Thumbnail encoding failed")
+
+        image_name = f"{event_id}.jpg"
+        thumb_name = f"{event_id}_thumb.jpg"
+        self._write_atomic(image_name, full.tobytes())
+        self._write_atomic(thumb_name, thumb.tobytes())
+
+        record = {
+            "id": event_id,
+            "ts": time.time(),
+            "image": image_name,
+            "thumb": thumb_name,
+            "bytes": int(full.nbytes + thumb.nbytes),
+            "meta": meta,
+        }
+
+        with self._lock:
+            with open(self.index_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+            self._events.append(record)
+            self._index_sig = self._stat_index()
+
+    def _write_atomic(self, name, data):
+        path = os.path.join(self.root, name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    # ------------------------------------------------------------------
+    # Retention
+    # ------------------------------------------------------------------
+    def enforce_retention(self):
+        """Delete snapshots older than max_age or beyond max_total_bytes (oldest first)"""
+        with self._lock:
+            self._reload_if_changed()
+
+            cutoff = time.time() - self.max_age
+            total = sum(e["bytes"] for e in self._events)
+
+            keep_from = 0
+            for event in self._events:
+                if event["ts"] >= cutoff and total <= self.max_total_bytes:
+                    break
+                total -= event["bytes"]
+                keep_from += 1
+
+            if keep_from == 0:
+                return 0
+
+            expired = self._events[:keep_from]
+            self._events = self._events[keep_from:]
+
+            for event in expired:
+                for name in (event["image"], event["thumb"]):
+                    try:
+                        os.remove(os.path.join(self.root, name))
+                    except FileNotFoundError:
+                        pass
+
+            # Rewrite the index without the expired records
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                for event in self._events:
+                    f.write(json.dumps(event) + "\n")
+            os.replace(tmp_path, self.index_path)
+            self._index_sig = self._stat_index()
+
+        return len(expired)
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+    def list_events(self, before=None, after=None, limit=20):
+        """
+        Page of events, newest first.
+        - before: only events with ts < before (older pages)
+        - after: only events with ts > after (what the client has not seen yet);
+          the page holds the oldest `limit` of them, so a client that keeps
+          asking with after=<newest ts seen> walks through a burst without gaps
+        """
+        with self._lock:
+            self._reload_if_changed()
+            events = self._events
+
+        if after is not None and before is None:
+            page = []
+            for event in events:
+                if event["ts"] > after:
+                    page.append(event)
+                    if len(page) >= limit:
+                        break
+            return page[::-1]
+
+        page = []
+        for event in reversed(events):
+            if before is not None and event["ts"] >= before:
+                continue
+            if after is not None and event["ts"] <= after:
+                break
+            page.append(event)
+            if len(page) >= limit:
+                break
+        return page
+
+    def latest(self):
+        with self._lock:
+            self._reload_if_changed()
+            return self._events[-1] if self._events else None
+
+    def _stat_index(self):
+        try:
+            st = os.stat(self.index_path)
+            return (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def _reload_if_changed(self):
+        # Another process (recognize.py) may have appended to the index
+        if self._stat_index() != self._index_sig:
+            self._load_index()
+
+    def _load_index(self):
+        events = []
+        try:
+            with open(self.index_path) as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        events.append(json.loads(line))
+                    except ValueError:
+                        pass  # Partially written last line
+        except FileNotFoundError:
+            pass
+        events.sort(key=lambda e: e["ts"])
+        self._events = events
+        self._index_sig = self._stat_index()
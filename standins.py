@@ -0,0 +1,173 @@
+"""
+Local stand-ins for external services, for tests, demos and load runs.
+
+They mimic the small part of each client API this project uses and can
+inject latency and failures so the code around them can be exercised
+without network access or paid API calls.
+"""
+
+import itertools
+import json
+import os
+import random
+import re
+import threading
+import time
+
+from storage import SQLiteBackend
+
+
+def enabled(service):
+    """
+    True when STANDINS names this service ("mysql,groq,twilio" or "all").
+    Used by server.py and db.py to swap the real clients out for load runs.
+    """
+    names = {n.strip().lower() for n in os.getenv("STANDINS", "").split(",") if n.strip()}
+    return "all" in names or service in names
+
+
+def _env_float(service, setting, default):
+    return float(os.getenv(f"STANDIN_{service.upper()}_{setting}", default))
+
+
+def twilio_from_env():
+    return FakeTwilioClient(
+        latency=_env_float("twilio", "LATENCY", 0.3),
+        failure_rate=_env_float("twilio", "FAILURE_RATE", 0.0),
+        outbox_path=os.getenv("STANDIN_TWILIO_OUTBOX", "standin_outbox.jsonl"),
+    )
+
+
+def groq_from_env():
+    return FakeGroqClient(
+        latency=_env_float("groq", "LATENCY", 0.8),
+        failure_rate=_env_float("groq", "FAILURE_RATE", 0.0),
+    )
+
+
+def async_groq_from_env():
+    return FakeAsyncGroqClient(
+        latency=_env_float("groq", "LATENCY", 0.8),
+        failure_rate=_env_float("groq", "FAILURE_RATE", 0.0),
+    )
+
+
+class _FakeMessage:
+    def __init__(self, sid, body, from_, to):
+        self.sid = sid
+        self.status = "queued"
+        self.body = body
+        self.from_ = from_
+        self.to = to
+
+
+class FakeTwilioClient:
+    """
+    Stand-in for twilio.rest.Client (client.messages.create only).
+    - latency: seconds each send takes
+    - failure_rate: probability a send raises, like a Twilio API error
+    - outbox_path: optional JSONL file every accepted message is appended to
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0, outbox_path=None, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.outbox_path = outbox_path
+        self.sent = []
+        self._ids = itertools.count(1)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.messages = self
+
+    def create(self, body, from_, to):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            if self._random.random() < self.failure_rate:
+                raise RuntimeError("Stand-in Twilio failure (injected)")
+            message = _FakeMessage(f"SMFAKE{next(self._ids):08d}", body, from_, to)
+            self.sent.append(message)
+            if self.outbox_path:
+                with open(self.outbox_path, "a") as f:
+                    f.write(json.dumps({"sid": message.sid, "to": to, "body": body, "ts": time.time()}) + "\n")
+        return message
+
+
+class _Namespace:
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+
+
+class FakeGroqClient:
+    """
+    Stand-in for groq.Groq (client.chat.completions.create only). Returns a
+    short canned advice text built from the prompt after `latency` seconds.
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.chat = _Namespace(completions=_Namespace(create=self.create))
+
+    def _respond(self, messages):
+        with self._lock:
+            self.calls += 1
+            if self._random.random() < self.failure_rate:
+                raise RuntimeError("Stand-in Groq failure (injected)")
+        prompt = messages[-1]["content"]
+        risk = re.search(r"ML Risk Prediction: (\w+)", prompt)
+        content = (
+            f"🩺 *Stand-in advice* ({risk.group(1) if risk else 'unknown'} risk)\n"
+            "• Recheck vitals in 5 minutes\n"
+            "• Keep the patient resting\n"
+            "• Contact the doctor if readings worsen"
+        )
+        return _Namespace(choices=[_Namespace(message=_Namespace(content=content))])
+
+    def create(self, model, messages, temperature=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(messages)
+
+
+class FakeAsyncGroqClient(FakeGroqClient):
+    """Stand-in for groq.AsyncGroq"""
+
+    async def create(self, model, messages, temperature=None, **kwargs):
+        import asyncio
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(messages)
+
+
+class MySQLStandIn(SQLiteBackend):
+    """
+    Stand-in for the MySQL server: the embedded SQLite backend plus
+    `latency` per connect (like a network round trip) and injected
+    connection failures. Opens a fresh connection per call, as MySQL does.
+    """
+
+    def __init__(self, path="standin.db", latency=0.0, failure_rate=0.0, seed=None):
+        super().__init__(path, reuse_connections=False)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+
+    def connect(self):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            if self._random.random() < self.failure_rate:
+                raise RuntimeError("Stand-in MySQL failure (injected)")
+        return super().connect()
+
+
+def mysql_from_env():
+    return MySQLStandIn(
+        path=os.getenv("STANDIN_DB", "standin.db"),
+        latency=_env_float("mysql", "LATENCY", 0.002),
+        failure_rate=_env_float("mysql", "FAILURE_RATE", 0.0),
+    )
@@ -0,0 +1,208 @@
+"""
+Storage backends behind db.get_connection (used by db.py and auth.py).
+
+- MySQLBackend: a MySQL server, one connection per call (the original setup)
+- SQLiteBackend: an embedded database file for single-gateway deployments,
+  with no network round trip. WAL mode, so readers never wait for the writer
+  and several worker processes can share the file. Each thread keeps one
+  open connection, so sqlite3's per-connection statement cache works as a
+  set of prepared statements. Batches go through executemany in one
+  transaction.
+
+Both hand out connections with the mysql.connector interface this project
+uses: cursor(dictionary=...), execute/executemany with %s placeholders,
+fetchone/fetchall, lastrowid, commit, rollback and close. SQL is written in
+the MySQL dialect; the SQLite connection rewrites the few constructs that
+differ.
+
+Selected with DB_BACKEND=mysql (default) or DB_BACKEND=sqlite (file: DB_PATH).
+"""
+
+import functools
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+# MySQL -> SQLite rewrites for the statements this project issues
+_SQL_REWRITES = [
+    (re.compile(r"%s"), "?"),
+    (re.compile(r"\bINT AUTO_INCREMENT PRIMARY KEY\b", re.I), "INTEGER PRIMARY KEY AUTOINCREMENT"),
+    (re.compile(r",\s*INDEX \w+ \([^)]*\)", re.I), ""),
+    (re.compile(r"\s+AFTER \w+", re.I), ""),
+    # SQLite's CURRENT_TIMESTAMP is UTC; MySQL's, retention and the archive use local time
+    (re.compile(r"\bCURRENT_TIMESTAMP\b", re.I), "(datetime('now', 'localtime'))"),
+]
+
+SQLITE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS patients (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name VARCHAR(255), age INT, gender VARCHAR(20),
+        smoking BOOLEAN, hypertension BOOLEAN
+    );
+    CREATE INDEX IF NOT EXISTS idx_patients_identity ON patients (name, age, gender);
+    CREATE TABLE IF NOT EXISTS vitals_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INT, heart_rate DOUBLE, spo2 DOUBLE, temperature DOUBLE, weight DOUBLE,
+        risk VARCHAR(20), probability DOUBLE,
+        timestamp TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+    );
+    -- Covering index for get_historical_vitals; the time index serves retention
+    CREATE INDEX IF NOT EXISTS idx_vitals_patient_time
+        ON vitals_log (patient_id, timestamp, heart_rate, spo2, temperature, weight);
+    CREATE INDEX IF NOT EXISTS idx_vitals_time ON vitals_log (timestamp);
+    CREATE TABLE IF NOT EXISTS environmental_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        humidity VARCHAR(10), room_temp VARCHAR(10), aqi VARCHAR(10),
+        timestamp TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+    );
+    CREATE INDEX IF NOT EXISTS idx_env_time ON environmental_log (timestamp, humidity, room_temp, aqi);
+"""
+
+# Stored as MySQL would format them, so both backends return the same strings
+sqlite3.register_adapter(datetime, lambda value: value.strftime("%Y-%m-%d %H:%M:%S"))
+
+
+@functools.lru_cache(maxsize=256)
+def translate(sql):
+    """MySQL-dialect statement -> SQLite. Cached: the same text maps to the same prepared statement."""
+    for pattern, replacement in _SQL_REWRITES:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+class SQLiteCursor:
+    def __init__(self, conn, dictionary=False):
+        self._cursor = conn.cursor()
+        self._dictionary = dictionary
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(translate(sql), tuple(params))
+
+    def executemany(self, sql, rows):
+        self._cursor.executemany(translate(sql), [tuple(r) for r in rows])
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return {d[0]: v for d, v in zip(self._cursor.description, row)}
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._row(r) for r in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """
+    mysql.connector-style wrapper. close() hands a reused connection back
+    (rolling back anything left uncommitted) instead of closing the file.
+    """
+
+    def __init__(self, conn, reused=False):
+        self._conn = conn
+        self._reused = reused
+
+    def cursor(self, dictionary=False):
+        return SQLiteCursor(self._conn, dictionary)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        if self._reused:
+            self._conn.rollback()
+        else:
+            self._conn.close()
+
+
+class SQLiteBackend:
+    name = "sqlite"
+
+    def __init__(self, path="healthguard.db", reuse_connections=True, cached_statements=256):
+        self.path = path
+        self.reuse_connections = reuse_connections
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL: a commit is durable once the WAL is synced at checkpoint;
+        # a power cut can lose the last few commits but never corrupts the file
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=10000")
+        return conn
+
+    def _ensure_schema(self):
+        with self._lock:
+            if not self._initialized:
+                conn = self._open()
+                conn.executescript(SQLITE_SCHEMA)
+                conn.close()
+                self._initialized = True
+
+    def connect(self):
+        if not self._initialized:
+            self._ensure_schema()
+        if not self.reuse_connections:
+            return SQLiteConnection(self._open())
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._open()
+        return SQLiteConnection(conn, reused=True)
+
+    def describe(self):
+        return {"backend": self.name, "path": self.path}
+
+
+class MySQLBackend:
+    name = "mysql"
+
+    def __init__(self, host=None, user=None, password=None, database=None, connect_timeout=None):
+        self.host = host or os.getenv("DB_HOST", "localhost")
+        self.user = user or os.getenv("DB_USER", "root")
+        self.password = password if password is not None else os.getenv("DB_PASSWORD", "Tanisop123@")
+        self.database = database or os.getenv("DB_NAME", "ieee")
+        self.connect_timeout = connect_timeout or int(os.getenv("DB_CONNECT_TIMEOUT", 5))
+
+    def connect(self):
+        import mysql.connector
+        return mysql.connector.connect(
+            host=self.host,
+            user=self.user,
+            password=self.password,
+            database=self.database,
+            connection_timeout=self.connect_timeout
+        )
+
+    def describe(self):
+        return {"backend": self.name, "host": self.host, "database": self.database}
+
+
+def backend_from_env():
+    kind = os.getenv("DB_BACKEND", "mysql").lower()
+    if kind == "sqlite":
+        return SQLiteBackend(os.getenv("DB_PATH", "healthguard.db"))
+    if kind != "mysql":
+        raise ValueError(f"Unknown DB_BACKEND {kind!r} (expected mysql or sqlite)")
+    return MySQLBackend()
@@ -0,0 +1,172 @@
+"""
+Asynchronous structured logging.
+
+Request threads only build a LogRecord and put it on a bounded queue; a
+QueueListener thread formats and writes it. Loggers are named by category
+(request, esp32, alerts, ...) under "healthguard" and each category can have
+its own level and a sampling rate for DEBUG lines.
+
+Environment:
+    LOG_FORMAT=json|text          output format (default text)
+    LOG_LEVEL=INFO                default level for every category
+    LOG_LEVELS=request=WARNING,esp32=DEBUG
+    LOG_SAMPLE=esp32=50           keep 1 in N DEBUG records of a category
+    LOG_FILE=server.log           write here instead of stderr
+    LOG_QUEUE_SIZE=10000          records beyond this are dropped, not waited on
+"""
+
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+ROOT = "healthguard"
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_state = {"listener": None, "handler": None, "sampled_out": 0}
+_setup_lock = threading.Lock()
+
+
+def _parse_pairs(value):
+    pairs = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            key, val = item.split("=", 1)
+            pairs[key.strip()] = val.strip()
+    return pairs
+
+
+def _extra_fields(record):
+    return {k: v for k, v in vars(record).items() if k not in _STANDARD_ATTRS and not k.startswith("_")}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, category, msg and any extra fields"""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "category": record.name[len(ROOT) + 1:] or ROOT,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s [%(category)s] %(message)s")
+
+    def format(self, record):
+        record.category = record.name[len(ROOT) + 1:] or ROOT
+        line = super().format(record)
+        fields = _extra_fields(record)
+        fields.pop("category", None)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """Pass 1 in every `rate` DEBUG records; other levels always pass"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = max(1, int(rate))
+        self._counter = itertools.count()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or next(self._counter) % self.rate == 0:
+            return True
+        _state["sampled_out"] += 1
+        return False
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueue without formatting. The default QueueHandler renders the message
+    on the calling thread; here msg % args happens on the listener thread, so
+    the request path only pays for building the record.
+    """
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        if record.exc_info:
+            # Tracebacks hold frames; render them before the frames go away
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging():
+    """Configure the pipeline from the environment; safe to call more than once"""
+    with _setup_lock:
+        if _state["listener"] is not None:
+            return
+
+        if os.getenv("LOG_FILE"):
+            output = logging.FileHandler(os.getenv("LOG_FILE"), encoding="utf-8")
+        else:
+            output = logging.StreamHandler(sys.stderr)
+        output.setFormatter(JsonFormatter() if os.getenv("LOG_FORMAT", "text").lower() == "json"
+                            else TextFormatter())
+
+        q = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", 10000)))
+        handler = NonBlockingQueueHandler(q)
+
+        root = logging.getLogger(ROOT)
+        root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+        root.addHandler(handler)
+        root.propagate = False
+
+        for category, level in _parse_pairs(os.getenv("LOG_LEVELS")).items():
+            logging.getLogger(f"{ROOT}.{category}").setLevel(level.upper())
+        for category, rate in _parse_pairs(os.getenv("LOG_SAMPLE")).items():
+            logging.getLogger(f"{ROOT}.{category}").addFilter(SamplingFilter(rate))
+
+        listener = logging.handlers.QueueListener(q, output, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+        _state.update(listener=listener, handler=handler, started=time.time())
+
+
+def get_logger(category):
+    return logging.getLogger(f"{ROOT}.{category}")
+
+
+def get_logging_stats():
+    handler = _state["handler"]
+    if handler is None:
+        return {"enabled": False}
+    return {
+        "enabled": True,
+        "queued": handler.queue.qsize(),
+        "dropped": handler.dropped,
+        "sampled_out": _state["sampled_out"],
+        "levels": {
+            name[len(ROOT) + 1:] or ROOT: logging.getLevelName(logger.getEffectiveLevel())
+            for name, logger in logging.Logger.manager.loggerDict.items()
+            if isinstance(logger, logging.Logger) and name.startswith(ROOT)
+        },
+    }
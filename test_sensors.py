@@ -6,11 +6,18 @@ Run the Flask server first, then run this script to test both endpoints.
 
 import requests
 import json
+import os
 from datetime import datetime
 import time
+from device_auth import signed_post
 
 SERVER_URL = "http://localhost:5000"
 
+# The server rejects unsigned device requests by default (DEVICE_AUTH_MODE=enforce):
+# set DEVICE_ID/DEVICE_KEY to a pair from device_keys.json
+DEVICE_ID = os.getenv("DEVICE_ID", "esp32-01")
+DEVICE_KEY = os.getenv("DEVICE_KEY")
+
 def test_activity_endpoint():
     """Test the /activity endpoint with posture data"""
     print("\n🧪 Testing /activity Endpoint")
@@ -24,11 +31,8 @@ def test_activity_endpoint():
     
     for payload in test_cases:
         try:
-            response = requests.post(
-                f"{SERVER_URL}/activity",
-                json=payload,
-                timeout=5
-            )
+            response = signed_post(requests, f"{SERVER_URL}/activity", payload,
+                                   DEVICE_ID, DEVICE_KEY, timeout=5)
             print(f"\nActivity: {payload['activity']}")
             print(f"Status: {response.status_code}")
             print(f"Response: {response.json()}")
@@ -75,11 +79,8 @@ def test_esp32_endpoint():
             print(f"\nTest Case {i+1}:")
             print(f"Payload: {json.dumps(payload, indent=2)}")
             
-            response = requests.post(
-                f"{SERVER_URL}/esp32",
-                json=payload,
-                timeout=5
-            )
+            response = signed_post(requests, f"{SERVER_URL}/esp32", payload,
+                                   DEVICE_ID, DEVICE_KEY, timeout=5)
             print(f"Status: {response.status_code}")
             print(f"Response: {json.dumps(response.json(), indent=2)}")
         except Exception as e:
@@ -105,6 +106,8 @@ def test_data_endpoint():
 def main():
     print("🚀 Sensor Integration Test Suite")
     print(f"🌐 Server: {SERVER_URL}")
+    if not DEVICE_KEY:
+        print("⚠️ DEVICE_KEY not set: requests are unsigned and rejected unless DEVICE_AUTH_MODE is off/optional")
     print("\nMake sure Flask server is running: python server.py")
     
     try:
@@ -0,0 +1,568 @@
+"""
+Columnar, compressed archive of old vitals_log and environmental_log rows.
+
+Layout under ARCHIVE_DIR (default "archive"):
+    vitals/<patient_id>/<YYYY-MM-DD>.hgc    one file per patient per day
+    env/<YYYY-MM-DD>.hgc                    one file per day
+    manifest.json                           "archived before" horizon per table
+
+A chunk file is a small JSON header followed by one zlib block per column:
+timestamps delta-encoded, vitals as fixed-point integers (x100), strings
+dictionary-encoded. The header also carries 5-minute rollups (count, min,
+avg, max per numeric column), so a month-long chart reads a few thousand
+rollup rows instead of millions of readings. Files are read through mmap
+(into memory on Windows, where a mapped file cannot be replaced) and only
+the columns a query needs are decompressed; decoded chunks are kept in a
+small LRU cache.
+
+Rows get here through the retention job (RETENTION_MODE=columnar in
+schema.py), which exports expired partitions (or rows, on SQLite) and then
+removes them from the database. db.get_vitals_range / get_env_range and
+get_historical_vitals merge archive and live rows.
+
+    python vitals_archive.py --stats
+    python vitals_archive.py --vitals 1 --start 2026-01-01 --end 2026-02-01 --resolution 3600
+"""
+
+import argparse
+import calendar
+import collections
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from datetime import datetime, timedelta
+
+from shared_state import file_lock
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ROLLUP_SECONDS = 300
+# Windows cannot replace a file while any process maps it
+USE_MMAP = os.name != "nt"
+FIXED_SCALE = 100
+MAGIC = b"HGCOL1\n"
+_NONE_FIXED = -2 ** 31
+
+# (column, encoding); the first column is always the timestamp
+VITALS_COLUMNS = [
+    ("timestamp", "ts"), ("heart_rate", "fixed"), ("spo2", "fixed"), ("temperature", "fixed"),
+    ("weight", "fixed"), ("risk", "str"), ("probability", "f64"),
+]
+ENV_COLUMNS = [("timestamp", "ts"), ("humidity", "str"), ("room_temp", "str"), ("aqi", "str")]
+NUMERIC = {
+    "vitals": ("heart_rate", "spo2", "temperature", "weight"),
+    "env": ("humidity", "room_temp", "aqi"),
+}
+TABLES = {"vitals_log": "vitals", "environmental_log": "env"}
+
+
+# =============================
+# ENCODING
+# =============================
+def _to_epoch(value):
+    """Naive DB timestamps (datetime or 'YYYY-MM-DD HH:MM:SS') as seconds, treated as UTC"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return calendar.timegm(value.timetuple())
+
+
+def _from_epoch(seconds):
+    return datetime(1970, 1, 1) + timedelta(seconds=seconds)
+
+
+def _number(value):
+    """Float for numeric readings (env columns are stored as text), else None"""
+    if value is None:
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(number) else number
+
+
+def _pack(values, typecode):
+    arr = array(typecode, values)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return zlib.compress(arr.tobytes(), 6)
+
+
+def _unpack(block, typecode):
+    arr = array(typecode)
+    arr.frombytes(zlib.decompress(block))
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr
+
+
+def _encode(values, encoding):
+    """-> (compressed bytes, extra header fields)"""
+    if encoding == "ts":
+        deltas, previous = [], 0
+        for v in values:
+            deltas.append(v - previous)
+            previous = v
+        return _pack(deltas, "q"), {}
+    if encoding == "fixed":
+        return _pack([_NONE_FIXED if v is None else int(round(v * FIXED_SCALE)) for v in values], "i"), {}
+    if encoding == "count":
+        return _pack(values, "i"), {}
+    if encoding == "f64":
+        return _pack([math.nan if v is None else float(v) for v in values], "d"), {}
+    if encoding == "str":
+        dictionary, codes = {}, []
+        for v in values:
+            codes.append(dictionary.setdefault(v, len(dictionary)))
+        return _pack(codes, "I"), {"dictionary": list(dictionary)}
+    raise ValueError(f"Unknown encoding {encoding}")
+
+
+def _decode(block, meta):
+    encoding = meta["encoding"]
+    if encoding == "ts":
+        total, out = 0, []
+        for delta in _unpack(block, "q"):
+            total += delta
+            out.append(total)
+        return out
+    if encoding == "fixed":
+        return [None if v == _NONE_FIXED else v / FIXED_SCALE for v in _unpack(block, "i")]
+    if encoding == "count":
+        return list(_unpack(block, "i"))
+    if encoding == "f64":
+        return [None if math.isnan(v) else v for v in _unpack(block, "d")]
+    if encoding == "str":
+        dictionary = meta["dictionary"]
+        return [dictionary[c] for c in _unpack(block, "I")]
+    raise ValueError(f"Unknown encoding {encoding}")
+
+
+def _rollups(kind, timestamps, columns):
+    """5-minute buckets: count and min/avg/max per numeric column"""
+    buckets = collections.OrderedDict()
+    numeric = NUMERIC[kind]
+    for i, ts in enumerate(timestamps):
+        bucket = buckets.setdefault(ts - ts % ROLLUP_SECONDS, {"count": 0, "values": {c: [] for c in numeric}})
+        bucket["count"] += 1
+        for c in numeric:
+            value = _number(columns[c][i])
+            if value is not None:
+                bucket["values"][c].append(value)
+
+    rollup = {"r_timestamp": list(buckets), "r_count": [b["count"] for b in buckets.values()]}
+    for c in numeric:
+        series = [b["values"][c] for b in buckets.values()]
+        rollup[f"r_{c}_min"] = [min(v) if v else None for v in series]
+        rollup[f"r_{c}_avg"] = [sum(v) / len(v) if v else None for v in series]
+        rollup[f"r_{c}_max"] = [max(v) if v else None for v in series]
+    return rollup
+
+
+def write_chunk(path, kind, rows):
+    """rows: dicts with epoch 'timestamp', sorted; replaces the file atomically"""
+    spec = VITALS_COLUMNS if kind == "vitals" else ENV_COLUMNS
+    columns = {name: [row.get(name) for row in rows] for name, _ in spec}
+    for name in NUMERIC[kind]:
+        if dict(spec)[name] == "fixed":
+            columns[name] = [_number(v) for v in columns[name]]
+
+    blocks, meta = [], {}
+    offset = 0
+
+    def add(name, values, encoding):
+        nonlocal offset
+        block, extra = _encode(values, encoding)
+        meta[name] = dict(extra, encoding=encoding, offset=offset, length=len(block))
+        blocks.append(block)
+        offset += len(block)
+
+    for name, encoding in spec:
+        add(name, columns[name], encoding)
+    for name, values in _rollups(kind, columns["timestamp"], columns).items():
+        encoding = "ts" if name == "r_timestamp" else "count" if name == "r_count" else "fixed"
+        add(name, values, encoding)
+
+    header = json.dumps({
+        "kind": kind,
+        "rows": len(rows),
+        "rollup_rows": len(set(ts - ts % ROLLUP_SECONDS for ts in columns["timestamp"])),
+        "min_ts": columns["timestamp"][0] if rows else None,
+        "max_ts": columns["timestamp"][-1] if rows else None,
+        "columns": meta,
+    }).encode("utf-8")
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        for block in blocks:
+            f.write(block)
+    _cache.evict(path)
+    os.replace(tmp, path)
+
+
+class Chunk:
+    """
+    One chunk file, memory-mapped (or read into memory with mapped=False);
+    columns are decompressed on first use
+    """
+
+    def __init__(self, path, mapped=USE_MMAP):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if mapped else f.read()
+        if self._mm[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not an archive chunk")
+        header_len = struct.unpack("<I", self._mm[len(MAGIC):len(MAGIC) + 4])[0]
+        start = len(MAGIC) + 4
+        self.header = json.loads(self._mm[start:start + header_len])
+        self._data_start = start + header_len
+        self._columns = {}
+        self._lock = threading.Lock()
+
+    def column(self, name):
+        with self._lock:
+            if name not in self._columns:
+                meta = self.header["columns"][name]
+                begin = self._data_start + meta["offset"]
+                self._columns[name] = _decode(self._mm[begin:begin + meta["length"]], meta)
+            return self._columns[name]
+
+    def rows(self, names):
+        columns = [self.column(n) for n in names]
+        return [dict(zip(names, values)) for values in zip(*columns)]
+
+    def close(self):
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+
+
+class _ChunkCache:
+    """
+    LRU of open chunks, keyed by path and invalidated when the file changes.
+    Dropped chunks are not closed: a query may still be reading one, so its
+    mmap is released by the garbage collector once the last reader is done.
+    """
+
+    def __init__(self, size=256):
+        self.size = size
+        self._chunks = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path):
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._chunks.get(path)
+            if entry and entry[0] == key:
+                self._chunks.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+        chunk = Chunk(path)
+        with self._lock:
+            self.misses += 1
+            self._chunks.pop(path, None)
+            self._chunks[path] = (key, chunk)
+            while len(self._chunks) > self.size:
+                self._chunks.popitem(last=False)
+        return chunk
+
+    def evict(self, path):
+        with self._lock:
+            self._chunks.pop(path, None)
+
+
+_cache = _ChunkCache()
+
+
+# =============================
+# ARCHIVE
+# =============================
+def _day(epoch):
+    return _from_epoch(epoch).strftime("%Y-%m-%d")
+
+
+def bucket_rows(rows, resolution, numeric):
+    """Average raw rows into `resolution`-second buckets (with min/max), like the rollups"""
+    buckets = collections.OrderedDict()
+    for row in rows:
+        ts = _to_epoch(row["timestamp"]) if not isinstance(row["timestamp"], int) else row["timestamp"]
+        bucket = buckets.setdefault(ts - ts % resolution, {"count": 0, **{c: [] for c in numeric}})
+        bucket["count"] += 1
+        for c in numeric:
+            value = _number(row.get(c))
+            if value is not None:
+                bucket[c].append(value)
+    out = []
+    for start, bucket in buckets.items():
+        row = {"timestamp": _from_epoch(start), "count": bucket["count"]}
+        for c in numeric:
+            values = bucket[c]
+            row[c] = round(sum(values) / len(values), 2) if values else None
+            row[f"{c}_min"] = min(values) if values else None
+            row[f"{c}_max"] = max(values) if values else None
+        out.append(row)
+    return out
+
+
+def _as_rollup(row, numeric):
+    """A raw row as a one-reading rollup row, so it merges with the rollups"""
+    rollup = {"r_timestamp": row["timestamp"], "r_count": 1}
+    for c in numeric:
+        value = _number(row.get(c))
+        rollup[f"r_{c}_min"] = rollup[f"r_{c}_avg"] = rollup[f"r_{c}_max"] = value
+    return rollup
+
+
+def _merge_rollups(rollups, resolution, numeric):
+    """Combine 5-minute rollup rows into coarser buckets"""
+    buckets = collections.OrderedDict()
+    for r in rollups:
+        start = r["r_timestamp"] - r["r_timestamp"] % resolution
+        bucket = buckets.setdefault(start, {"count": 0, **{c: [0.0, 0, None, None] for c in numeric}})
+        bucket["count"] += r["r_count"]
+        for c in numeric:
+            avg = r[f"r_{c}_avg"]
+            if avg is None:
+                continue
+            acc = bucket[c]
+            acc[0] += avg * r["r_count"]
+            acc[1] += r["r_count"]
+            acc[2] = r[f"r_{c}_min"] if acc[2] is None else min(acc[2], r[f"r_{c}_min"])
+            acc[3] = r[f"r_{c}_max"] if acc[3] is None else max(acc[3], r[f"r_{c}_max"])
+    out = []
+    for start, bucket in buckets.items():
+        row = {"timestamp": _from_epoch(start), "count": bucket["count"]}
+        for c in numeric:
+            total, n, low, high = bucket[c]
+            row[c] = round(total / n, 2) if n else None
+            row[f"{c}_min"] = low
+            row[f"{c}_max"] = high
+        out.append(row)
+    return out
+
+
+class VitalsArchive:
+    def __init__(self, root=ARCHIVE_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        self.stats = {"chunks_written": 0, "rows_archived": 0, "queries": 0}
+
+    # ---- paths and manifest
+    def _dir(self, kind, patient_id=None):
+        return os.path.join(self.root, "vitals", str(patient_id)) if kind == "vitals" else os.path.join(self.root, "env")
+
+    def _path(self, kind, day, patient_id=None):
+        return os.path.join(self._dir(kind, patient_id), f"{day}.hgc")
+
+    def _manifest_path(self):
+        return os.path.join(self.root, "manifest.json")
+
+    def _manifest(self):
+        try:
+            with open(self._manifest_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def horizon(self, kind):
+        """Every row of `kind` older than this is in the archive (None: nothing archived)"""
+        value = self._manifest().get(kind)
+        return datetime.fromisoformat(value) if value else None
+
+    def _write_lock(self):
+        # Read-merge-replace of day files and the manifest, across worker processes
+        os.makedirs(self.root, exist_ok=True)
+        return file_lock(os.path.join(self.root, ".write.lock"))
+
+    def set_horizon(self, kind, moment):
+        with self._lock, self._write_lock():
+            manifest = self._manifest()
+            current = manifest.get(kind)
+            if current is None or datetime.fromisoformat(current) < moment:
+                manifest[kind] = moment.isoformat(sep=" ")
+                tmp = self._manifest_path() + ".tmp"
+                with open(tmp, "w") as f:
+                    json.dump(manifest, f)
+                os.replace(tmp, self._manifest_path())
+
+    def _days(self, kind, patient_id, start, end):
+        """Chunk paths whose day overlaps [start, end), oldest first"""
+        directory = self._dir(kind, patient_id)
+        if not os.path.isdir(directory):
+            return []
+        first, last = start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+        days = sorted(f[:-4] for f in os.listdir(directory) if f.endswith(".hgc"))
+        return [os.path.join(directory, f"{d}.hgc") for d in days if first <= d <= last]
+
+    # ---- writing
+    def write(self, kind, rows, patient_id=None):
+        """
+        Add rows (dicts with a datetime/str 'timestamp') to the day chunks.
+        Rows already archived are skipped, so re-running an export is safe.
+        """
+        spec = VITALS_COLUMNS if kind == "vitals" else ENV_COLUMNS
+        names = [name for name, _ in spec]
+        fixed = [name for name, encoding in spec if encoding == "fixed"]
+        by_day = collections.defaultdict(list)
+        for row in rows:
+            row = dict(row, timestamp=_to_epoch(row["timestamp"]))
+            # As stored, so re-exported rows compare equal to archived ones
+            for name in fixed:
+                value = _number(row.get(name))
+                row[name] = None if value is None else round(value, 2)
+            by_day[_day(row["timestamp"])].append(row)
+
+        written = 0
+        with self._lock, self._write_lock():
+            for day, day_rows in by_day.items():
+                path = self._path(kind, day, patient_id)
+                if os.path.exists(path):
+                    # A plain read, closed before the replace below; a cached
+                    # mapping would make os.replace fail on Windows
+                    day_rows = Chunk(path, mapped=False).rows(names) + day_rows
+                unique = {}
+                for row in day_rows:
+                    unique.setdefault(tuple(row.get(n) for n in names), row)
+                merged = sorted(unique.values(), key=lambda r: r["timestamp"])
+                write_chunk(path, kind, merged)
+                written += len(merged)
+                self.stats["chunks_written"] += 1
+        self.stats["rows_archived"] += sum(len(v) for v in by_day.values())
+        return written
+
+    def write_table_rows(self, table, rows):
+        """Rows straight from vitals_log / environmental_log (vitals rows carry patient_id)"""
+        kind = TABLES[table]
+        if kind == "env":
+            return self.write("env", rows)
+        by_patient = collections.defaultdict(list)
+        for row in rows:
+            by_patient[row["patient_id"]].append(row)
+        return sum(self.write("vitals", patient_rows, pid) for pid, patient_rows in by_patient.items())
+
+    # ---- reading
+    def query(self, kind, start, end, patient_id=None, resolution=None):
+        """
+        Rows in [start, end), oldest first. With a resolution that is a multiple
+        of ROLLUP_SECONDS the 5-minute rollups are merged instead of reading raw
+        rows; partial 5-minute buckets at either edge are read raw.
+        """
+        self.stats["queries"] += 1
+        numeric = NUMERIC[kind]
+        start_ts, end_ts = _to_epoch(start), _to_epoch(end)
+        names = [name for name, _ in (VITALS_COLUMNS if kind == "vitals" else ENV_COLUMNS)]
+
+        if resolution and resolution % ROLLUP_SECONDS == 0:
+            inner_start = start_ts + (-start_ts) % ROLLUP_SECONDS
+            inner_end = end_ts - end_ts % ROLLUP_SECONDS
+            if inner_start < inner_end:
+                rollup_names = ["r_timestamp", "r_count"] + [f"r_{c}_{s}" for c in numeric
+                                                             for s in ("min", "avg", "max")]
+                rollups = self._scan(kind, patient_id, inner_start, inner_end, rollup_names)
+                edges = (self._scan(kind, patient_id, start_ts, inner_start, names) +
+                         self._scan(kind, patient_id, inner_end, end_ts, names))
+                rollups += [_as_rollup(row, numeric) for row in edges]
+                rollups.sort(key=lambda r: r["r_timestamp"])
+                return _merge_rollups(rollups, resolution, numeric)
+
+        out = self._scan(kind, patient_id, start_ts, end_ts, names)
+        for row in out:
+            row["timestamp"] = _from_epoch(row["timestamp"])
+        if resolution:
+            return bucket_rows(out, resolution, numeric)
+        return out
+
+    def _scan(self, kind, patient_id, start_ts, end_ts, names):
+        """Rows of the given columns with names[0] (a timestamp) in [start_ts, end_ts)"""
+        if start_ts >= end_ts:
+            return []
+        out = []
+        ts_name = names[0]
+        for path in self._days(kind, patient_id, _from_epoch(start_ts), _from_epoch(end_ts)):
+            chunk = _cache.get(path)
+            header = chunk.header
+            if header["max_ts"] is None or header["max_ts"] < start_ts or header["min_ts"] >= end_ts:
+                continue
+            for row in chunk.rows(names):
+                if start_ts <= row[ts_name] < end_ts:
+                    out.append(row)
+        return out
+
+    def latest(self, kind, limit, before, patient_id=None):
+        """Newest `limit` rows older than `before`, oldest first"""
+        directory = self._dir(kind, patient_id)
+        if not os.path.isdir(directory) or limit <= 0:
+            return []
+        before_ts = _to_epoch(before)
+        names = [name for name, _ in (VITALS_COLUMNS if kind == "vitals" else ENV_COLUMNS)]
+        collected = []
+        for day in sorted((f[:-4] for f in os.listdir(directory) if f.endswith(".hgc")), reverse=True):
+            if day > before.strftime("%Y-%m-%d"):
+                continue
+            rows = [r for r in _cache.get(os.path.join(directory, f"{day}.hgc")).rows(names) if r["timestamp"] < before_ts]
+            collected = rows[-(limit - len(collected)):] + collected
+            if len(collected) >= limit:
+                break
+        for row in collected:
+            row["timestamp"] = _from_epoch(row["timestamp"])
+        return collected
+
+    def get_stats(self):
+        files = size = 0
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith(".hgc"):
+                    files += 1
+                    size += os.path.getsize(os.path.join(directory, name))
+        manifest = self._manifest()
+        return dict(self.stats, root=self.root, chunk_files=files, bytes=size,
+                    horizon=manifest, cache_hits=_cache.hits, cache_misses=_cache.misses)
+
+
+archive = VitalsArchive()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and query the columnar vitals archive")
+    parser.add_argument("--stats", action="store_true")
+    parser.add_argument("--vitals", type=int, metavar="PATIENT_ID", help="Query a patient's vitals")
+    parser.add_argument("--env", action="store_true", help="Query environment readings")
+    parser.add_argument("--start", help="YYYY-MM-DD")
+    parser.add_argument("--end", help="YYYY-MM-DD (exclusive)")
+    parser.add_argument("--resolution", type=int, help="Bucket size in seconds")
+    args = parser.parse_args()
+
+    if args.stats or (args.vitals is None and not args.env):
+        print(json.dumps(archive.get_stats(), indent=2))
+        return
+
+    start = datetime.fromisoformat(args.start) if args.start else datetime.now() - timedelta(days=30)
+    end = datetime.fromisoformat(args.end) if args.end else datetime.now()
+    began = time.perf_counter()
+    if args.env:
+        rows = archive.query("env", start, end, resolution=args.resolution)
+    else:
+        rows = archive.query("vitals", start, end, patient_id=args.vitals, resolution=args.resolution)
+    elapsed = (time.perf_counter() - began) * 1000
+    for row in rows[:5]:
+        print(row)
+    if len(rows) > 5:
+        print(f"... {len(rows) - 5} more")
+    print(f"⏱️ {len(rows)} rows in {elapsed:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,73 @@
-from twilio.rest import Client
+import threading
 import time
+from datetime import datetime
+
+from twilio.rest import Client
+from twilio.http.http_client import TwilioHttpClient
+
+from circuit_breaker import CircuitOpenError, Spool, get_breaker
 
 class WhatsAppAgent:
-    def __init__(self, sid, token, from_number, to_number):
-        self.client = Client(sid, token)
+    def __init__(self, sid, token, from_number, to_number, client=None, timeout=10,
+                 breaker=None, spool_path="whatsapp_spool.jsonl", drain_interval=10.0):
+        # client: inject a stand-in (see standins.FakeTwilioClient) for tests
+        self.client = client or Client(sid, token, http_client=TwilioHttpClient(timeout=timeout))
         self.from_number = from_number
         self.to_number = to_number
-        self.last_sent_time = 0
+        self.breaker = breaker or get_breaker("twilio")
+        # Alerts raised while Twilio is down, sent once it answers again
+        self.spool = Spool(spool_path)
+        # Nothing else may get through during an outage, so retry the spool on
+        # a timer rather than only after the next successful send
+        self.drain_interval = drain_interval
+        if drain_interval:
+            threading.Thread(target=self._drain_loop, name="whatsapp-spool", daemon=True).start()
 
-    def send_alert(self, message):
-        # Enforce 30-second cooldown
-        current_time = time.time()
-        if current_time - self.last_sent_time < 30:
-            print(f"⏳ WhatsApp: Cooldown active. Skipping alert to prevent spam.")
-            return False
+    def _create(self, message, to):
+        return self.breaker.call(
+            self.client.messages.create,
+            body=message,
+            from_=self.from_number,
+            to=to
+        )
 
-        print(f"📡 WhatsApp: Attempting to send alert from {self.from_number} to {self.to_number}...")
+    def send_alert(self, message, to=None):
+        # Cooldown and de-duplication are handled by AlertDispatcher
+        to = to or self.to_number
+        print(f"📡 WhatsApp: Attempting to send alert from {self.from_number} to {to}...")
         try:
-            msg = self.client.messages.create(
-                body=message,
-                from_=self.from_number,
-                to=self.to_number
-            )
-            print(f"✅ WhatsApp: Message sent! SID: {msg.sid}")
-            self.last_sent_time = current_time
-            return True
+            msg = self._create(message, to)
+        except CircuitOpenError as e:
+            # Fail fast and keep the alert for later instead of waiting on Twilio
+            print(f"⏸️ WhatsApp: {e}; alert spooled")
+            self.breaker.record_fallback()
+            return self.spool.append({"to": to, "body": message, "ts": time.time()})
         except Exception as e:
             print(f"❌ WhatsApp: Send Error: {e}")
             return False
 
+        print(f"✅ WhatsApp: Message sent! SID: {msg.sid}")
+        if len(self.spool):
+            self.flush_spool()
+        return True
+
+    def flush_spool(self):
+        """Send alerts spooled while the circuit was open, marked as delayed"""
+        def send(record):
+            raised_at = datetime.fromtimestamp(record["ts"]).strftime("%H:%M:%S")
+            self._create(f"⏱️ Delayed alert (raised {raised_at})\n{record['body']}", record["to"])
+
+        sent = self.spool.drain(send)
+        if sent:
+            print(f"📤 WhatsApp: Sent {sent} spooled alerts")
+        return sent
+
+    def _drain_loop(self):
+        while True:
+            time.sleep(self.drain_interval)
+            # Half-open: the first spooled alert is the trial call
+            if len(self.spool) and self.breaker.state != self.breaker.OPEN:
+                try:
+                    self.flush_spool()
+                except Exception as e:
+                    print(f"❌ WhatsApp: Spool flush error: {e}")